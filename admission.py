@@ -0,0 +1,243 @@
+"""
+Защита витрины от всплесков трафика (пост в канале → сотни одинаковых запросов за секунду).
+
+Три aiohttp-middleware, порядок в build_app: метрики → rate_limit → concurrency → coalesce.
+
+  * coalesce — одинаковые GET (тот же путь, query и заголовки, от которых зависит ответ:
+    Accept, Accept-Encoding, If-None-Match, If-Modified-Since), пришедшие, пока первый ещё
+    считается, ждут его результат, а не считают то же самое заново (как _single_flight в
+    img_fetch.py). Только для COALESCE_ROUTES и только для обычных web.Response с байтовым
+    телом; FileResponse/стримы и HTTP-исключения остальные получают, вызвав handler сами.
+  * concurrency — не больше N одновременных запросов к маршруту (/img, /api/order) и не больше
+    N ожидающих; ждать слот можно ADMISSION_WAIT_SEC. Иначе — сразу 503 + Retry-After.
+  * rate_limit — token bucket на IP клиента для тех же маршрутов: 429 + Retry-After.
+
+Состояние — в памяти процесса: при WEB_WORKERS=N фактические лимиты в N раз выше.
+IP клиента — адрес TCP-соединения. За обратным прокси (Railway) задайте PROXY_HOPS=1:
+тогда берётся PROXY_HOPS-й адрес справа в X-Forwarded-For — его дописал наш прокси.
+Без прокси заголовок пишет сам клиент, поэтому по умолчанию ему не верим.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from aiohttp import web
+from multidict import CIMultiDict
+
+import metrics
+
+ADMISSION_WAIT_SEC = float(os.getenv("ADMISSION_WAIT_SEC", "2"))
+PROXY_HOPS = int(os.getenv("PROXY_HOPS", "0"))
+
+IMG_MAX_CONCURRENCY   = int(os.getenv("IMG_MAX_CONCURRENCY", "64"))
+ORDER_MAX_CONCURRENCY = int(os.getenv("ORDER_MAX_CONCURRENCY", "16"))
+
+# токенов в секунду / размер «пачки» на один IP; rate <= 0 (и concurrency <= 0) — без лимита
+IMG_RATE    = float(os.getenv("IMG_RATE", "20"))
+IMG_BURST   = float(os.getenv("IMG_BURST", "150"))   # первый экран: 24 карточки × несколько фото
+# за одним IP мобильного оператора (CGNAT) могут быть сотни покупателей — лимит мягкий,
+# он против скриптов, а не людей; WebApp при 429/503 сам повторяет заказ по Retry-After
+ORDER_RATE  = float(os.getenv("ORDER_RATE", "1"))    # 60 заказов в минуту с адреса
+ORDER_BURST = float(os.getenv("ORDER_BURST", "30"))
+
+# ответы, которые целиком строятся из снимков catalog.py / settings_store.py или БД
+COALESCE_ROUTES = (
+    "/api/config", "/api/bootstrap", "/api/categories", "/api/subcategories",
+    "/api/products", "/api/product/{id}", "/api/search",
+)
+
+# сколько IP помним в token bucket (самые давние вытесняются — у них и так полный бакет)
+MAX_CLIENTS = 10000
+
+_VARY_HEADERS = ("Accept", "Accept-Encoding", "If-None-Match", "If-Modified-Since")
+_DROP_HEADERS = ("Content-Length", "Date", "Server")
+
+
+def route_of(request: web.Request) -> str:
+    resource = request.match_info.route.resource
+    return resource.canonical if resource is not None else "unmatched"
+
+
+def client_ip(request: web.Request, hops: int = PROXY_HOPS) -> str:
+    if hops > 0:
+        forwarded = [p.strip() for p in request.headers.get("X-Forwarded-For", "").split(",") if p.strip()]
+        if forwarded:
+            return forwarded[-min(hops, len(forwarded))]
+    return request.remote or ""
+
+
+def _overloaded(status: int, error: str, retry_after: float) -> web.Response:
+    return web.json_response(
+        {"ok": False, "error": error},
+        status=status,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after))), "Cache-Control": "no-store"},
+    )
+
+
+# ---------- coalesce ----------
+class _Shared:
+    """Копия готового ответа лидера: из неё каждый ожидающий собирает свой web.Response."""
+
+    __slots__ = ("status", "reason", "headers", "body")
+
+    def __init__(self, resp: web.Response):
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = CIMultiDict((k, v) for k, v in resp.headers.items() if k not in _DROP_HEADERS)
+        self.body = bytes(resp.body)
+
+    def response(self) -> web.Response:
+        return web.Response(status=self.status, reason=self.reason, headers=self.headers, body=self.body)
+
+
+def _shareable(resp) -> bool:
+    return type(resp) is web.Response and isinstance(resp.body, (bytes, bytearray))
+
+
+class Coalescer:
+    def __init__(self, routes: Iterable[str] = COALESCE_ROUTES):
+        self.routes = frozenset(routes)
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    @staticmethod
+    async def _lead(handler, request):
+        resp = await handler(request)
+        # снимаем копию до того, как лидер отправит ответ (prepare допишет свои заголовки)
+        return resp, (_Shared(resp) if _shareable(resp) else None)
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.method != "GET":
+            return await handler(request)
+        route = route_of(request)
+        if route not in self.routes:
+            return await handler(request)
+
+        key = (request.path_qs,) + tuple(request.headers.get(h, "") for h in _VARY_HEADERS)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._lead(handler, request))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+            # клиент лидера ушёл — расчёт всё равно нужен остальным
+            resp, _ = await asyncio.shield(task)
+            return resp
+
+        try:
+            _, shared = await asyncio.shield(task)
+        except web.HTTPException:
+            shared = None  # исключение-ответ нельзя отдать дважды — считаем сами
+        if shared is None:
+            return await handler(request)
+        metrics.HTTP_COALESCED.inc(route)
+        return shared.response()
+
+
+# ---------- concurrency ----------
+class RouteLimit:
+    """Не больше limit обработчиков сразу и не больше limit ожидающих слота."""
+
+    def __init__(self, limit: int, max_waiting: Optional[int] = None):
+        self.limit = max(1, limit)
+        self.max_waiting = self.limit if max_waiting is None else max(0, max_waiting)
+        self._sem = asyncio.Semaphore(self.limit)
+        self.waiting = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if not self._sem.locked():
+            await self._sem.acquire()
+            return True
+        if self.waiting >= self.max_waiting:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self) -> None:
+        self._sem.release()
+
+
+def concurrency_middleware(limits: Dict[str, int], wait: float = ADMISSION_WAIT_SEC):
+    # семафоры создаются при первом запросе — уже в event loop приложения
+    gates: Dict[str, RouteLimit] = {}
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        route = route_of(request)
+        limit = limits.get(route)
+        if limit is None:
+            return await handler(request)
+        gate = gates.get(route)
+        if gate is None:
+            gate = gates[route] = RouteLimit(limit)
+        if not await gate.acquire(wait):
+            metrics.ADMISSION_REJECTED.inc(route, "busy")
+            return _overloaded(503, "server busy", wait)
+        try:
+            return await handler(request)
+        finally:
+            gate.release()
+
+    return middleware
+
+
+# ---------- rate limit ----------
+class TokenBucket:
+    """Token bucket на ключ (IP): rate токенов в секунду, не больше burst."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key → [tokens, monotonic]
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """0 — токен выдан, иначе через сколько секунд он появится."""
+        now = time.monotonic() if now is None else now
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = [self.burst, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+        if b[0] >= 1.0:
+            b[0] -= 1.0
+            return 0.0
+        return (1.0 - b[0]) / self.rate
+
+
+def rate_limit_middleware(buckets: Dict[str, TokenBucket]):
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        route = route_of(request)
+        bucket = buckets.get(route)
+        if bucket is not None:
+            wait = bucket.take(client_ip(request))
+            if wait > 0:
+                metrics.ADMISSION_REJECTED.inc(route, "rate_limited")
+                return _overloaded(429, "too many requests", wait)
+        return await handler(request)
+
+    return middleware
+
+
+def middlewares() -> list:
+    """Стек по умолчанию для build_app (после metrics_middleware)."""
+    rates = {"/img": (IMG_RATE, IMG_BURST), "/api/order": (ORDER_RATE, ORDER_BURST)}
+    limits = {"/img": IMG_MAX_CONCURRENCY, "/api/order": ORDER_MAX_CONCURRENCY}
+    return [
+        rate_limit_middleware({r: TokenBucket(rate, burst) for r, (rate, burst) in rates.items() if rate > 0}),
+        concurrency_middleware({r: n for r, n in limits.items() if n > 0}),
+        Coalescer().middleware,
+    ]
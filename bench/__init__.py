@@ -0,0 +1,17 @@
+"""
+Нагрузочный бенчмарк витрины (build_app) — чтобы сравнивать коммиты цифрами:
+
+    python -m bench [--products 10000] [--concurrency 32] [--duration 10] [--out result.json]
+
+Что делает:
+  1. генерирует синтетический каталог (галереи, размеры, категории) во временный DB_PATH
+     через обычный seed_from_csv — тот же путь импорта, что и у /sync;
+  2. поднимает локальный HTTP-сервер с картинками вместо vk/Drive/GitHub;
+  3. запускает build_app() в этом же процессе (бот — заглушка: токен фиктивный,
+     outbox «отправляет» в никуда);
+  4. гоняет конкурентную нагрузку по сценариям /api/bootstrap, /api/categories, /api/products,
+     /api/order, /img и печатает JSON: rps и p50/p95/p99 по каждому сценарию.
+
+Клиент и сервер делят один event loop, поэтому абсолютные цифры ниже, чем у
+отдельного инстанса, — бенчмарк для сравнения «до/после» на одной машине.
+"""
@@ -0,0 +1,270 @@
+"""
+python -m bench — см. bench/__init__.py.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import os.path as op
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from aiohttp import ClientSession, TCPConnector, web
+
+from bench.synth import ImageHost, write_catalog_csv
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+SCENARIOS = ("bootstrap", "categories", "products", "order", "img")
+
+PAGE_SIZE = 24  # как PAGE_SIZE / CARD_FIELDS в web/app.js
+CARD_FIELDS = "id,title,category,price,image_url,images_urls,sizes_text,has_description"
+THUMB_WIDTHS = (320, 480, 640)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank: значение, не меньше которого p% наблюдений."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "requests": len(lat),
+        "errors": errors,
+        "rps": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(lat, 50)),
+        "p95_ms": ms(percentile(lat, 95)),
+        "p99_ms": ms(percentile(lat, 99)),
+        "max_ms": ms(lat[-1]) if lat else 0.0,
+    }
+
+
+class Load:
+    """Сценарии запросов (как их делает WebApp) и замер задержек."""
+
+    def __init__(self, session: ClientSession, base: str, categories: List[str],
+                 product_ids: List[int], hot_images: List[str], seed: int):
+        self.session = session
+        self.base = base
+        self.category_names = categories
+        self.product_ids = product_ids
+        self.hot_images = hot_images
+        self.rnd = random.Random(seed)
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    async def _get(self, path: str, parse: bool = False, **kw) -> dict:
+        started = time.perf_counter()
+        try:
+            async with self.session.get(self.base + path, **kw) as resp:
+                body = await resp.read()
+                ok = resp.status == 200
+        except Exception:
+            body, ok = b"", False
+        self._record(started, ok)
+        return json.loads(body) if ok and parse else {}
+
+    def _record(self, started: float, ok: bool) -> None:
+        if ok:
+            self.latencies.append(time.perf_counter() - started)
+        else:
+            self.errors += 1
+
+    async def bootstrap(self) -> None:
+        await self._get("/api/bootstrap", params={"limit": str(PAGE_SIZE), "fields": CARD_FIELDS})
+
+    async def categories(self) -> None:
+        await self._get("/api/categories")
+
+    async def products(self) -> None:
+        cat = self.rnd.choice(self.category_names)
+        params = {"category": cat, "limit": str(PAGE_SIZE), "fields": CARD_FIELDS}
+        page = await self._get("/api/products", parse=True, params=params)
+        # часть пользователей листает дальше
+        if page.get("next_cursor") and self.rnd.random() < 0.3:
+            await self._get("/api/products", params={**params, "cursor": page["next_cursor"]})
+
+    async def order(self) -> None:
+        items = [
+            {"product_id": pid, "qty": self.rnd.randint(1, 2), "size": "M"}
+            for pid in self.rnd.sample(self.product_ids, self.rnd.randint(1, 3))
+        ]
+        data = {
+            "full_name": "Бенч Бенчев", "phone": "+70000000000", "address": "Москва",
+            "comment": "", "telegram": "@bench", "items": items,
+        }
+        started = time.perf_counter()
+        try:
+            async with self.session.post(self.base + "/api/order", json=data) as resp:
+                await resp.read()
+                ok = resp.status == 200
+        except Exception:
+            ok = False
+        self._record(started, ok)
+
+    async def img(self) -> None:
+        params = {"u": self.rnd.choice(self.hot_images), "w": str(self.rnd.choice(THUMB_WIDTHS)), "fmt": "auto"}
+        await self._get("/img", params=params, headers={"Accept": "image/webp,image/*"})
+
+
+async def run_scenario(name: str, make_load, concurrency: int, duration: float, warmup: float) -> dict:
+    if warmup > 0:
+        await _drive(name, make_load, concurrency, warmup)
+    loads, elapsed = await _drive(name, make_load, concurrency, duration)
+    latencies = [v for ld in loads for v in ld.latencies]
+    return summarize(latencies, sum(ld.errors for ld in loads), elapsed)
+
+
+async def _drive(name: str, make_load, concurrency: int, duration: float):
+    loads = [make_load(i) for i in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    async def worker(ld: Load):
+        step = getattr(ld, name)
+        while time.perf_counter() < deadline:
+            await step()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(ld) for ld in loads))
+    return loads, time.perf_counter() - started
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+async def bench(args, workdir: str) -> dict:
+    # модули магазина читают DB_PATH/BOT_TOKEN при импорте — импортируем после настройки окружения
+    import bot as shop
+    import db
+    import seed_from_csv
+
+    host = ImageHost(latency_ms=args.img_latency_ms)
+    image_base = await host.start()
+
+    csv_path = op.join(workdir, "catalog.csv")
+    write_catalog_csv(csv_path, args.products, image_base, seed=args.seed)
+    started = time.perf_counter()
+    await asyncio.to_thread(seed_from_csv.seed_from_csv, csv_path, True)
+    import_s = time.perf_counter() - started
+
+    with db.connect() as conn:
+        rows = conn.execute(
+            "SELECT id, category, images_urls FROM products WHERE is_active = 1 ORDER BY id"
+        ).fetchall()
+    product_ids = [r[0] for r in rows]
+    categories = sorted({r[1] for r in rows if r[1]})
+    hot = random.Random(args.seed).sample(rows, min(args.img_hot, len(rows)))
+    hot_images = [u for r in hot for u in (r[2] or "").split("|") if u]
+
+    # бот-заглушка: уведомления о заказах уходят в outbox и «доставляются» в никуда
+    async def fake_send(chat_id: int, text: str):
+        return None
+    shop.outbox_dispatcher.send = fake_send
+
+    app = shop.build_app()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    await web.SockSite(runner, sock).start()
+    base = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    delivery = asyncio.create_task(shop.outbox_dispatcher.run())
+
+    results: Dict[str, dict] = {}
+    try:
+        connector = TCPConnector(limit=args.concurrency, force_close=False)
+        async with ClientSession(connector=connector) as session:
+            for name in args.scenarios:
+                make_load = lambda i: Load(session, base, categories, product_ids, hot_images, args.seed + i)
+                results[name] = await run_scenario(name, make_load, args.concurrency, args.duration, args.warmup)
+                print(f"{name:>10}: {json.dumps(results[name], ensure_ascii=False)}", file=sys.stderr)
+    finally:
+        delivery.cancel()
+        await runner.cleanup()
+        await host.stop()
+        await shop.bot.session.close()
+
+    return {
+        "commit": _git_commit(),
+        "started_at": int(time.time()),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "products": args.products,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "img_hot": args.img_hot,
+            "img_latency_ms": args.img_latency_ms,
+            "seed": args.seed,
+        },
+        "import_s": round(import_s, 3),
+        "active_products": len(product_ids),
+        "image_host_requests": host.requests,
+        "results": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test build_app() on a synthetic catalog.")
+    ap.add_argument("--products", type=int, default=10000, help="Catalog size (default: 10000)")
+    ap.add_argument("--concurrency", type=int, default=32, help="Concurrent clients (default: 32)")
+    ap.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario (default: 10)")
+    ap.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds per scenario (default: 2)")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS),
+                    help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    ap.add_argument("--img-hot", type=int, default=100, help="Products whose images /img is hit with")
+    ap.add_argument("--img-latency-ms", type=float, default=20.0, help="Image host response delay")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="Also write the JSON report to this file")
+    ap.add_argument("--keep", action="store_true", help="Keep the temporary DB and image cache")
+    args = ap.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="shop-bench-")
+    os.environ["DB_PATH"] = op.join(workdir, "bench.sqlite")
+    os.environ["IMG_CACHE_DIR"] = op.join(workdir, "img_cache")
+    os.environ["BOT_TOKEN"] = "123456:BENCHMARK"  # бот не ходит в Telegram
+    # вся нагрузка идёт с одного адреса — лимиты на IP (admission.py) мерили бы сами себя
+    os.environ["IMG_RATE"] = os.environ["ORDER_RATE"] = "0"
+    os.chdir(ROOT)  # build_app берёт web/ и images/ относительно корня
+    sys.path.insert(0, ROOT)
+
+    try:
+        report = asyncio.run(bench(args, workdir))
+    finally:
+        if args.keep:
+            print(f"workdir kept: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Синтетические данные для бенчмарка: CSV каталога и HTTP-сервер картинок.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import random
+import socket
+
+from aiohttp import web
+
+import thumbs
+
+CATEGORIES = {
+    "Футболки": ["Oversize", "Базовые", "С принтом"],
+    "Худи/Свитшоты": ["Худи", "Свитшоты", "Зип-худи"],
+    "Брюки/Джинсы": ["Джинсы", "Карго", "Спортивные"],
+    "Куртки": ["Ветровки", "Пуховики", ""],
+    "Обувь": ["Кроссовки", "Ботинки", ""],
+    "Сумки/Рюкзаки": [""],
+    "Аксессуары": ["Кепки", "Шапки", "Ремни", ""],
+}
+WORDS = (
+    "оверсайз базовый винтажный чёрный белый серый бежевый хаки графит молочный "
+    "gorpcore streetwear essential heavy washed cropped relaxed nylon fleece denim"
+).split()
+CLOTHES_SIZES = ("XS,S,M,L,XL", "S,M,L", "M,L,XL,XXL", "ONE SIZE")
+SHOE_SIZES = ("39,40,41,42,43,44", "40,41,42,43", "36,37,38,39,40")
+
+IMAGE_SIZE = (1200, 1600)  # как у фото с телефона в vk после пережатия
+IMAGE_VARIANTS = 16        # разных тел картинок (имена разные, тела повторяются)
+
+
+def _title(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).capitalize() + f" #{n}"
+
+
+def write_catalog_csv(path: str, products: int, image_base: str, seed: int = 1) -> None:
+    """CSV в формате таблицы магазина: products строк, у каждой галерея из 1–6 фото."""
+    rnd = random.Random(seed)
+    cats = list(CATEGORIES)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["title", "category", "subcategory", "price", "image_url",
+                    "images_urls", "sizes_text", "is_active", "description"])
+        w.writerow(["__LOGO__", "", "", "", f"{image_base}/logo.png", "", "", "", ""])
+        for n in range(1, products + 1):
+            cat = rnd.choice(cats)
+            gallery = [f"{image_base}/p/{n}_{k}.jpg" for k in range(rnd.randint(1, 6))]
+            sizes = rnd.choice(SHOE_SIZES if cat == "Обувь" else CLOTHES_SIZES)
+            w.writerow([
+                _title(rnd, n),
+                cat,
+                rnd.choice(CATEGORIES[cat]),
+                rnd.randrange(900, 25000, 100),
+                gallery[0],
+                "|".join(gallery),
+                sizes,
+                1 if rnd.random() > 0.03 else 0,
+                " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(0, 60))),
+            ])
+
+
+def _make_image(i: int) -> bytes:
+    if not thumbs.available():
+        # без Pillow /img всё равно проверяет закачку и кэш — тело просто не картинка
+        return hashlib.sha256(str(i).encode()).digest() * 4096
+    rnd = random.Random(i)
+    im = thumbs.Image.effect_noise(IMAGE_SIZE, 40 + i).convert("RGB")
+    tint = thumbs.Image.new("RGB", IMAGE_SIZE, tuple(rnd.randrange(256) for _ in range(3)))
+    im = thumbs.Image.blend(im, tint, 0.6)
+    buf = io.BytesIO()
+    im.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+class ImageHost:
+    """Локальная замена хостингам картинок: /p/<что угодно>.jpg, с задержкой latency_ms."""
+
+    def __init__(self, latency_ms: float = 20.0):
+        self.latency = latency_ms / 1000.0
+        self.bodies = [_make_image(i) for i in range(IMAGE_VARIANTS)]
+        self.requests = 0
+        self._runner = None
+        self.base_url = ""
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        name = request.match_info["name"]
+        body = self.bodies[int(hashlib.md5(name.encode()).hexdigest(), 16) % len(self.bodies)]
+        return web.Response(body=body, content_type="image/jpeg")
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/p/{name}", self._handle)
+        app.router.add_get("/{name}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))  # свободный порт — адрес нужен ещё до генерации CSV
+        await web.SockSite(self._runner, sock).start()
+        port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
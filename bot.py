@@ -1,4 +1,4 @@
-import asyncio, json, logging, os, os.path as op, sqlite3
+import argparse, asyncio, hmac, html, json, logging, os, os.path as op, re, sqlite3, time
 from typing import Optional
 
 from aiogram import Bot, Dispatcher, F
@@ -14,13 +14,30 @@ from aiogram.client.default import DefaultBotProperties
 from aiohttp import web, ClientSession
 from dotenv import load_dotenv
 
-from db import get_categories, get_subcategories, get_products, get_product, create_order
-
-# ✅ попробуем импортировать функцию импорта (как в PLACE-shop)
+import admission
+import catalog
+import db
+import db_async
+import metrics
+import migrations
+import settings_store
+import static_assets
+import thumbs
+import webhook
+import workers
+from db_async import get_products_by_ids, create_order
+from http_cache import Payload, respond
+from img_cache import DiskCache
+from img_fetch import ImageFetcher, make_session
+from optimize_media import MediaIndex
+from outbox import OutboxDispatcher
+from sync_jobs import SYNC_INTERVAL_MIN, SyncRunner
+
+# ✅ попробуем импортировать синк (как в PLACE-shop)
 try:
-    from seed_from_csv import seed_from_csv  # expected: seed_from_csv(csv_file: str, clear: bool=False)
+    import sync_from_google as sheet_sync  # expected: sheet_sync.sync(clear_products: bool=False, url: str=None) -> dict
 except Exception:
-    seed_from_csv = None
+    sheet_sync = None
 
 load_dotenv()
 
@@ -63,6 +80,14 @@ else:
     if WEBAPP_URL.endswith("/web"):
         WEBAPP_URL = WEBAPP_URL + "/"
 
+# ✅ webhook вместо long polling (опционально): BOT_UPDATES=webhook + WEBHOOK_SECRET;
+#    WEBHOOK_BASE_URL — публичный https-адрес витрины (по умолчанию домен из WEBAPP_URL)
+BOT_UPDATES      = os.getenv("BOT_UPDATES", "polling").strip().lower()
+USE_WEBHOOK      = BOT_UPDATES == "webhook"
+WEBHOOK_SECRET   = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBHOOK_BASE_URL = (os.getenv("WEBHOOK_BASE_URL", "").strip() or re.sub(r"/web/?$", "", WEBAPP_URL)).rstrip("/")
+
+# текст можно переопределить в settings (ключ thankyou_text) — без перезапуска
 THANKYOU_TEXT = "Спасибо за заказ! В скором времени с Вами свяжется менеджер и пришлет реквизиты для оплаты!"
 
 logging.basicConfig(level=logging.INFO)
@@ -70,108 +95,218 @@ bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
 dp  = Dispatcher()
 
 # ---- helpers ----
-def _get_setting(key: str, default: Optional[str] = None) -> Optional[str]:
-    """Читает settings.value по ключу; если таблицы/ключа нет — вернёт default."""
-    try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.execute("SELECT value FROM settings WHERE key=?", (key,))
-            row = cur.fetchone()
-            return row[0] if row and row[0] is not None else default
-    except Exception:
-        return default
-
 def _is_admin(user_id: int) -> bool:
     return (user_id in set(ADMIN_CHAT_IDS))
 
-async def _download_csv(url: str, dest_path: str) -> None:
-    async with ClientSession() as sess:
-        async with sess.get(url) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                raise RuntimeError(f"CSV fetch failed: HTTP {resp.status}: {text[:200]}")
-            data = await resp.read()
-    os.makedirs(op.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
-        f.write(data)
-
-async def sync_from_google(clear_products: bool = False) -> str:
+def _sheet_sync_job(clear_products: bool = False, progress=None):
     """
-    Скачивает CSV из Google Sheets и импортирует товары в БД.
+    Скачивает CSV из Google Sheets и импортирует товары в БД (общий путь — sync_from_google.sync:
+    потоковая закачка, условный запрос, пропуск импорта при том же SHA-256).
     clear_products=False — НЕ трогает заказы/настройки, обновляет только товары (как в PLACE-shop).
+    ✅ Блокирующая: выполняется в рабочем потоке SyncRunner, не в event loop.
+    Возвращает (текст для админа, dict результата или None).
     """
     if not GOOGLE_SHEET_CSV_URL:
         raise RuntimeError("GOOGLE_SHEET_CSV_URL не задан в Railway Variables")
 
-    tmp_csv = "/tmp/products_sheet.csv"
-    await _download_csv(GOOGLE_SHEET_CSV_URL, tmp_csv)
-
-    if seed_from_csv is None:
-        # fallback: запустить как скрипт (если импорт функции не сработал)
+    if sheet_sync is None:
+        # fallback: запустить как скрипт (если импорт модуля не сработал)
         import sys, subprocess
-        cmd = [sys.executable, "seed_from_csv.py", "--csv", tmp_csv]
+        cmd = [sys.executable, "sync_from_google.py"]
         if clear_products:
             cmd.append("--clear")
         p = subprocess.run(cmd, capture_output=True, text=True)
         if p.returncode != 0:
             raise RuntimeError((p.stderr or p.stdout or "").strip()[:4000])
-        return f"✅ Синк выполнен (script). {(p.stdout or '').strip()}"
-    else:
-        # основной путь — импорт функции
-        seed_from_csv(tmp_csv, clear=clear_products)
-        return "✅ Товары обновлены из Google Sheets."
+        return f"✅ Синк выполнен (script). {(p.stdout or '').strip()}", None
+
+    # основной путь — импорт функции
+    res = sheet_sync.sync(clear_products, GOOGLE_SHEET_CSV_URL, progress=progress)
+    return sheet_sync.format_result(res), res
+
+# один синк на процесс; расписание — SYNC_INTERVAL_MIN (см. sync_jobs.py)
+sync_runner = SyncRunner(_sheet_sync_job)
 
 # ---------- Web ----------
+# web/*.js|css с хэшем в имени и готовым сжатием (см. static_assets.py), собирается в build_app
+STATIC = web.AppKey("static", static_assets.StaticBundle)
+
 async def index_handler(request):
-    return web.FileResponse(op.join("web", "index.html"))
+    index = request.app[STATIC].index
+    if index is None:
+        return web.FileResponse(op.join("web", "index.html"))
+    return respond(request, index, cache_control=static_assets.INDEX_CACHE_CONTROL)
 
 async def file_handler(request):
     path = request.match_info.get("path", "")
-    if not path:
-        return web.FileResponse(op.join("web", "index.html"))
+    if not path or path == "index.html":
+        return await index_handler(request)
+    hit = request.app[STATIC].lookup(path)
+    if hit is not None:
+        payload, cache_control = hit
+        return respond(request, payload, cache_control=cache_control)
     p = op.join("web", path)
     if not op.isfile(p):
         return web.Response(status=404, text="Not found")
     return web.FileResponse(p)
 
-async def api_config(request):
-    logo_url   = _get_setting("logo_url", "")
-    video_url  = _get_setting("hero_video_url", "")
+# /api/config собирается один раз на снимок настроек (и сжимается тоже один раз)
+_config_payload: Optional[Payload] = None
+_config_settings: Optional[settings_store.Settings] = None
+
+async def _config_json(request) -> Payload:
+    global _config_payload, _config_settings
+    settings = await settings_store.aget()
+    if settings is _config_settings and _config_payload is not None:
+        return _config_payload
+
+    logo_url   = settings.get("logo_url")
+    video_url  = settings.get("hero_video_url")
     hero_url   = video_url or logo_url
     hero_type  = "video" if video_url else ("image" if logo_url else "")
 
-    return web.json_response({
+    # постер для локального hero-видео — из optimize_media.py (кадр появляется до загрузки mp4)
+    video_poster = ""
+    if video_url.startswith("/images/"):
+        entry = request.app[MEDIA].video(video_url[len("/images/"):].split("?", 1)[0])
+        if entry and entry.get("poster"):
+            video_poster = "/images/" + entry["poster"]
+
+    raw = json.dumps({
         "title": STORE_TITLE,
         "logo_url": logo_url,
         "video_url": video_url,
+        "video_poster": video_poster,
         "hero_url": hero_url,
         "hero_type": hero_type,
-    })
+    }).encode("utf-8")
+    if _config_payload is None or _config_payload.raw != raw:
+        _config_payload = Payload(raw)
+    _config_settings = settings
+    return _config_payload
+
+async def api_config(request):
+    return respond(request, await _config_json(request))
+
+# первая страница /api/bootstrap — те же PAGE_SIZE / CARD_FIELDS, что в web/app.js
+BOOTSTRAP_LIMIT  = 24
+BOOTSTRAP_FIELDS = "id,title,category,price,image_url,images_urls,sizes_text,has_description"
 
+async def api_bootstrap(request):
+    """
+    Первый экран WebApp за один запрос: {"config", "categories" (с count), "products"
+    (первая страница всех товаров, {"items", "next_cursor"})}. ?limit=&fields= — как у /api/products.
+    Тело собирается один раз на версию каталога и снимок настроек.
+    """
+    q = request.rel_url.query
+    try:
+        limit = int(q.get("limit") or BOOTSTRAP_LIMIT)
+        if not 1 <= limit <= catalog.MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be 1..{catalog.MAX_PAGE_LIMIT}")
+        fields = catalog.parse_fields(q.get("fields") or BOOTSTRAP_FIELDS)
+    except ValueError as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=400)
+
+    config = await _config_json(request)
+    snap = await catalog.aget_snapshot()
+    return respond(request, snap.bootstrap_json(config, limit, fields))
+
+# тела готовит catalog.Snapshot: ETag/сжатие считаются один раз на версию каталога
 async def api_categories(request):
-    return web.json_response(get_categories())
+    snap = await catalog.aget_snapshot()
+    return respond(request, snap.categories_json)
 
 async def api_subcategories(request):
     cat = request.rel_url.query.get("category")
-    return web.json_response(get_subcategories(cat))
+    snap = await catalog.aget_snapshot()
+    return respond(request, snap.subcategories_json(cat))
 
 async def api_products(request):
-    cat = request.rel_url.query.get("category")
-    sub = request.rel_url.query.get("subcategory")
-    return web.json_response(get_products(cat, sub))
-
-async def api_order(request):
-    data = await request.json()
+    """
+    ?category=&subcategory= — как раньше, весь список.
+    ?limit=N[&cursor=...] — страница {"items", "next_cursor"} (keyset по id DESC);
+    ?fields=id,title,price — только нужные поля (для списка карточек).
+    """
+    q = request.rel_url.query
+    cat = q.get("category")
+    sub = q.get("subcategory")
+    try:
+        limit = int(q["limit"]) if q.get("limit") else None
+        if limit is not None and not 1 <= limit <= catalog.MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be 1..{catalog.MAX_PAGE_LIMIT}")
+        after_id = catalog.decode_cursor(q["cursor"]) if q.get("cursor") else None
+        fields = catalog.parse_fields(q.get("fields"))
+    except ValueError as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=400)
+
+    snap = await catalog.aget_snapshot()
+    return respond(request, snap.products_page_json(cat, sub, limit, after_id, fields))
+
+async def api_product(request):
+    try:
+        pid = int(request.match_info["id"])
+    except ValueError:
+        return web.json_response({"ok": False, "error": "bad id"}, status=400)
+    snap = await catalog.aget_snapshot()
+    body = snap.product_json(pid)
+    if body is None:
+        return web.json_response({"ok": False, "error": "not found"}, status=404)
+    return respond(request, body)
+
+SEARCH_DEFAULT_LIMIT = 20
+
+async def api_search(request):
+    """?q=кроссовки найк[&limit=&cursor=&fields=] → {"items", "next_cursor"}, лучшие совпадения первыми."""
+    q = request.rel_url.query
+    try:
+        limit = int(q.get("limit") or SEARCH_DEFAULT_LIMIT)
+        if not 1 <= limit <= catalog.MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be 1..{catalog.MAX_PAGE_LIMIT}")
+        offset = catalog.decode_cursor(q["cursor"], kind="off") if q.get("cursor") else 0
+        fields = catalog.parse_fields(q.get("fields"))
+    except ValueError as e:
+        return web.json_response({"ok": False, "error": str(e)}, status=400)
+
+    # индекс FTS меняется вместе с каталогом — кэш результатов живёт в его снимке
+    snap = await catalog.aget_snapshot()
+    key = (db.fts_query(q.get("q", "")), limit, offset, fields)
+    body = snap.cached_search(key)
+    if body is None:
+        try:
+            # на один больше — чтобы знать, есть ли следующая страница
+            items = await db_async.search_products(q.get("q", ""), limit + 1, offset)
+        except sqlite3.OperationalError as e:
+            logging.warning("search unavailable: %s", e)
+            return web.json_response({"ok": False, "error": "search unavailable"}, status=503)
+
+        next_cursor = catalog.encode_cursor(offset + limit, kind="off") if len(items) > limit else None
+        items = items[:limit]
+        if fields is not None:
+            items = [{f: p[f] for f in fields} for p in items]
+        body = snap.payload({"items": items, "next_cursor": next_cursor})
+        snap.remember_search(key, body)
+    return respond(request, body)
+
+async def _resolve_cart(raw_items: list):
+    """Корзина с фронта → (позиции с ценой и названием, сумма). Все товары — одним запросом."""
+    products = await get_products_by_ids([int(it["product_id"]) for it in raw_items])
     items, total = [], 0
-    for it in data.get("items", []):
-        p = get_product(int(it["product_id"]))
+    for it in raw_items:
+        p = products.get(int(it["product_id"]))
         if not p:
             continue
         qty  = int(it.get("qty", 1))
         size = (it.get("size") or "")
-        items.append({"product_id": p["id"], "size": size, "qty": qty, "price": p["price"]})
+        # title дальше уходит в уведомление админам — без повторных запросов
+        items.append({"product_id": p["id"], "title": p["title"], "size": size, "qty": qty, "price": p["price"]})
         total += p["price"] * qty
+    return items, total
+
+async def api_order(request):
+    data = await request.json()
+    items, total = await _resolve_cart(data.get("items", []))
 
-    order_id = create_order(
+    order_id = await create_order(
         user_id=0,
         username=None,
         full_name=data.get("full_name"),
@@ -181,66 +316,271 @@ async def api_order(request):
         telegram=data.get("telegram"),
         total_price=total,
         items=items,
+        outbox=admin_notice(data, total, items, user=None),
     )
-    await notify_admins(order_id, data, total, items, user=None)
+    # уведомление уже в outbox (тем же коммитом) — отвечаем, не дожидаясь Telegram
+    outbox_dispatcher.wake()
     return web.json_response({"ok": True, "order_id": order_id})
 
 # ---------- IMG PROXY ----------
-async def img_proxy(request):
-    url = request.rel_url.query.get("u", "")
-    if not (url.startswith("http://") or url.startswith("https://")):
-        return web.Response(status=400, text="bad url")
+IMG_CACHE = web.AppKey("img_cache", DiskCache)
+IMG_SESSION = web.AppKey("img_session", ClientSession)
+IMG_FETCHER = web.AppKey("img_fetcher", ImageFetcher)
+IMG_CACHE_CONTROL = "public, max-age=31536000"
 
+def _normalize_img_url(url: str) -> str:
+    """Та же нормализация, что normalizeImageUrl во фронте: без query, Drive → uc, GitHub refs → main."""
     qpos = url.find("?")
     if qpos > -1:
         url = url[:qpos]
 
-    import re
     m = re.search(r"drive\.google\.com\/file\/d\/([^\/]+)", url, flags=re.I)
     if m:
         file_id = m.group(1)
         url = f"https://drive.google.com/uc?export=view&id={file_id}"
 
-    url = re.sub(
+    return re.sub(
         r"raw\.githubusercontent\.com\/([^\/]+)\/([^\/]+)\/refs\/heads\/main\/",
         r"raw.githubusercontent.com/\1/\2/main/",
         url,
         flags=re.I
     )
 
+def _cached_file(entry, vary: Optional[str] = None):
+    headers = {"Content-Type": entry.content_type, "Cache-Control": IMG_CACHE_CONTROL}
+    if vary:
+        headers["Vary"] = vary
+    return web.FileResponse(entry.path, headers=headers)
+
+def _local_image(url: str) -> Optional[str]:
+    """/images/... → путь к файлу внутри images/ (или None)."""
+    root = op.abspath("images")
+    path = op.abspath(op.join(root, url[len("/images/"):].split("?", 1)[0]))
+    if not path.startswith(root + os.sep) or not op.isfile(path):
+        return None
+    return path
+
+# манифест optimize_media.py: готовые WebP/AVIF-варианты и облегчённое видео для /images/
+MEDIA = web.AppKey("media", MediaIndex)
+IMAGES_CACHE_CONTROL = "public, max-age=86400"
+
+async def images_handler(request):
+    """
+    /images/<файл>[?w=640] — по Accept и ширине отдаёт готовый вариант из манифеста
+    (AVIF > WebP), иначе оригинал. Видео — облегчённая версия (?orig=1 — исходник).
+    """
+    name = request.match_info["name"]
+    path = _local_image("/images/" + name)
+    if not path:
+        return web.Response(status=404, text="Not found")
+
+    media = request.app[MEDIA]
+    headers = {"Cache-Control": IMAGES_CACHE_CONTROL}
+    variant = None
+    negotiated = False
+    if media.entry(name):
+        if media.video(name):
+            # видео по Accept не выбираем — Vary не ставим, кэши не дробятся
+            if request.rel_url.query.get("orig") != "1" and media.video(name)["variants"]:
+                variant = media.video(name)["variants"][0]
+        else:
+            width = _parse_width(request.rel_url.query.get("w"))
+            variant = media.pick(name, request.headers.get("Accept", ""), width)
+            negotiated = True
+
+    if variant is not None:
+        vpath = media.path(variant["path"])
+        if op.isfile(vpath):
+            headers["Content-Type"] = variant["type"]
+            # оригинал годится любому клиенту; Vary нужен только выбранному по Accept формату
+            if negotiated:
+                headers["Vary"] = "Accept"
+            return web.FileResponse(vpath, headers=headers)
+    return web.FileResponse(path, headers=headers)
+
+def _parse_width(value: Optional[str]) -> int:
     try:
-        async with ClientSession() as sess:
-            async with sess.get(url) as resp:
-                if resp.status != 200:
-                    return web.Response(status=resp.status, text="fetch error")
-                data = await resp.read()
-                ctype = resp.headers.get("Content-Type", "application/octet-stream")
-                headers = {"Cache-Control":"public, max-age=31536000"}
-                return web.Response(body=data, content_type=ctype, headers=headers)
-    except Exception as e:
-        logging.exception("IMG proxy error: %s", e)
-        return web.Response(status=502, text="proxy error")
+        return max(0, int(value or 0))
+    except ValueError:
+        return 0
+
+async def img_proxy(request):
+    q = request.rel_url.query
+    url = q.get("u", "")
+    local_path = None
+    if url.startswith("/images/"):
+        local_path = _local_image(url)
+        if not local_path:
+            return web.Response(status=404, text="Not found")
+        # mtime в ключе: после деплоя новой картинки варианты пересоберутся
+        url = f"file://{local_path}?m={int(op.getmtime(local_path))}"
+    elif not (url.startswith("http://") or url.startswith("https://")):
+        return web.Response(status=400, text="bad url")
+    else:
+        url = _normalize_img_url(url)
+
+    # ✅ уменьшенная копия: /img?u=...&w=480&fmt=webp
+    width = _parse_width(q.get("w"))
+    if width and thumbs.available():
+        fmt_param = (q.get("fmt") or "auto").lower()
+        fmt = thumbs.pick_format(fmt_param, request.headers.get("Accept", ""))
+        width = thumbs.bucket_width(width)
+        try:
+            res = await request.app[IMG_FETCHER].variant(url, local_path, width, fmt)
+        except Exception as e:
+            logging.exception("IMG variant error: %s", e)
+            res = None
+        if res and res.entry:
+            metrics.IMG_REQUESTS.inc("variant")
+            return _cached_file(res.entry, vary="Accept" if fmt_param == "auto" else None)
+        # иначе — отдаём оригинал как раньше
+
+    if local_path:
+        metrics.IMG_REQUESTS.inc("local")
+        return web.FileResponse(local_path, headers={"Cache-Control": IMG_CACHE_CONTROL})
+
+    # ✅ сначала диск: Drive/vk троттлят, а картинка не меняется
+    cache = request.app[IMG_CACHE]
+    entry = cache.get(url)
+    if entry is None:
+        try:
+            res = await request.app[IMG_FETCHER].fetch(url)
+        except Exception as e:
+            logging.exception("IMG proxy error: %s", e)
+            metrics.IMG_REQUESTS.inc("error")
+            return web.Response(status=502, text="proxy error")
+        if res.stream is not None:
+            metrics.IMG_REQUESTS.inc("passthrough")
+            return await _img_passthrough(request, res.stream)
+        if res.entry is None:
+            metrics.IMG_REQUESTS.inc("error")
+            return web.Response(status=res.status, text="fetch error")
+        metrics.IMG_REQUESTS.inc("miss")
+        entry = res.entry
+    else:
+        metrics.IMG_REQUESTS.inc("hit")
+
+    return _cached_file(entry)
+
+async def _img_passthrough(request, stream):
+    """Картинка больше IMG_MAX_OBJECT_BYTES — отдаём потоком из общей закачки, не держа в памяти."""
+    try:
+        out = web.StreamResponse(headers={
+            "Content-Type": stream.content_type,
+            "Cache-Control": IMG_CACHE_CONTROL,
+        })
+        if stream.content_length is not None:
+            out.content_length = stream.content_length
+        await out.prepare(request)
+        async for chunk in stream.chunks():
+            await out.write(chunk)
+        await out.write_eof()
+        return out
+    finally:
+        stream.close()
+
+async def _img_proxy_ctx(app):
+    # одна сессия (keep-alive, лимиты на хост), один кэш и пул ресайза на процесс
+    app[IMG_CACHE] = DiskCache()
+    app[IMG_SESSION] = make_session()
+    pool = thumbs.make_pool() if thumbs.available() else None
+    app[IMG_FETCHER] = ImageFetcher(app[IMG_SESSION], app[IMG_CACHE], pool)
+    yield
+    await app[IMG_SESSION].close()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+    app[IMG_CACHE].close()
+
+async def _migrate_on_startup(app):
+    # схема/индексы — один раз при старте процесса, а не на каждом /sync
+    await db_async.run(migrations.migrate)
+
+# ---------- metrics ----------
+# без токена /metrics не отдаётся (404): маршруты, доля ошибок и трафик — не для всех.
+# Только заголовок Authorization: Bearer <METRICS_TOKEN> — ?token= попадал бы в логи доступа
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    # метка — шаблон маршрута (/api/product/{id}), а не сам путь: иначе число серий не ограничено
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    status = 500
+    started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(route)
+    try:
+        resp = await handler(request)
+        status = resp.status
+        return resp
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec(route)
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method, str(status))
+        metrics.HTTP_REQUESTS.inc(route, request.method, str(status))
+
+async def metrics_handler(request):
+    if not METRICS_TOKEN:
+        raise web.HTTPNotFound()
+    auth = request.headers.get("Authorization", "").encode("utf-8", "surrogateescape")
+    if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}".encode()):
+        return web.Response(status=401, text="unauthorized", headers={"WWW-Authenticate": "Bearer"})
+    return web.Response(
+        text=metrics.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8", "Cache-Control": "no-store"},
+    )
+
+def _img_cache_samples(app):
+    def collect():
+        cache = app.get(IMG_CACHE)
+        if cache is None:
+            return []
+        st = cache.stats()
+        return [
+            ("img_cache_bytes", "Disk image cache size", {}, st["bytes"]),
+            ("img_cache_entries", "Disk image cache entries", {}, st["entries"]),
+        ]
+    return collect
 
 def build_app():
-    app = web.Application()
+    # лимиты и склейка одинаковых GET — внутри метрик: отказы 429/503 тоже видны в http_requests_total
+    app = web.Application(middlewares=[metrics_middleware, *admission.middlewares()])
+    app[STATIC] = static_assets.build("web")
+    app.on_startup.append(_migrate_on_startup)
     app.router.add_get("/", index_handler)
     app.router.add_get("/web/", index_handler)
     app.router.add_get("/web", index_handler)
     app.router.add_get("/web/{path:.*}", file_handler)
 
-    # Статика /images (для hero mp4/webm или картинок)
+    # Статика /images (для hero mp4/webm или картинок) + варианты из optimize_media.py
+    app[MEDIA] = MediaIndex("images")
     if op.isdir("images"):
-        app.router.add_static("/images/", path="images", show_index=False)
+        app.router.add_get("/images/{name:.+}", images_handler)
 
     # API
     app.router.add_get("/api/config", api_config)
+    app.router.add_get("/api/bootstrap", api_bootstrap)
     app.router.add_get("/api/categories", api_categories)
     app.router.add_get("/api/subcategories", api_subcategories)
     app.router.add_get("/api/products", api_products)
+    app.router.add_get("/api/product/{id}", api_product)
+    app.router.add_get("/api/search", api_search)
     app.router.add_post("/api/order", api_order)
 
     # Прокси
+    app.cleanup_ctx.append(_img_proxy_ctx)
     app.router.add_get("/img", img_proxy)
+
+    # апдейты Telegram (BOT_UPDATES=webhook) — в это же приложение, через ограниченную очередь
+    if USE_WEBHOOK:
+        updates = webhook.UpdateQueue(dp, bot, WEBHOOK_SECRET)
+        app.router.add_post(webhook.WEBHOOK_PATH, updates.handle)
+        app.cleanup_ctx.append(updates.ctx)
+        metrics.add_collector("webhook", updates.samples)
+
+    app.router.add_get("/metrics", metrics_handler)
+    metrics.add_collector("img_cache", _img_cache_samples(app))
     return app
 
 # ---------- Bot ----------
@@ -259,38 +599,64 @@ async def start(m: Message):
 async def cmd_sync(m: Message):
     if not _is_admin(m.from_user.id):
         return await m.answer("⛔️ Нет доступа.")
-    clear = "clear" in (m.text or "").lower()
-    await m.answer("⏳ Обновляю товары из Google Sheets...")
-    try:
-        res = await sync_from_google(clear_products=clear)
-        await m.answer(res)
-    except Exception as e:
-        logging.exception("sync failed: %s", e)
-        await m.answer(f"❌ Ошибка синка: {e}")
-
-async def notify_admins(order_id: int, data: dict, total: int, items_payload: list, user: Optional[User]):
-    uname = f"@{user.username}" if (user and user.username) else "—"
-    buyer_link = f"<a href='tg://user?id={user.id}'>профиль</a>" if user else "—"
+    args = (m.text or "").lower().split()[1:]
+    if "status" in args:
+        return await m.answer(await sync_runner.status_text())
+    if sync_runner.running:
+        return await m.answer("⏳ Синк уже идёт — /sync status покажет прогресс.")
+
+    status_msg = await m.answer("⏳ Обновляю товары из Google Sheets...")
+
+    async def report(text: str, final: bool):
+        if final:
+            await m.answer(text)  # итог — новым сообщением, чтобы пришло уведомление
+        else:
+            await status_msg.edit_text(text)
+
+    sync_runner.start(clear="clear" in args, trigger=f"admin {m.from_user.id}", report=report)
+
+ORDER_NOTICE = "order_admin"
+
+def admin_notice(data: dict, total: int, items_payload: list, user: Optional[User]) -> dict:
+    """Уведомление админам о заказе — пишется в outbox в одной транзакции с заказом."""
+    return {
+        "kind": ORDER_NOTICE,
+        "chat_ids": ADMIN_CHAT_IDS,
+        "payload": {
+            "data": {k: data.get(k) for k in ("full_name", "phone", "address", "telegram", "comment")},
+            "total": total,
+            "items": items_payload,
+            "user": {"id": user.id, "username": user.username} if user else None,
+        },
+    }
+
+def render_order_notice(payload: dict) -> str:
+    """Текст для админов; order_id подставляет db при записи в outbox."""
+    data, user, e = payload["data"], payload.get("user"), html.escape
+    uname = f"@{e(user['username'])}" if (user and user.get("username")) else "—"
+    buyer_link = f"<a href='tg://user?id={int(user['id'])}'>профиль</a>" if user else "—"
     items_text = "\n".join([
-        f"• {get_product(it['product_id'])['title']} "
-        f"[{it.get('size') or '—'}] × {it.get('qty',1)} — {it.get('price',0)*it.get('qty',1)} ₽"
-        for it in items_payload
+        f"• {e(it.get('title') or '—')} "
+        f"[{e(it.get('size') or '—')}] × {it.get('qty',1)} — {it.get('price',0)*it.get('qty',1)} ₽"
+        for it in payload["items"]
     ]) or "—"
-    text = (
-        f"<b>Новый заказ #{order_id}</b>\n"
-        f"Клиент: <b>{data.get('full_name') or '—'}</b> {uname} ({buyer_link})\n"
-        f"Телефон: <b>{data.get('phone') or '—'}</b>\n"
-        f"СДЭК/адрес: <b>{data.get('address') or '—'}</b>\n"
-        f"Telegram: <b>{data.get('telegram') or '—'}</b>\n"
-        f"Комментарий: {data.get('comment') or '—'}\n"
-        f"Сумма: <b>{total} ₽</b>\n\n"
+    # данные покупателя экранируем: иначе Telegram отвергнет HTML, и уведомление не уйдёт вовсе
+    return (
+        f"<b>Новый заказ #{payload['order_id']}</b>\n"
+        f"Клиент: <b>{e(data.get('full_name') or '—')}</b> {uname} ({buyer_link})\n"
+        f"Телефон: <b>{e(data.get('phone') or '—')}</b>\n"
+        f"СДЭК/адрес: <b>{e(data.get('address') or '—')}</b>\n"
+        f"Telegram: <b>{e(data.get('telegram') or '—')}</b>\n"
+        f"Комментарий: {e(data.get('comment') or '—')}\n"
+        f"Сумма: <b>{payload['total']} ₽</b>\n\n"
         f"{items_text}"
     )
-    for cid in ADMIN_CHAT_IDS:
-        try:
-            await bot.send_message(cid, text, disable_web_page_preview=True)
-        except Exception as e:
-            logging.exception("Admin DM failed to %s: %s", cid, e)
+
+async def _send_admin(chat_id: int, text: str):
+    return await bot.send_message(chat_id, text, disable_web_page_preview=True)
+
+# доставка уведомлений из outbox (см. outbox.py); запускается в main()
+outbox_dispatcher = OutboxDispatcher(send=_send_admin, renderers={ORDER_NOTICE: render_order_notice})
 
 @dp.message(F.web_app_data)
 async def on_webapp_data(m: Message):
@@ -300,18 +666,9 @@ async def on_webapp_data(m: Message):
         await m.answer("Не удалось прочитать данные заказа.")
         return
 
-    items_payload, total = [], 0
-    for it in data.get("items", []):
-        p = get_product(int(it["product_id"]))
-        if not p:
-            continue
-        qty  = int(it.get("qty", 1))
-        size = (it.get("size") or "")
-        item = {"product_id": p["id"], "size": size, "qty": qty, "price": p["price"]}
-        items_payload.append(item)
-        total += p["price"] * qty
+    items_payload, total = await _resolve_cart(data.get("items", []))
 
-    order_id = create_order(
+    order_id = await create_order(
         user_id=m.from_user.id,
         username=m.from_user.username,
         full_name=data.get("full_name"),
@@ -321,22 +678,106 @@ async def on_webapp_data(m: Message):
         telegram=data.get("telegram"),
         total_price=total,
         items=items_payload,
+        outbox=admin_notice(data, total, items_payload, user=m.from_user),
     )
+    outbox_dispatcher.wake()
+
+    thankyou = (await settings_store.aget()).text("thankyou_text", THANKYOU_TEXT)
+    await m.answer(f"✅ Заказ №{order_id} оформлен.\n\n{thankyou}")
+
+# ---------- запуск ----------
+# all — витрина и бот в одном процессе (как раньше, для небольших инсталляций);
+# web — только HTTP, можно несколько воркеров на одном порту (см. workers.py);
+# bot — polling (или регистрация webhook), доставка outbox и плановый синк. Общее состояние — только SQLite.
+RUN_MODES = ("all", "web", "bot")
+RUN_MODE  = os.getenv("RUN_MODE", "all").strip().lower() or "all"
 
-    await m.answer(f"✅ Заказ №{order_id} оформлен.\n\n{THANKYOU_TEXT}")
-    await notify_admins(order_id, data, total, items_payload, user=m.from_user)
+async def register_webhook():
+    """setWebhook с секретом. Те же параметры из нескольких инстансов — безвредно."""
+    url = WEBHOOK_BASE_URL + webhook.WEBHOOK_PATH
+    try:
+        await bot.set_webhook(url, secret_token=WEBHOOK_SECRET, allowed_updates=dp.resolve_used_update_types())
+        logging.info("Telegram webhook set: %s", url)
+    except Exception as e:
+        # без Telegram (локальная проверка POST'ом) витрина и webhook всё равно работают
+        logging.error("setWebhook(%s) failed: %s", url, e)
+
+async def drop_webhook():
+    """Снимает webhook, оставшийся от BOT_UPDATES=webhook: при нём getUpdates отвечает конфликтом."""
+    try:
+        # drop_pending_updates=False — накопленные апдейты заберёт polling
+        await bot.delete_webhook(drop_pending_updates=False)
+    except Exception as e:
+        logging.error("deleteWebhook failed: %s", e)
+
+async def run_bot():
+    """
+    Polling (или регистрация webhook) + фоновые задачи бота.
+    aiogram сам ловит SIGTERM/SIGINT и выходит из polling; в webhook-режиме ждём сигнала сами.
+    """
+    await db_async.run(migrations.migrate)
+    schedule = asyncio.create_task(sync_runner.periodic()) if SYNC_INTERVAL_MIN > 0 else None
+    # заказы из web-воркеров будят только свой процесс — здесь outbox подхватит их опросом
+    delivery = asyncio.create_task(outbox_dispatcher.run())
+    try:
+        if USE_WEBHOOK:
+            # апдейты принимает build_app() (этого процесса или web-воркеров)
+            await register_webhook()
+            await workers.wait_for_signal()
+        else:
+            await drop_webhook()
+            await dp.start_polling(bot)
+    finally:
+        delivery.cancel()
+        if schedule:
+            schedule.cancel()
+        await bot.session.close()
+
+async def serve_web(reuse_port: bool = False):
+    await workers.serve(build_app(), "0.0.0.0", PORT, reuse_port=reuse_port)
+
+async def _web_worker():
+    await serve_web(reuse_port=True)
 
 async def main():
     assert BOT_TOKEN, "BOT_TOKEN is not set"
     app = build_app()
-    runner = web.AppRunner(app)
+    runner = web.AppRunner(app, shutdown_timeout=workers.SHUTDOWN_TIMEOUT)
     await runner.setup()
     await web.TCPSite(runner, "0.0.0.0", PORT).start()
     logging.info(f"Web server started on port {PORT}")
     try:
-        await dp.start_polling(bot)
+        await run_bot()
     finally:
-        await bot.session.close()
+        # дорабатываем начатые запросы (до SHUTDOWN_TIMEOUT) и закрываем ресурсы приложения
+        await runner.cleanup()
+
+def run(mode: str = RUN_MODE, web_workers: int = workers.WEB_WORKERS):
+    assert BOT_TOKEN, "BOT_TOKEN is not set"
+    if mode not in RUN_MODES:
+        raise SystemExit(f"RUN_MODE must be one of: {', '.join(RUN_MODES)}")
+    if USE_WEBHOOK and not webhook.valid_secret(WEBHOOK_SECRET):
+        raise SystemExit("BOT_UPDATES=webhook needs WEBHOOK_SECRET (1-256 chars: A-Z, a-z, 0-9, _, -)")
+    if mode == "bot":
+        logging.info("Run mode: bot only (%s, outbox, scheduled sync)", BOT_UPDATES)
+        asyncio.run(run_bot())
+    elif mode == "web":
+        logging.info("Run mode: web only, %d worker(s); start a separate RUN_MODE=bot process", web_workers)
+        migrations.migrate()  # один раз до старта воркеров, а не наперегонки в каждом
+        if web_workers > 1 and not workers.reuse_port_supported():
+            logging.warning("SO_REUSEPORT is not available here, running a single web worker")
+            web_workers = 1
+        if web_workers > 1:
+            raise SystemExit(workers.supervise(_web_worker, web_workers))
+        asyncio.run(serve_web())
+    else:
+        asyncio.run(main())
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    ap = argparse.ArgumentParser(description="Telegram shop bot and WebApp server.")
+    ap.add_argument("--mode", choices=RUN_MODES, default=RUN_MODE,
+                    help="all: web + bot in one process (default); web: HTTP only; bot: polling/background only")
+    ap.add_argument("--workers", type=int, default=workers.WEB_WORKERS,
+                    help="Web worker processes sharing the port in --mode web (default: WEB_WORKERS or 1)")
+    args = ap.parse_args()
+    run(args.mode, max(1, args.workers))
@@ -0,0 +1,317 @@
+"""
+Снимок каталога в памяти процесса.
+
+Товары читаются из SQLite один раз, раскладываются по категориям/подкатегориям,
+а JSON-ответы для /api/products, /api/categories, /api/subcategories, /api/bootstrap
+сериализуются заранее (http_cache.Payload: ETag + сжатие). seed_from_csv при каждом импорте меняет settings.catalog_version —
+по нему снимок целиком перечитывается и подменяется одной ссылкой (атомарно для читателей).
+Сами чтения в SQLite не ходят: версию проверяем не чаще раза в CATALOG_CHECK_INTERVAL секунд.
+
+Постраничная выдача (/api/products?limit=&cursor=) — keyset по id DESC: курсор хранит
+последний отданный id, страница ищется бинарным поиском по уже отсортированному списку.
+"""
+import base64
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import db
+import db_async
+from http_cache import Payload
+
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "2"))
+
+# сколько «нестандартных» выборок (например, подкатегория без категории) запоминаем в снимке
+_MAX_EXTRA_BODIES = 256
+# сколько страниц (фильтр + курсор + limit + fields) держим готовыми в снимке
+_MAX_PAGE_BODIES = 1024
+# результаты /api/search (LRU): частые широкие запросы вроде «nike» не пересчитывают bm25
+_MAX_SEARCH_BODIES = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+# /api/bootstrap: варианты по (config, limit, fields) — на практике один, от текущего web/app.js
+_MAX_BOOTSTRAP_BODIES = 16
+
+MAX_PAGE_LIMIT = int(os.getenv("PRODUCTS_MAX_LIMIT", "200"))
+
+# поля товара (см. db._row_to_product), которые можно запросить через fields=
+PRODUCT_FIELDS = (
+    "id", "title", "category", "subcategory", "price", "image_url", "images_urls",
+    "description", "has_description", "sizes", "sizes_text", "is_active",
+)
+
+
+def encode_cursor(value: int, kind: str = "id") -> str:
+    """Непрозрачный курсор: kind="id" — последний отданный id, "off" — смещение (поиск)."""
+    return base64.urlsafe_b64encode(f"{kind}:{value}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str = "id") -> int:
+    """Курсор → значение. ValueError, если курсор битый или другого вида."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, _, value = raw.partition(":")
+        if prefix != kind:
+            raise ValueError
+        return int(value)
+    except Exception:
+        raise ValueError("bad cursor") from None
+
+
+def parse_fields(spec: Optional[str]) -> Optional[tuple]:
+    """"id,title,price" → кортеж полей (None — все поля). ValueError на неизвестное поле."""
+    if not spec:
+        return None
+    fields = tuple(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        raise ValueError("unknown fields: " + ",".join(unknown))
+    return fields or None
+
+
+def _dump(obj) -> bytes:
+    # те же настройки, что у web.json_response
+    return json.dumps(obj).encode("utf-8")
+
+
+def _version_time(version: str) -> Optional[float]:
+    # seed_from_csv пишет версию как time.time_ns()
+    try:
+        return int(version) / 1e9
+    except (TypeError, ValueError):
+        return None
+
+
+class Snapshot:
+    """Неизменяемый срез каталога для одной catalog_version."""
+
+    def __init__(self, version: str, products: list):
+        self.version = version
+        self.loaded_at = time.time()
+        self.last_modified = _version_time(version) or self.loaded_at
+        self.products = products  # уже в порядке id DESC, только активные
+        self.by_id = {p["id"]: p for p in products}
+
+        by_cat, by_cat_sub = {}, {}
+        for p in products:
+            by_cat.setdefault(p["category"], []).append(p)
+            by_cat_sub.setdefault((p["category"], p["subcategory"]), []).append(p)
+
+        self.by_category = by_cat
+        self.by_subcategory = by_cat_sub
+        self.categories = [
+            {"title": c, "image_url": "", "count": len(by_cat[c])}
+            for c in sorted(c for c in by_cat if c)
+        ]
+        self.subcategories = {
+            c: sorted({p["subcategory"] for p in items if p["subcategory"]})
+            for c, items in by_cat.items() if c
+        }
+
+        # ---- готовые тела ответов ----
+        self.categories_json = self.payload(self.categories)
+        self._subcategories_json = {c: self.payload(v) for c, v in self.subcategories.items()}
+        self._products_json = {(None, None): self.payload(products)}
+        for c, items in by_cat.items():
+            if c:
+                self._products_json[(c, None)] = self.payload(items)
+        by_sub = {}
+        for (c, s), items in by_cat_sub.items():
+            if c:
+                self._products_json[(c, s)] = self.payload(items)
+            by_sub.setdefault(s, []).extend(items)
+        # только подкатегория (без категории) — товары всех категорий, порядок id DESC как в products
+        for s, items in by_sub.items():
+            items.sort(key=lambda p: p["id"], reverse=True)
+            self._products_json[(None, s)] = self.payload(items)
+        self._empty = self.payload([])
+        self._extra = 0
+        self._neg_ids = {}   # ключ фильтра → [-id, ...] по возрастанию (для bisect)
+        self._pages = {}
+        self._product_json = {}
+        self._search = OrderedDict()
+        self._bootstrap = {}
+
+    def precompress(self) -> None:
+        """
+        Сжать заранее то, что запрашивают на каждом открытии WebApp: весь список, списки по
+        категориям, категории и подкатегории. Вызывается из _load — в потоке БД, не в event loop;
+        остальное (страницы, фильтры по подкатегории) сожмётся на запросе быстрым уровнем.
+        """
+        self.categories_json.precompress()
+        for body in self._subcategories_json.values():
+            body.precompress()
+        for (c, s), body in self._products_json.items():
+            if s is None:
+                body.precompress()
+
+    def payload(self, obj) -> Payload:
+        return Payload(_dump(obj), last_modified=self.last_modified)
+
+    def filter_products(self, category: Optional[str] = None, subcategory: Optional[str] = None) -> list:
+        """Та же выборка, что db.get_products(category, subcategory)."""
+        if category and subcategory is not None:
+            return self.by_subcategory.get((category, subcategory), [])
+        if category:
+            return self.by_category.get(category, [])
+        if subcategory is not None:
+            return [p for p in self.products if p["subcategory"] == subcategory]
+        return self.products
+
+    def products_json(self, category: Optional[str] = None, subcategory: Optional[str] = None) -> Payload:
+        key = (category or None, subcategory)
+        body = self._products_json.get(key)
+        if body is None:
+            body = self.payload(self.filter_products(category, subcategory))
+            # неизвестные категории не должны раздувать снимок бесконечно
+            if self._extra < _MAX_EXTRA_BODIES:
+                self._products_json[key] = body
+                self._extra += 1
+        return body
+
+    def products_page_json(
+        self,
+        category: Optional[str] = None,
+        subcategory: Optional[str] = None,
+        limit: Optional[int] = None,
+        after_id: Optional[int] = None,
+        fields: Optional[tuple] = None,
+    ) -> Payload:
+        """
+        limit=None — весь список (как раньше), иначе {"items": [...], "next_cursor": str | null}.
+        after_id — id из курсора: отдаём товары с id < after_id.
+        """
+        if limit is None and fields is None:
+            return self.products_json(category, subcategory)
+
+        key = (category or None, subcategory, limit, after_id, fields)
+        body = self._pages.get(key)
+        if body is not None:
+            return body
+
+        items = self.filter_products(category, subcategory)
+        start = 0
+        if after_id is not None:
+            neg = self._neg_ids.get(key[:2])
+            if neg is None:
+                neg = [-p["id"] for p in items]
+                # фильтр — строки от клиента: запоминаем не больше, чем «нестандартных» выборок
+                if len(self._neg_ids) < _MAX_EXTRA_BODIES:
+                    self._neg_ids[key[:2]] = neg
+            start = bisect.bisect_right(neg, -after_id)
+
+        if limit is None:
+            page, next_cursor = items[start:], None
+        else:
+            page = items[start:start + limit]
+            more = start + limit < len(items)
+            next_cursor = encode_cursor(page[-1]["id"]) if (page and more) else None
+        if fields is not None:
+            page = [{f: p[f] for f in fields} for p in page]
+
+        body = self.payload(page if limit is None else {"items": page, "next_cursor": next_cursor})
+        if len(self._pages) < _MAX_PAGE_BODIES:
+            self._pages[key] = body
+        return body
+
+    def product_json(self, pid: int) -> Optional[Payload]:
+        """Карточка одного товара (/api/product/{id}); None — нет такого активного товара."""
+        body = self._product_json.get(pid)
+        if body is None:
+            p = self.by_id.get(pid)
+            if p is None:
+                return None
+            body = self._product_json[pid] = self.payload(p)
+        return body
+
+    def cached_search(self, key) -> Optional[Payload]:
+        body = self._search.get(key)
+        if body is not None:
+            self._search.move_to_end(key)
+        return body
+
+    def remember_search(self, key, body: Payload) -> None:
+        self._search[key] = body
+        self._search.move_to_end(key)
+        while len(self._search) > _MAX_SEARCH_BODIES:
+            self._search.popitem(last=False)
+
+    def subcategories_json(self, category: Optional[str]) -> Payload:
+        return self._subcategories_json.get(category or "", self._empty)
+
+    def bootstrap_json(self, config: Payload, limit: int, fields: Optional[tuple] = None) -> Payload:
+        """
+        Первый экран WebApp одним ответом: {"config", "categories", "products"}, где products —
+        первая страница всех товаров ({"items", "next_cursor"}, как /api/products?limit=).
+        Склеивается из уже готовых тел, без повторной сериализации.
+        """
+        key = (config.etag, limit, fields)
+        body = self._bootstrap.get(key)
+        if body is None:
+            page = self.products_page_json(None, None, limit, None, fields)
+            raw = b"".join((
+                b'{"config": ', config.raw,
+                b', "categories": ', self.categories_json.raw,
+                b', "products": ', page.raw, b"}",
+            ))
+            # Last-Modified не ставим: config меняется независимо от catalog_version, сверяем по ETag
+            body = Payload(raw)
+            if len(self._bootstrap) >= _MAX_BOOTSTRAP_BODIES:
+                self._bootstrap.clear()
+            self._bootstrap[key] = body
+        return body
+
+
+_snapshot: Optional[Snapshot] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _load() -> Snapshot:
+    version, products = db.load_catalog()
+    snap = Snapshot(version, products)
+    snap.precompress()
+    logging.info("Catalog snapshot loaded: version=%s, %d products", version or "-", len(products))
+    return snap
+
+
+def get_snapshot() -> Snapshot:
+    """Текущий снимок; при смене catalog_version перечитывает каталог."""
+    global _snapshot, _checked_at
+
+    snap = _snapshot
+    if snap is not None and time.monotonic() - _checked_at < CATALOG_CHECK_INTERVAL:
+        return snap
+
+    with _lock:
+        snap = _snapshot
+        if snap is not None and time.monotonic() - _checked_at < CATALOG_CHECK_INTERVAL:
+            return snap
+        try:
+            if snap is None or db.get_catalog_version() != snap.version:
+                snap = _load()
+                _snapshot = snap
+        except Exception as e:
+            if snap is None:
+                raise
+            # БД временно недоступна — отдаём старый снимок
+            logging.warning("Catalog version check failed: %s", e)
+        _checked_at = time.monotonic()
+        return snap
+
+
+async def aget_snapshot() -> Snapshot:
+    """get_snapshot для event loop: перечитывание (если нужно) — в пуле DB-потоков."""
+    snap = _snapshot
+    if snap is not None and time.monotonic() - _checked_at < CATALOG_CHECK_INTERVAL:
+        return snap
+    return await db_async.run(get_snapshot)
+
+
+def invalidate() -> None:
+    """Заставляет следующее чтение сверить catalog_version (после импорта в этом же процессе)."""
+    global _checked_at
+    _checked_at = 0.0
@@ -1,12 +1,189 @@
+import functools
+import json
 import sqlite3
 import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import metrics
 
 DB_PATH = os.getenv("DB_PATH", "data.sqlite")
 
+DB_POOL_SIZE       = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_MB         = int(os.getenv("DB_MMAP_MB", "64"))
+DB_CACHE_MB        = int(os.getenv("DB_CACHE_MB", "16"))
+
+# применяются один раз при открытии соединения
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",          # читатели не ждут писателя (заказы vs каталог)
+    "PRAGMA synchronous=NORMAL",        # в WAL этого достаточно, меньше fsync
+    f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}",
+    f"PRAGMA mmap_size={DB_MMAP_MB * 1024 * 1024}",
+    f"PRAGMA cache_size=-{DB_CACHE_MB * 1024}",  # отрицательное значение — в KiB
+    "PRAGMA temp_store=MEMORY",
+)
+
 
 # ---------- low-level ----------
+def _timed(fn):
+    """Время вызова (вместе с ожиданием соединения) → metrics.DB_QUERY{op=имя функции}."""
+    op = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            metrics.DB_ERRORS.inc(op)
+            raise
+        finally:
+            metrics.DB_QUERY.observe(time.perf_counter() - started, op)
+
+    return wrapper
+
+
+class ConnectionPool:
+    """
+    Пул долгоживущих соединений к одной БД. Соединение открывается один раз
+    (PRAGMA + кэш подготовленных выражений живут вместе с ним) и раздаётся потокам
+    по очереди. Безопасен и для aiohttp (через db_async), и для seed_from_csv.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._opened = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,  # одно соединение — один поток за раз (гарантирует пул)
+            cached_statements=256,
+        )
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._opened < self.size:
+                self._opened += 1
+                opening = True
+            else:
+                self._waits += 1
+                opening = False
+
+        if opening:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                    self._in_use -= 1
+                raise
+
+        started = time.monotonic()
+        conn = self._idle.get()
+        with self._lock:
+            self._wait_time += time.monotonic() - started
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: — коммит/откат как у sqlite3.Connection."""
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_ms": round(self._wait_time * 1000, 1),
+            }
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    # после fork соединения родителя использовать нельзя — открываем свои
+    if pool is None or pool._pid != os.getpid():
+        with _pool_lock:
+            pool = _pool
+            if pool is None or pool._pid != os.getpid():
+                pool = _pool = ConnectionPool(DB_PATH)
+    return pool
+
+
 def connect():
-    return sqlite3.connect(DB_PATH)
+    """
+    Соединение из пула: `with connect() as conn:` коммитит/откатывает
+    и возвращает соединение в пул (не закрывая его).
+    """
+    return get_pool().connection()
+
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+
+def _pool_samples():
+    st = pool_stats()
+    return [
+        ("db_pool_connections", "SQLite pool connections by state", {"state": "in_use"}, st["in_use"]),
+        ("db_pool_connections", "SQLite pool connections by state", {"state": "idle"}, st["idle"]),
+        ("db_pool_waits", "Times a caller waited for a free connection", {}, st["waits"]),
+        ("db_pool_wait_seconds", "Total time spent waiting for a connection", {}, st["wait_ms"] / 1000),
+    ]
+
+
+metrics.add_collector("db_pool", _pool_samples)
 
 
 def dicts(cur):
@@ -15,33 +192,86 @@ def dicts(cur):
 
 
 # ---------- settings (логотип и любые key/value) ----------
+# читают их через settings_store (снимок в памяти); любая запись меняет settings_version
+SETTINGS_VERSION_KEY = "settings_version"
+
+_UPSERT_SETTING_SQL = """
+    INSERT INTO settings(key, value)
+    VALUES(?, ?)
+    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+"""
+
+# закоммиченные записи в этом процессе — settings_store видит их сразу, не дожидаясь
+# проверки версии; считаем только после успешного коммита (откат — не запись)
+_settings_writes = 0
+_settings_writes_lock = threading.Lock()
+
+
+def settings_writes() -> int:
+    return _settings_writes
+
+
+def put_setting(cur, key: str, value: str) -> None:
+    """
+    UPSERT настройки в текущей транзакции вместе с новой settings_version.
+    Коммитить через commit_settings(conn) — иначе settings_store заметит запись только по версии.
+    """
+    cur.execute(_UPSERT_SETTING_SQL, (key, value))
+    cur.execute(_UPSERT_SETTING_SQL, (SETTINGS_VERSION_KEY, str(time.time_ns())))
+
+
+def commit_settings(conn) -> None:
+    """conn.commit() и отметка для settings_store; исключение из commit — не запись."""
+    global _settings_writes
+    conn.commit()
+    with _settings_writes_lock:
+        _settings_writes += 1
+
+
+@_timed
 def get_setting(key: str, default: str = "") -> str:
+    """Прямое чтение из БД (свежее значение); для частых чтений — settings_store."""
     with connect() as conn:
         cur = conn.execute("SELECT value FROM settings WHERE key = ?", (key,))
         row = cur.fetchone()
         return row[0] if row and row[0] is not None else default
 
 
+@_timed
 def set_setting(key: str, value: str) -> None:
     """Создаёт или обновляет настройку (SQLite UPSERT)."""
     with connect() as conn:
-        conn.execute(
-            """
-            INSERT INTO settings(key, value)
-            VALUES(?, ?)
-            ON CONFLICT(key) DO UPDATE SET value = excluded.value
-            """,
-            (key, value),
-        )
-        conn.commit()
+        put_setting(conn, key, value)
+        commit_settings(conn)
 
 
 def get_logo_url() -> str:
-    """Удобная обёртка — тянет URL логотипа (ключ 'logo_url')."""
-    return get_setting("logo_url", "")
+    """Удобная обёртка — URL логотипа (ключ 'logo_url') из снимка настроек."""
+    import settings_store  # settings_store сам импортирует db
+    return settings_store.get().get("logo_url")
+
+
+def get_settings_version() -> str:
+    try:
+        return get_setting(SETTINGS_VERSION_KEY, "")
+    except sqlite3.OperationalError:
+        return ""  # база ещё не засеяна
+
+
+@_timed
+def load_settings():
+    """(settings_version, {key: value}) — вся таблица одним запросом, для settings_store."""
+    with connect() as conn:
+        try:
+            rows = conn.execute("SELECT key, value FROM settings").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    values = {k: v for k, v in rows if v is not None}
+    return values.get(SETTINGS_VERSION_KEY, ""), values
 
 
 # ---------- catalog ----------
+@_timed
 def get_categories():
     with connect() as conn:
         cur = conn.execute(
@@ -57,6 +287,7 @@ def get_categories():
         return dicts(cur)
 
 
+@_timed
 def get_subcategories(category: str):
     if not category:
         return []
@@ -66,8 +297,8 @@ def get_subcategories(category: str):
             SELECT COALESCE(subcategory,'') AS title
             FROM products
             WHERE is_active = 1 AND COALESCE(category,'') = ?
-            GROUP BY subcategory
-            ORDER BY subcategory
+            GROUP BY COALESCE(subcategory,'')
+            ORDER BY COALESCE(subcategory,'')
             """,
             (category,),
         )
@@ -93,6 +324,8 @@ def _row_to_product(r: dict) -> dict:
         "images_urls": images_urls,  # ✅ ОТДАЁМ НА ФРОНТ
 
         "description": r.get("description") or "",  # ← описание для фронта
+        # список карточек приходит без description — по этому флагу фронт решает, нужна ли кнопка
+        "has_description": bool((r.get("description") or "").strip()),
 
         # два поля для фронта: список и строка
         "sizes": sizes,
@@ -101,6 +334,7 @@ def _row_to_product(r: dict) -> dict:
     }
 
 
+@_timed
 def get_products(category=None, subcategory=None):
     # (можно оставить SELECT * — главное, чтобы в таблице реально была колонка images_urls)
     q = "SELECT * FROM products WHERE is_active = 1"
@@ -118,6 +352,53 @@ def get_products(category=None, subcategory=None):
         return [_row_to_product(r) for r in dicts(cur)]
 
 
+CATALOG_VERSION_KEY = "catalog_version"
+
+
+def get_catalog_version() -> str:
+    """Версия каталога (seed_from_csv меняет её при каждом импорте)."""
+    try:
+        return get_setting(CATALOG_VERSION_KEY, "")
+    except sqlite3.OperationalError:
+        # таблицы settings ещё нет — база не засеяна
+        return ""
+
+
+@_timed
+def load_catalog():
+    """(версия, все активные товары) одним согласованным чтением — для catalog.Snapshot."""
+    with connect() as conn:
+        conn.execute("BEGIN")
+        try:
+            cur = conn.execute("SELECT value FROM settings WHERE key = ?", (CATALOG_VERSION_KEY,))
+            row = cur.fetchone()
+            version = row[0] if row and row[0] is not None else ""
+        except sqlite3.OperationalError:
+            version = ""
+        cur = conn.execute("SELECT * FROM products WHERE is_active = 1 ORDER BY id DESC")
+        return version, [_row_to_product(r) for r in dicts(cur)]
+
+
+# SQLite по умолчанию ограничивает число параметров запроса
+_MAX_IN_PARAMS = 500
+
+
+@_timed
+def get_products_by_ids(ids) -> dict:
+    """{id: товар} для всех id корзины — одним запросом IN (...) (пачками по 500)."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    out = {}
+    with connect() as conn:
+        for start in range(0, len(ids), _MAX_IN_PARAMS):
+            chunk = ids[start:start + _MAX_IN_PARAMS]
+            marks = ",".join("?" * len(chunk))
+            cur = conn.execute(f"SELECT * FROM products WHERE id IN ({marks})", chunk)
+            for r in dicts(cur):
+                out[r["id"]] = _row_to_product(r)
+    return out
+
+
+@_timed
 def get_product(pid: int):
     with connect() as conn:
         cur = conn.execute("SELECT * FROM products WHERE id = ?", (pid,))
@@ -125,7 +406,93 @@ def get_product(pid: int):
         return _row_to_product(rows[0]) if rows else None
 
 
+# ---------- search ----------
+# веса bm25 по колонкам products_fts: title, description, category, subcategory
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0, 3.0)
+_MAX_SEARCH_TERMS = 8
+_WORD_RE = re.compile(r"\w+")
+
+
+def fold_search_text(text: str) -> str:
+    """Та же нормализация, что у индекса (migrations._fold): ё → е."""
+    return (text or "").lower().replace("ё", "е")
+
+
+def fts_query(text: str) -> str:
+    """Ввод пользователя → MATCH-выражение: все слова, каждое как префикс ("кро"* "найк"*)."""
+    # однобуквенные «префиксы» совпадают почти со всем каталогом — только тормозят bm25
+    words = [w for w in _WORD_RE.findall(fold_search_text(text)) if len(w) > 1][:_MAX_SEARCH_TERMS]
+    return " ".join(f'"{w}"*' for w in words)
+
+
+@_timed
+def search_products(text: str, limit: int = 20, offset: int = 0) -> list:
+    """
+    Полнотекстовый поиск по активным товарам, лучшие совпадения (bm25) первыми.
+    sqlite3.OperationalError, если products_fts нет (SQLite без FTS5).
+    """
+    match = fts_query(text)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    with connect() as conn:
+        cur = conn.execute(
+            f"""
+            SELECT p.* FROM (
+                SELECT rowid, bm25(products_fts, {weights}) AS score
+                FROM products_fts WHERE products_fts MATCH ?
+                ORDER BY score, rowid DESC LIMIT ? OFFSET ?
+            ) AS hit
+            JOIN products p ON p.id = hit.rowid
+            ORDER BY hit.score, p.id DESC
+            """,
+            (match, limit, offset),
+        )
+        return [_row_to_product(r) for r in dicts(cur)]
+
+
 # ---------- orders ----------
+def _insert_order(conn, order: dict) -> int:
+    cur = conn.execute(
+        """
+        INSERT INTO orders(user_id, username, full_name, phone, address, comment, telegram, total_price)
+        VALUES(?,?,?,?,?,?,?,?)
+        """,
+        (
+            order["user_id"],
+            order["username"],
+            order["full_name"],
+            order["phone"],
+            order["address"],
+            order["comment"],
+            order["telegram"],
+            order["total_price"],
+        ),
+    )
+    order_id = cur.lastrowid
+
+    if order.get("outbox"):
+        _insert_outbox(conn, order_id=order_id, **order["outbox"])
+
+    conn.executemany(
+        """
+        INSERT INTO order_items(order_id, product_id, size, qty, price)
+        VALUES(?,?,?,?,?)
+        """,
+        [
+            (
+                order_id,
+                it["product_id"],
+                it.get("size"),
+                it.get("qty", 1),
+                it.get("price", 0),
+            )
+            for it in order["items"]
+        ],
+    )
+    return order_id
+
+
 def create_order(
     user_id: int,
     username: str,
@@ -136,30 +503,97 @@ def create_order(
     telegram: str,
     total_price: int,
     items: list,
+    outbox: Optional[dict] = None,
 ):
+    return create_orders([{
+        "user_id": user_id,
+        "username": username,
+        "full_name": full_name,
+        "phone": phone,
+        "address": address,
+        "comment": comment,
+        "telegram": telegram,
+        "total_price": total_price,
+        "items": items,
+        "outbox": outbox,
+    }])[0]
+
+
+@_timed
+def create_orders(orders: list) -> list:
+    """
+    Несколько заказов (dict с полями create_order) одной транзакцией — group commit
+    для очереди записи в db_async. Возвращает id в том же порядке.
+    outbox={"kind", "chat_ids", "payload"} — уведомления о заказе в той же транзакции.
+    """
+    with connect() as conn:
+        return [_insert_order(conn, o) for o in orders]
+
+
+# ---------- outbox ----------
+def _insert_outbox(conn, kind: str, chat_ids, payload: dict, order_id: Optional[int] = None) -> None:
+    now = time.time()
+    if order_id is not None:
+        payload = dict(payload, order_id=order_id)
+    body = json.dumps(payload, ensure_ascii=False)
+    conn.executemany(
+        "INSERT INTO outbox(created_at, kind, chat_id, payload, next_attempt_at) VALUES(?,?,?,?,?)",
+        [(now, kind, int(cid), body, now) for cid in chat_ids],
+    )
+
+
+@_timed
+def claim_outbox(limit: int, lease_s: float) -> list:
+    """
+    Забирает до limit готовых к отправке сообщений и откладывает их на lease_s —
+    другой диспетчер (или этот после падения) возьмёт их только по истечении аренды.
+    """
+    if limit <= 0:
+        return []
+    now = time.time()
     with connect() as conn:
         cur = conn.execute(
             """
-            INSERT INTO orders(user_id, username, full_name, phone, address, comment, telegram, total_price)
-            VALUES(?,?,?,?,?,?,?,?)
+            UPDATE outbox SET next_attempt_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            )
+            RETURNING id, kind, chat_id, payload, attempts
             """,
-            (user_id, username, full_name, phone, address, comment, telegram, total_price),
+            (now + lease_s, now, limit),
         )
-        order_id = cur.lastrowid
-
-        for it in items:
-            conn.execute(
-                """
-                INSERT INTO order_items(order_id, product_id, size, qty, price)
-                VALUES(?,?,?,?,?)
-                """,
-                (
-                    order_id,
-                    it["product_id"],
-                    it.get("size"),
-                    it.get("qty", 1),
-                    it.get("price", 0),
-                ),
-            )
-        conn.commit()
-        return order_id
+        return dicts(cur)
+
+
+@_timed
+def finish_outbox(msg_id: int, status: str, retry_in: Optional[float] = None, error: str = "") -> None:
+    """status: sent | failed | pending (тогда retry_in — через сколько секунд повторить)."""
+    now = time.time()
+    with connect() as conn:
+        conn.execute(
+            """
+            UPDATE outbox
+            SET status = ?, sent_at = ?, next_attempt_at = COALESCE(?, next_attempt_at), last_error = ?
+            WHERE id = ?
+            """,
+            (
+                status,
+                now if status == "sent" else None,
+                now + retry_in if retry_in is not None else None,
+                error[:500] or None,
+                msg_id,
+            ),
+        )
+
+
+@_timed
+def prune_outbox(older_than_s: float) -> int:
+    """Удаляет давно доставленные сообщения; неотправленные (failed) остаются для разбора."""
+    with connect() as conn:
+        cur = conn.execute(
+            "DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?",
+            (time.time() - older_than_s,),
+        )
+        return cur.rowcount
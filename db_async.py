@@ -0,0 +1,168 @@
+"""
+Асинхронный доступ к БД для aiohttp-хэндлеров и хэндлеров бота.
+
+Те же функции, что в db.py, но с await: запросы выполняются в отдельном
+ограниченном пуле потоков (DB_THREADS), соединения берутся из db.get_pool()
+(долгоживущие, с настроенными PRAGMA; DB_POOL_SIZE >= DB_THREADS — без ожиданий). Медленный запрос или блокировка записи во время /sync
+больше не останавливают event loop (а с ним и витрину, и polling бота).
+"""
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import db
+
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+# group commit заказов: сколько максимум в одной транзакции и сколько ждать попутчиков
+ORDER_BATCH_MAX     = int(os.getenv("ORDER_BATCH_MAX", "32"))
+ORDER_BATCH_WAIT_MS = float(os.getenv("ORDER_BATCH_WAIT_MS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+
+async def run(fn, *args, **kwargs):
+    """Выполнить синхронную функцию работы с БД в пуле DB-потоков."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+# ---------- settings ----------
+async def get_setting(key: str, default: str = "") -> str:
+    return await run(db.get_setting, key, default)
+
+
+async def set_setting(key: str, value: str) -> None:
+    await run(db.set_setting, key, value)
+
+
+async def get_logo_url() -> str:
+    return await run(db.get_logo_url)
+
+
+# ---------- catalog ----------
+async def get_categories():
+    return await run(db.get_categories)
+
+
+async def get_subcategories(category: str):
+    return await run(db.get_subcategories, category)
+
+
+async def get_products(category=None, subcategory=None):
+    return await run(db.get_products, category, subcategory)
+
+
+async def get_product(pid: int):
+    return await run(db.get_product, pid)
+
+
+async def get_products_by_ids(ids):
+    return await run(db.get_products_by_ids, ids)
+
+
+async def get_catalog_version() -> str:
+    return await run(db.get_catalog_version)
+
+
+async def load_catalog():
+    return await run(db.load_catalog)
+
+
+async def search_products(text: str, limit: int = 20, offset: int = 0):
+    return await run(db.search_products, text, limit, offset)
+
+
+# ---------- orders ----------
+class OrderWriter:
+    """
+    Очередь записи заказов. Один писатель забирает всё, что накопилось
+    (до ORDER_BATCH_MAX), и коммитит пачку одной транзакцией db.create_orders —
+    в час пик это один fsync на несколько заказов вместо одного на каждый.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, order: dict) -> int:
+        fut = self.loop.create_future()
+        await self._queue.put((order, fut))
+        return await fut
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if ORDER_BATCH_WAIT_MS > 0 and self._queue.empty():
+                await asyncio.sleep(ORDER_BATCH_WAIT_MS / 1000)
+            while len(batch) < ORDER_BATCH_MAX and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._commit(batch)
+
+    async def _commit(self, batch):
+        try:
+            ids = await run(db.create_orders, [order for order, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                _resolve(batch[0][1], error=e)
+                return
+            # один кривой заказ не должен ронять соседей по пачке
+            logging.warning("order batch of %d failed (%s), retrying one by one", len(batch), e)
+            for item in batch:
+                await self._commit([item])
+            return
+        for (_, fut), order_id in zip(batch, ids):
+            _resolve(fut, result=order_id)
+
+
+def _resolve(fut: asyncio.Future, result=None, error: Optional[BaseException] = None) -> None:
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+_writer: Optional[OrderWriter] = None
+
+
+def _get_writer() -> OrderWriter:
+    global _writer
+    if _writer is None or _writer.loop is not asyncio.get_running_loop():
+        _writer = OrderWriter()
+    return _writer
+
+
+async def create_order(
+    user_id: int,
+    username: str,
+    full_name: str,
+    phone: str,
+    address: str,
+    comment: str,
+    telegram: str,
+    total_price: int,
+    items: list,
+    outbox: Optional[dict] = None,
+):
+    return await _get_writer().submit({
+        "user_id": user_id,
+        "username": username,
+        "full_name": full_name,
+        "phone": phone,
+        "address": address,
+        "comment": comment,
+        "telegram": telegram,
+        "total_price": total_price,
+        "items": items,
+        "outbox": outbox,
+    })
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=True)
@@ -0,0 +1,153 @@
+"""
+Условные ответы (ETag / Last-Modified → 304) и заранее сжатые тела для JSON API.
+
+Payload держит исходные байты и лениво, один раз на объект, кодирует gzip/br.
+Снимок каталога (catalog.py) создаёт Payload'ы на каждую catalog_version,
+поэтому сжатие выполняется один раз на версию, а не на каждый запрос.
+
+Уровни два: precompress() (статика при старте, снимок каталога в потоке БД) жмёт
+максимально, а ленивое сжатие на первом запросе идёт прямо в event loop — там быстрый
+уровень (на 600 КБ JSON: ~12 мс против ~75 мс, ответ крупнее на ~2–3%).
+"""
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from email.utils import formatdate
+from typing import Optional
+
+from aiohttp import web
+
+try:
+    import brotli  # опционально: без него отдаём только gzip
+except Exception:
+    brotli = None
+
+# маленькие ответы сжимать смысла нет — заголовки съедят выигрыш
+MIN_COMPRESS_SIZE = 512
+
+_SUFFIX = {"gzip": "-gz", "br": "-br"}
+
+
+# (brotli quality, gzip level): офлайн / на запросе
+_LEVELS = {True: (9, 9), False: (5, 6)}
+
+
+def _encode(raw: bytes, coding: str, best: bool = False) -> bytes:
+    br_quality, gz_level = _LEVELS[best]
+    if coding == "br":
+        # quality=11 на мегабайтном каталоге — секунды; 9 почти так же компактно и в ~40 раз быстрее
+        return brotli.compress(raw, quality=br_quality)
+    return gzip.compress(raw, compresslevel=gz_level, mtime=0)
+
+
+class Payload:
+    """Сериализованное тело ответа + его сжатые варианты."""
+
+    __slots__ = ("raw", "etag", "content_type", "last_modified", "_encoded")
+
+    def __init__(self, raw: bytes, content_type: str = "application/json", last_modified: Optional[float] = None):
+        self.raw = raw
+        self.etag = hashlib.sha256(raw).hexdigest()[:32]
+        self.content_type = content_type
+        self.last_modified = last_modified  # unix time или None
+        self._encoded = {}
+
+    def body(self, coding: Optional[str]) -> bytes:
+        if not coding:
+            return self.raw
+        data = self._encoded.get(coding)
+        if data is None:
+            data = _encode(self.raw, coding)
+            self._encoded[coding] = data
+        return data
+
+    def precompress(self) -> None:
+        """
+        Закодировать все варианты сразу и с максимальным уровнем — вызывать вне event loop
+        (статика: при старте; снимок каталога: в потоке БД), а не на первом запросе.
+        """
+        if len(self.raw) >= MIN_COMPRESS_SIZE:
+            self._encoded["gzip"] = _encode(self.raw, "gzip", best=True)
+            if brotli is not None:
+                self._encoded["br"] = _encode(self.raw, "br", best=True)
+
+    def etag_for(self, coding: Optional[str]) -> str:
+        # сильный ETag должен различаться у разных Content-Encoding
+        return f'"{self.etag}{_SUFFIX.get(coding, "")}"'
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br > gzip > identity по заголовку Accept-Encoding (учитывая q=0)."""
+    allowed = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        allowed[name.strip()] = q
+
+    def ok(name):
+        if name in allowed:
+            return allowed[name] > 0
+        return allowed.get("*", 0) > 0
+
+    if brotli is not None and ok("br"):
+        return "br"
+    if ok("gzip"):
+        return "gzip"
+    return None
+
+
+def _not_modified(request: web.BaseRequest, payload: Payload) -> bool:
+    inm = request.if_none_match
+    if inm:
+        for tag in inm:
+            value = tag.value
+            if value == "*":
+                return True
+            for suffix in _SUFFIX.values():
+                if value.endswith(suffix):
+                    value = value[: -len(suffix)]
+                    break
+            if value == payload.etag:
+                return True
+        return False
+
+    ims = request.if_modified_since
+    if ims is not None and payload.last_modified is not None:
+        lm = datetime.fromtimestamp(int(payload.last_modified), tz=timezone.utc)
+        return lm <= ims
+    return False
+
+
+def respond(request: web.BaseRequest, payload: Payload, cache_control: str = "no-cache") -> web.Response:
+    """200 со сжатым/несжатым телом или 304, если у клиента та же версия."""
+    coding = None
+    if len(payload.raw) >= MIN_COMPRESS_SIZE:
+        coding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+
+    headers = {
+        "ETag": payload.etag_for(coding),
+        "Vary": "Accept-Encoding",
+        "Cache-Control": cache_control,
+    }
+    if payload.last_modified is not None:
+        headers["Last-Modified"] = formatdate(payload.last_modified, usegmt=True)
+
+    if _not_modified(request, payload):
+        return web.Response(status=304, headers=headers)
+
+    if coding:
+        headers["Content-Encoding"] = coding
+    return web.Response(
+        body=payload.body(coding),
+        headers=headers,
+        content_type=payload.content_type,
+        charset="utf-8",
+    )
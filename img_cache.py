@@ -0,0 +1,273 @@
+"""
+Дисковый кэш для /img (прокси картинок).
+
+Файлы лежат рядом с БД (на том же Volume, что и DB_PATH): <dir>/<ab>/<sha256(url)>.
+Индекс — отдельный маленький SQLite (index.sqlite) с размером, типом и временем
+последнего доступа, поэтому переживает рестарты и годится для нескольких процессов.
+Запись crash-safe: временный файл в той же папке + os.replace, строка индекса — после.
+При превышении бюджета удаляем самые давно читанные записи (LRU).
+
+get() вызывается из event loop и в SQLite не ходит: ключ → (размер, тип) держим в памяти
+процесса вместе с суммарным размером. Записи, которые положил другой воркер, находит
+lookup() — он, как и put/put_file, работает в потоке (executor).
+"""
+import hashlib
+import logging
+import os
+import os.path as op
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Optional
+
+DB_PATH = os.getenv("DB_PATH", "data.sqlite")
+
+IMG_CACHE_DIR = os.getenv("IMG_CACHE_DIR", "").strip() or op.join(op.dirname(op.abspath(DB_PATH)), "img_cache")
+IMG_CACHE_MAX_BYTES = int(float(os.getenv("IMG_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+# время доступа пишем в индекс пачками, а не на каждый хит
+_TOUCH_FLUSH_INTERVAL = 5.0
+
+
+class Entry(NamedTuple):
+    path: str
+    size: int
+    content_type: str
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, root: str = IMG_CACHE_DIR, max_bytes: int = IMG_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            op.join(root, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,  # autocommit, транзакции открываем явно
+            timeout=10,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries(
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+
+        # индекс в памяти: get() берёт только _mem_lock (без SQLite); _lock — для соединения
+        self._mem_lock = threading.Lock()
+        self._index = {
+            key: (size, ctype or "application/octet-stream")
+            for key, size, ctype in self._conn.execute("SELECT key, size, content_type FROM entries")
+        }
+        self._total = sum(size for size, _ in self._index.values())
+
+        self._touched = {}
+        self._flushed_at = time.monotonic()
+        self._cleanup_tmp()
+
+    # ---------- файлы ----------
+    def _path(self, key: str) -> str:
+        return op.join(self.root, key[:2], key)
+
+    def _cleanup_tmp(self) -> None:
+        """Недописанные временные файлы после падения процесса."""
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".tmp"):
+                    _remove_quietly(op.join(dirpath, name))
+
+    # ---------- чтение ----------
+    def get(self, url: str) -> Optional[Entry]:
+        """Из индекса в памяти — можно звать прямо из event loop."""
+        key = cache_key(url)
+        with self._mem_lock:
+            hit = self._index.get(key)
+        if hit is None:
+            return None
+        path = self._path(key)
+        if not op.isfile(path):
+            # файл удалил другой процесс / руками — строку индекса подчистит lookup()
+            self._forget(key)
+            return None
+        with self._mem_lock:
+            self._touched[key] = time.time()
+        return Entry(path, hit[0], hit[1])
+
+    def lookup(self, url: str) -> Optional[Entry]:
+        """
+        get() с проверкой SQLite-индекса (запись мог сделать другой воркер).
+        Вызывать из потока (executor), не из event loop.
+        """
+        entry = self.get(url)
+        if entry is not None:
+            self._maybe_flush()
+            return entry
+        key = cache_key(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, content_type FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            path = self._path(key)
+            if not op.isfile(path):
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+        entry = Entry(path, row[0], row[1] or "application/octet-stream")
+        self._remember(key, entry.size, entry.content_type)
+        with self._mem_lock:
+            self._touched[key] = time.time()
+        self._maybe_flush()
+        return entry
+
+    def _remember(self, key: str, size: int, content_type: str) -> None:
+        with self._mem_lock:
+            old = self._index.get(key)
+            self._index[key] = (size, content_type)
+            self._total += size - (old[0] if old else 0)
+
+    def _forget(self, key: str) -> None:
+        with self._mem_lock:
+            old = self._index.pop(key, None)
+            if old:
+                self._total -= old[0]
+            self._touched.pop(key, None)
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._flushed_at > _TOUCH_FLUSH_INTERVAL:
+            with self._lock:
+                self._flush_touched()
+
+    def _flush_touched(self) -> None:
+        # под self._lock; время доступа забираем из памяти атомарно
+        with self._mem_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                [(ts, key) for key, ts in touched.items()],
+            )
+            self._conn.execute("COMMIT")
+        self._flushed_at = time.monotonic()
+
+    # ---------- запись ----------
+    def tmp_file(self, url: str):
+        """(fd, путь) временного файла в папке будущей записи — для потоковой закачки."""
+        path = self._path(cache_key(url))
+        os.makedirs(op.dirname(path), exist_ok=True)
+        return tempfile.mkstemp(dir=op.dirname(path), suffix=".tmp")
+
+    def put(self, url: str, data: bytes, content_type: str) -> Optional[Entry]:
+        """Атомарно кладёт тело в кэш. Вызывать из потока (executor), не из event loop."""
+        if len(data) > self.max_bytes:
+            return None
+        fd, tmp = self.tmp_file(url)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except Exception:
+            _remove_quietly(tmp)
+            raise
+        return self.put_file(url, tmp, content_type)
+
+    def put_file(self, url: str, tmp: str, content_type: str) -> Optional[Entry]:
+        """Переносит уже записанный tmp_file() в кэш (fsync + rename + индекс)."""
+        try:
+            size = op.getsize(tmp)
+            if size > self.max_bytes:
+                _remove_quietly(tmp)
+                return None
+            with open(tmp, "rb+") as f:
+                os.fsync(f.fileno())
+            key = cache_key(url)
+            path = self._path(key)
+            os.replace(tmp, path)
+        except Exception:
+            _remove_quietly(tmp)
+            raise
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO entries(key, url, size, content_type, created_at, accessed_at)
+                VALUES(?,?,?,?,?,?)
+                ON CONFLICT(key) DO UPDATE SET
+                    size = excluded.size,
+                    content_type = excluded.content_type,
+                    created_at = excluded.created_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (key, url, size, content_type, now, now),
+            )
+            self._remember(key, size, content_type)
+            if time.monotonic() - self._flushed_at > _TOUCH_FLUSH_INTERVAL:
+                self._flush_touched()
+            # сумма считается по ходу; полный SUM — только когда бюджет, похоже, превышен
+            if self._total > self.max_bytes:
+                self._evict()
+        return Entry(path, size, content_type)
+
+    def _evict(self) -> None:
+        # в индекс пишут и другие воркеры — перед вытеснением сверяем реальный размер
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            with self._mem_lock:
+                self._total = min(self._total, total)
+            return
+        self._flush_touched()
+        removed = 0
+        while total > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.execute("BEGIN")
+            for key, size in rows:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                _remove_quietly(self._path(key))
+                self._forget(key)
+                total -= size
+                removed += 1
+                if total <= self.max_bytes:
+                    break
+            self._conn.execute("COMMIT")
+        logging.info("img cache: evicted %d entries, %d bytes left", removed, total)
+
+    def stats(self) -> dict:
+        """Из индекса в памяти этого процесса (дёшево — вызывается на каждый скрейп /metrics)."""
+        with self._mem_lock:
+            count, size = len(self._index), self._total
+        return {"entries": count, "bytes": size, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._flush_touched()
+            finally:
+                self._conn.close()
@@ -0,0 +1,304 @@
+"""
+Закачка картинок для /img: общий ClientSession с пулом соединений и single-flight.
+Там же — уменьшенные варианты (thumbs.render_variant в пуле процессов).
+
+Одновременные запросы одного и того же URL ждут одну закачку. Тело не держим в памяти:
+оно потоком пишется во временный файл DiskCache (запись — в executor) и затем переносится
+в кэш, а клиенту отдаётся уже с диска. Картинка больше IMG_MAX_OBJECT_BYTES в кэш не идёт:
+уже открытый ответ upstream раздаётся потоком (Relay) всем, кто ждал этот URL, —
+без второго запроса к хосту.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+import metrics
+import thumbs
+from img_cache import DiskCache, Entry, _remove_quietly
+
+IMG_POOL_LIMIT = int(os.getenv("IMG_POOL_LIMIT", "100"))
+IMG_POOL_PER_HOST = int(os.getenv("IMG_POOL_PER_HOST", "8"))
+IMG_FETCH_TIMEOUT = float(os.getenv("IMG_FETCH_TIMEOUT", "30"))
+# больше — не кэшируем, а проксируем потоком (фото с телефона ~5-15 МБ, видео/архивы — мимо)
+IMG_MAX_OBJECT_BYTES = int(os.getenv("IMG_MAX_OBJECT_BYTES", str(32 * 1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+WRITE_BUFFER = 1024 * 1024   # на диск — пачками через executor, а не write() на каждый чанк
+RELAY_BUFFER_CHUNKS = 16     # столько чанков ждёт медленного клиента, дальше закачка притормаживает
+
+
+def make_session() -> ClientSession:
+    """Долгоживущая сессия: keep-alive и лимиты соединений на хост (vk/Drive/GitHub)."""
+    connector = TCPConnector(
+        limit=IMG_POOL_LIMIT,
+        limit_per_host=IMG_POOL_PER_HOST,
+        keepalive_timeout=30,
+        ttl_dns_cache=300,
+    )
+    return ClientSession(
+        connector=connector,
+        timeout=ClientTimeout(total=IMG_FETCH_TIMEOUT, sock_connect=10),
+    )
+
+
+class RelayStream:
+    """Тело большой картинки для одного клиента: async for chunk in stream.chunks()."""
+
+    def __init__(self, relay: "Relay"):
+        self.relay = relay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=RELAY_BUFFER_CHUNKS)
+
+    @property
+    def content_type(self) -> str:
+        return self.relay.content_type
+
+    @property
+    def content_length(self) -> Optional[int]:
+        return self.relay.content_length
+
+    async def chunks(self):
+        while True:
+            chunk = await self._queue.get()
+            if chunk is None:
+                raise ConnectionError("upstream aborted")
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        """Клиент ушёл (или дочитал): больше не пишем ему и не ждём его очередь."""
+        if self in self.relay.streams:
+            self.relay.streams.remove(self)
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+
+class Relay:
+    """Слушатели одной закачки — на случай, если ответ окажется больше IMG_MAX_OBJECT_BYTES."""
+
+    def __init__(self):
+        self.started = False
+        self.content_type = "application/octet-stream"
+        self.content_length: Optional[int] = None
+        self.streams: List[RelayStream] = []
+
+    def listen(self) -> RelayStream:
+        stream = RelayStream(self)
+        self.streams.append(stream)
+        return stream
+
+    async def send(self, chunk: bytes) -> bool:
+        """False — слушать уже некому, закачку можно бросать."""
+        for stream in list(self.streams):
+            await stream._queue.put(chunk)
+        return bool(self.streams)
+
+    def abort(self) -> None:
+        for stream in list(self.streams):
+            stream.close()
+            stream._queue.put_nowait(None)
+
+
+class FetchResult(NamedTuple):
+    status: int
+    entry: Optional[Entry] = None
+    stream: Optional[RelayStream] = None  # больше IMG_MAX_OBJECT_BYTES — тело потоком, мимо кэша
+
+
+class ImageFetcher:
+    def __init__(self, session: ClientSession, cache: DiskCache, pool: Optional[Executor] = None,
+                 max_object_bytes: int = IMG_MAX_OBJECT_BYTES):
+        self.session = session
+        self.cache = cache
+        self.pool = pool  # пул процессов для thumbs.render_variant
+        self.max_object_bytes = min(max_object_bytes, cache.max_bytes)
+        self._inflight: Dict[str, Tuple[asyncio.Task, Relay]] = {}
+        self._pumps = set()
+
+    async def _single_flight(self, key: str, make_coro, stream: bool = False) -> FetchResult:
+        flight = self._inflight.get(key)
+        # раздача потоком уже пошла — новому клиенту её начала не достанется, нужна своя закачка
+        if flight is None or flight[1].started:
+            relay = Relay()
+            task = asyncio.create_task(make_coro(relay))
+            flight = self._inflight[key] = (task, relay)
+            task.add_done_callback(
+                lambda t: self._inflight.pop(key, None) if self._inflight.get(key, (None,))[0] is t else None
+            )
+        task, relay = flight
+        # слушателя регистрируем до ожидания: поток может начаться, пока мы не проснулись
+        listener = relay.listen() if stream else None
+        try:
+            # отмена одного ожидающего (клиент ушёл) не должна рвать закачку остальным
+            res = await asyncio.shield(task)
+        except BaseException:
+            if listener is not None:
+                listener.close()
+            raise
+        if res.stream is None:
+            if listener is not None:
+                listener.close()
+            return res
+        return res._replace(stream=listener)
+
+    async def fetch(self, url: str, stream: bool = True) -> FetchResult:
+        """stream=False — только для кэша (исходник для ресайза): большой ответ вернётся без тела."""
+        return await self._single_flight(
+            url, lambda relay: self._lookup_or(url, lambda: self._download(url, relay)), stream
+        )
+
+    async def _lookup_or(self, key: str, make_coro) -> FetchResult:
+        # в памяти этого процесса нет — возможно, файл уже скачал/отрисовал другой воркер
+        loop = asyncio.get_running_loop()
+        entry = await loop.run_in_executor(None, self.cache.lookup, key)
+        if entry is not None:
+            return FetchResult(200, entry)
+        return await make_coro()
+
+    async def variant(self, url: str, local_path: Optional[str], width: int, fmt: str) -> FetchResult:
+        """
+        Уменьшенная копия: url — ключ источника (для локальных файлов — file://...),
+        local_path — путь к файлу, если источник не нужно качать.
+        """
+        key = thumbs.variant_key(url, width, fmt)
+        entry = self.cache.get(key)
+        if entry:
+            return FetchResult(200, entry)
+        return await self._single_flight(
+            key, lambda _relay: self._lookup_or(key, lambda: self._render(key, url, local_path, width, fmt))
+        )
+
+    async def _render(self, key: str, url: str, local_path: Optional[str], width: int, fmt: str) -> FetchResult:
+        loop = asyncio.get_running_loop()
+        src = local_path
+        if src is None:
+            entry = self.cache.get(url)
+            if entry is None:
+                res = await self.fetch(url, stream=False)
+                if res.entry is None:
+                    return FetchResult(res.status)
+                entry = res.entry
+            src = entry.path
+
+        fd, tmp = await loop.run_in_executor(None, self.cache.tmp_file, key)
+        os.close(fd)
+        try:
+            ctype = await loop.run_in_executor(self.pool, thumbs.render_variant, src, tmp, width, fmt)
+        except BaseException:
+            _remove_quietly(tmp)
+            raise
+        if ctype is None:
+            # не картинка (или Pillow не смог) — пусть отдаётся оригинал
+            _remove_quietly(tmp)
+            return FetchResult(415)
+
+        entry = await loop.run_in_executor(None, self.cache.put_file, key, tmp, ctype)
+        if entry is None:
+            return FetchResult(413)
+        return FetchResult(200, entry)
+
+    async def _download(self, url: str, relay: Relay) -> FetchResult:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            res = await self._download_to_cache(url, relay)
+            status = str(res.status)
+            return res
+        finally:
+            metrics.IMG_UPSTREAM.observe(time.perf_counter() - started, status)
+
+    async def _download_to_cache(self, url: str, relay: Relay) -> FetchResult:
+        loop = asyncio.get_running_loop()
+        resp = await self.session.get(url)
+        try:
+            if resp.status != 200:
+                return FetchResult(resp.status)
+
+            ctype = resp.headers.get("Content-Type", "application/octet-stream")
+            if (resp.content_length or 0) > self.max_object_bytes:
+                return self._start_relay(relay, resp, ctype, None)
+
+            fd, tmp = await loop.run_in_executor(None, self.cache.tmp_file, url)
+            size = 0
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    buf = bytearray()
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        size += len(chunk)
+                        metrics.IMG_UPSTREAM_BYTES.inc(amount=len(chunk))
+                        buf += chunk
+                        if len(buf) >= WRITE_BUFFER or size > self.max_object_bytes:
+                            await loop.run_in_executor(None, f.write, bytes(buf))
+                            buf.clear()
+                        if size > self.max_object_bytes:
+                            break
+                    if buf:
+                        await loop.run_in_executor(None, f.write, bytes(buf))
+            except BaseException:
+                _remove_quietly(tmp)
+                raise
+
+            if size > self.max_object_bytes:
+                # прочитанное лежит в tmp — клиенты получат его первым, затем остаток из resp
+                return self._start_relay(relay, resp, ctype, tmp)
+        finally:
+            if not relay.started:
+                resp.release()
+
+        entry = await loop.run_in_executor(None, self.cache.put_file, url, tmp, ctype)
+        if entry is None:
+            return FetchResult(413)
+        logging.debug("img fetched %s (%d bytes)", url, size)
+        return FetchResult(200, entry)
+
+    def _start_relay(self, relay: Relay, resp, ctype: str, prefix: Optional[str]) -> FetchResult:
+        # синхронно до возврата из задачи: ждущие проснутся уже с включённой раздачей
+        relay.started = True
+        relay.content_type = ctype
+        relay.content_length = resp.content_length
+        pump = asyncio.create_task(self._pump(relay, resp, prefix))
+        self._pumps.add(pump)
+        pump.add_done_callback(self._pumps.discard)
+        # метка для _single_flight: каждый ждущий получит вместо неё свой RelayStream
+        return FetchResult(200, stream=RelayStream(relay))
+
+    async def _pump(self, relay: Relay, resp, prefix: Optional[str]) -> None:
+        loop = asyncio.get_running_loop()
+        done = False
+        try:
+            if prefix is not None:
+                f = await loop.run_in_executor(None, open, prefix, "rb")
+                try:
+                    while True:
+                        data = await loop.run_in_executor(None, f.read, WRITE_BUFFER)
+                        if not data:
+                            break
+                        if not await relay.send(data):
+                            return
+                finally:
+                    f.close()
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                metrics.IMG_UPSTREAM_BYTES.inc(amount=len(chunk))
+                if not await relay.send(chunk):
+                    return  # все клиенты ушли — дальше не качаем
+            await relay.send(b"")
+            done = True
+        except Exception as e:
+            logging.warning("img relay %s aborted: %s", resp.url, e)
+            relay.abort()
+        finally:
+            if not done:
+                # ответ мог целиком осесть в буфере, и соединение уже вернулось в пул по EOF —
+                # без этого чтение на нём так и останется на паузе
+                try:
+                    resp.content.read_nowait()
+                except Exception:
+                    pass
+            resp.close()
+            if prefix is not None:
+                _remove_quietly(prefix)
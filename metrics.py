@@ -0,0 +1,310 @@
+"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics).
+
+Без внешних зависимостей: счётчики, gauge и гистограммы с метками, потокобезопасные
+(запросы к БД идут из пула потоков). Запись — словарь + bisect под коротким lock'ом,
+так что оставлять включённым в проде можно. Значения, которые и так где-то считаются
+(пул соединений, DiskCache), снимаются в момент скрейпа через add_collector().
+
+Несколько web-воркеров на одном порту (workers.supervise, SO_REUSEPORT): скрейп попадает
+в случайный процесс, поэтому каждый воркер раз в METRICS_FLUSH_SEC (и при скрейпе) пишет
+снимок своих значений в METRICS_DIR/worker-<N>.json, а /metrics отдаёт сумму по всем
+файлам: счётчики и гистограммы складываются, gauge'и и collector'ы — с меткой worker="N".
+Перезапущенный воркер перезаписывает свой файл — для Prometheus это обычный сброс счётчика.
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import os.path as op
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# секунды: от быстрых ответов из снимка каталога до медленных закачек картинок
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_FLUSH_SEC = float(os.getenv("METRICS_FLUSH_SEC", "5"))
+
+_registry: List["_Metric"] = []
+_collectors: Dict[str, Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = {}
+
+# включается enable_multiprocess() в воркере workers.supervise
+_mp_dir: Optional[str] = None
+_mp_worker: Optional[str] = None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def state(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values: Optional[dict] = None, label_names: Optional[Tuple[str, ...]] = None) -> List[str]:
+        items = sorted((self.state() if values is None else values).items())
+        names = self.label_names if label_names is None else label_names
+        return self._header() + [f"{self.name}{_labels(names, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    @contextmanager
+    def track(self, *labels):
+        """В блоке значение +1 (in-flight)."""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # метки → [счётчики корзин..., +Inf, sum]
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {k: list(v) for k, v in self._values.items()}
+
+    def render(self, values: Optional[dict] = None, label_names: Optional[Tuple[str, ...]] = None) -> List[str]:
+        items = sorted((self.state() if values is None else values).items())
+        names = self.label_names if label_names is None else label_names
+        out = self._header()
+        for key, row in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                acc += n
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(names, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(names, key)} {_num(row[-1])}")
+            out.append(f"{self.name}_count{_labels(names, key)} {acc}")
+        return out
+
+
+def add_collector(key: str, fn: Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]) -> None:
+    """
+    fn() → [(имя, описание, {метки}, значение), ...] — gauge'и, снимаемые при скрейпе.
+    Повторная регистрация с тем же key заменяет прежнюю (новый build_app в том же процессе).
+    """
+    _collectors[key] = fn
+
+
+def _collect() -> list:
+    samples = []
+    for fn in list(_collectors.values()):
+        try:
+            samples.extend(fn())
+        except Exception:
+            continue
+    return samples
+
+
+def _render_samples(samples) -> List[str]:
+    lines, seen = [], set()
+    for name, doc, labels, value in samples:
+        if name not in seen:
+            seen.add(name)
+            lines += [f"# HELP {name} {doc}", f"# TYPE {name} gauge"]
+        names = tuple(labels)
+        lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_num(value)}")
+    return lines
+
+
+def render() -> str:
+    if _mp_dir is not None:
+        return _render_multiprocess()
+    lines = []
+    for m in _registry:
+        lines.extend(m.render())
+    lines += _render_samples(_collect())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- несколько воркеров ----------
+def enable_multiprocess(directory: str, worker: str) -> None:
+    """Вызывается в каждом web-воркере: снимок значений — в directory/worker-<worker>.json."""
+    global _mp_dir, _mp_worker
+    os.makedirs(directory, exist_ok=True)
+    _mp_dir, _mp_worker = directory, str(worker)
+    write_snapshot()
+
+    def loop():
+        while True:
+            time.sleep(METRICS_FLUSH_SEC)
+            try:
+                write_snapshot()
+            except Exception as e:
+                logging.warning("metrics snapshot failed: %s", e)
+
+    threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+
+
+def clear_snapshots(directory: str) -> None:
+    """Supervisor при старте: файлы прошлого запуска (другое число воркеров) не суммируем."""
+    for path in glob.glob(op.join(directory, "worker-*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_snapshot() -> None:
+    data = {
+        "metrics": {m.name: [[list(k), v] for k, v in m.state().items()] for m in _registry},
+        "samples": _collect(),
+    }
+    path = op.join(_mp_dir, f"worker-{_mp_worker}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_snapshots() -> List[Tuple[str, dict]]:
+    out = []
+    for path in sorted(glob.glob(op.join(_mp_dir, "worker-*.json"))):
+        worker = op.basename(path)[len("worker-"):-len(".json")]
+        try:
+            with open(path, encoding="utf-8") as f:
+                out.append((worker, json.load(f)))
+        except (OSError, ValueError):
+            continue  # воркер как раз пишет файл — возьмём в следующий скрейп
+    return out
+
+
+def _merge(kind: str, acc: dict, key: Tuple, value) -> None:
+    if kind == "histogram":
+        row = acc.get(key)
+        acc[key] = list(value) if row is None else [a + b for a, b in zip(row, value)]
+    else:
+        acc[key] = acc.get(key, 0.0) + value
+
+
+def _render_multiprocess() -> str:
+    write_snapshot()  # свои значения — самые свежие
+    snapshots = _read_snapshots()
+    lines = []
+    for m in _registry:
+        per_worker = m.kind == "gauge"
+        merged = {}
+        for worker, snap in snapshots:
+            for key, value in snap["metrics"].get(m.name, []):
+                key = tuple(key) + ((worker,) if per_worker else ())
+                _merge(m.kind, merged, key, value)
+        names = m.label_names + (("worker",) if per_worker else ())
+        lines.extend(m.render(merged, names))
+
+    samples = [
+        (name, doc, {**labels, "worker": worker}, value)
+        for worker, snap in snapshots
+        for name, doc, labels, value in snap["samples"]
+    ]
+    samples.sort(key=lambda s: s[0])  # заголовок HELP/TYPE — один на имя
+    lines += _render_samples(samples)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- метрики магазина ----------
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ("route", "method", "status"))
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP handler latency", ("route", "method", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled", ("route",))
+HTTP_COALESCED = Counter("http_coalesced_total", "GET requests answered by an identical in-flight request", ("route",))
+ADMISSION_REJECTED = Counter(
+    "http_admission_rejected_total", "Requests rejected by admission control", ("route", "reason")
+)
+
+DB_QUERY = Histogram("db_query_duration_seconds", "SQLite call duration (incl. pool wait)", ("op",))
+DB_ERRORS = Counter("db_query_errors_total", "SQLite calls that raised", ("op",))
+
+IMG_UPSTREAM = Histogram(
+    "img_upstream_fetch_seconds", "Upstream image fetch duration", ("status",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+IMG_UPSTREAM_BYTES = Counter("img_upstream_bytes_total", "Bytes downloaded from image hosts")
+IMG_REQUESTS = Counter("img_requests_total", "/img requests by cache result", ("result",))
+
+SYNC_DURATION = Histogram(
+    "catalog_sync_duration_seconds", "Catalog sync (download + import) duration", ("result",),
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+SYNC_ROWS = Gauge("catalog_sync_last_rows", "Row counts of the last catalog import", ("kind",))
+
+TELEGRAM_SEND = Histogram("telegram_send_seconds", "bot.send_message duration", ("result",))
+WEBHOOK_UPDATES = Counter("telegram_webhook_updates_total", "Webhook requests by result", ("result",))
+WEBHOOK_HANDLE = Histogram("telegram_update_seconds", "Update handling duration (webhook)")
+
+PROCESS_START = time.time()
+add_collector("process", lambda: [("process_start_time_seconds", "Process start (unix time)", {}, PROCESS_START)])
@@ -0,0 +1,226 @@
+"""
+Версионные миграции схемы по PRAGMA user_version.
+
+MIGRATIONS — упорядоченный список шагов (версия, описание, SQL или функция(conn)).
+migrate() применяет недостающие шаги в одной транзакции BEGIN IMMEDIATE (второй процесс,
+стартующий одновременно, подождёт и увидит уже новую версию) и запоминает,
+что для этой БД в этом процессе всё сделано — повторные вызовы ничего не стоят.
+
+Новая миграция = новый элемент в конце списка; старые не редактируем.
+"""
+import logging
+import os.path as op
+import sqlite3
+import threading
+
+import db
+
+MODELS_SQL = op.join(op.dirname(op.abspath(__file__)), "models.sql")
+
+
+def _statements(sql: str):
+    """Делит скрипт на отдельные выражения (conn.execute не умеет несколько сразу)."""
+    buf = ""
+    for line in sql.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            stmt = buf.strip()
+            if stmt:
+                yield stmt
+            buf = ""
+    if buf.strip() and sqlite3.complete_statement(buf + ";"):
+        yield buf.strip()
+
+
+def _columns(conn, table: str) -> set:
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+# ---------- шаги ----------
+def _m1_base_schema(conn):
+    # базы, созданные до миграций, уже содержат эти таблицы — всё через IF NOT EXISTS
+    with open(MODELS_SQL, encoding="utf-8") as f:
+        for stmt in _statements(f.read()):
+            conn.execute(stmt)
+    if "images_urls" not in _columns(conn, "products"):
+        conn.execute("ALTER TABLE products ADD COLUMN images_urls TEXT")
+
+
+# выражения в индексах повторяют WHERE в db.get_products / get_subcategories дословно —
+# иначе SQLite их не использует
+_M2_CATALOG_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_products_active_cat
+    ON products(is_active, COALESCE(category,''), id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_active_cat_sub
+    ON products(is_active, COALESCE(category,''), COALESCE(subcategory,''), id DESC);
+CREATE INDEX IF NOT EXISTS idx_order_items_order
+    ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_created
+    ON orders(created_at);
+"""
+
+
+def _m3_product_keys(conn):
+    # стабильный ключ строки таблицы (SKU или хэш title/category) + хэш содержимого —
+    # для инкрементального синка в seed_from_csv
+    cols = _columns(conn, "products")
+    if "row_key" not in cols:
+        conn.execute("ALTER TABLE products ADD COLUMN row_key TEXT")
+    if "row_hash" not in cols:
+        conn.execute("ALTER TABLE products ADD COLUMN row_hash TEXT")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_row_key ON products(row_key) WHERE row_key IS NOT NULL"
+    )
+
+
+def _fold(expr: str) -> str:
+    # unicode61 сам приводит регистр, но «ё» и «е» для него разные буквы; см. db.fold_search_text
+    return f"replace(replace(COALESCE({expr},''),'ё','е'),'Ё','Е')"
+
+
+def _fts_values(row: str) -> str:
+    return ", ".join(_fold(f"{row}.{c}") for c in ("title", "description", "category", "subcategory"))
+
+
+def _m4_product_search(conn):
+    # contentless FTS5: хранит только индекс (тексты уже лежат в products).
+    # В индексе только активные товары — поиск не фильтрует и не пагинирует «мимо» скрытых.
+    try:
+        conn.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                title, description, category, subcategory,
+                content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+            """
+        )
+    except sqlite3.OperationalError as e:
+        # SQLite без FTS5 — магазин работает, /api/search отвечает 503;
+        # v4 всё равно записывается, таблицу досоздаст _ensure_search, когда FTS5 появится
+        logging.warning("FTS5 unavailable, product search disabled: %s", e)
+        return
+
+    fts_cols = "rowid, title, description, category, subcategory"
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products
+        WHEN new.is_active = 1 BEGIN
+            INSERT INTO products_fts({fts_cols}) VALUES (new.id, {_fts_values("new")});
+        END
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products
+        WHEN old.is_active = 1 BEGIN
+            INSERT INTO products_fts(products_fts, {fts_cols}) VALUES ('delete', old.id, {_fts_values("old")});
+        END
+        """
+    )
+    # contentless-таблице при удалении нужны ровно те значения, что индексировались
+    conn.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS products_fts_au
+        AFTER UPDATE OF title, description, category, subcategory, is_active ON products BEGIN
+            INSERT INTO products_fts(products_fts, {fts_cols})
+                SELECT 'delete', old.id, {_fts_values("old")} WHERE old.is_active = 1;
+            INSERT INTO products_fts({fts_cols})
+                SELECT new.id, {_fts_values("new")} WHERE new.is_active = 1;
+        END
+        """
+    )
+    conn.execute(
+        f"INSERT INTO products_fts({fts_cols}) "
+        f"SELECT p.id, {_fts_values('p')} FROM products p WHERE p.is_active = 1"
+    )
+
+
+# уведомления пишутся в одной транзакции с заказом, доставляет outbox.OutboxDispatcher
+_M5_OUTBOX = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',   -- pending | sent | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at) WHERE status = 'pending';
+"""
+
+
+MIGRATIONS = [
+    (1, "base schema (models.sql) + products.images_urls", _m1_base_schema),
+    (2, "catalog / order indexes", _M2_CATALOG_INDEXES),
+    (3, "products.row_key / row_hash for incremental sync", _m3_product_keys),
+    (4, "products_fts (FTS5) + sync triggers for /api/search", _m4_product_search),
+    (5, "outbox for admin notifications", _M5_OUTBOX),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _apply(conn, step) -> None:
+    if callable(step):
+        step(conn)
+    else:
+        for stmt in _statements(step):
+            conn.execute(stmt)
+
+
+def current_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _has_search(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone() is not None
+
+
+def _ensure_search(conn) -> None:
+    """
+    v4 на SQLite без FTS5 проходит без products_fts. Если сборка SQLite с тех пор сменилась
+    (FTS5 есть, таблицы нет) — создаём индекс и триггеры сейчас, при старте процесса.
+    """
+    if current_version(conn) < 4 or _has_search(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")  # коммит/откат — with db.connect() в migrate()
+    if not _has_search(conn):
+        _m4_product_search(conn)
+        if _has_search(conn):
+            logging.info("DB: products_fts created (FTS5 is available now)")
+
+
+_migrated = set()
+_lock = threading.Lock()
+
+
+def migrate() -> int:
+    """Доводит схему db.DB_PATH до LATEST_VERSION. Возвращает итоговую версию."""
+    key = op.abspath(db.DB_PATH)
+    if key in _migrated:
+        return LATEST_VERSION
+
+    with _lock:
+        if key in _migrated:
+            return LATEST_VERSION
+        with db.connect() as conn:
+            version = current_version(conn)
+            if version < LATEST_VERSION:
+                conn.execute("BEGIN IMMEDIATE")
+                # пока ждали блокировку, другой процесс мог всё сделать
+                version = current_version(conn)
+                for v, title, step in MIGRATIONS:
+                    if v <= version:
+                        continue
+                    _apply(conn, step)
+                    conn.execute(f"PRAGMA user_version = {v}")
+                    logging.info("DB migrated to v%d: %s", v, title)
+                    version = v
+        with db.connect() as conn:
+            _ensure_search(conn)
+        _migrated.add(key)
+        return version
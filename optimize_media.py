@@ -0,0 +1,279 @@
+"""
+Офлайн-оптимизация медиа из images/ (запускать при сборке/деплое):
+
+    python optimize_media.py [--src images] [--force]
+
+Картинки (jpg/png) → WebP (и AVIF, если установлен pillow-avif-plugin) по ширинам
+WIDTHS, не больше исходной. Видео (mp4/mov/webm) → кадр-постер (jpg + webp) и
+облегчённый mp4 (H.264, до VIDEO_MAX_HEIGHT, без звука — hero всё равно muted); нужен ffmpeg.
+Результат — images/optimized/ + manifest.json; повторный запуск пересобирает только
+изменившиеся исходники (размер + mtime).
+
+MediaIndex читает манифест в bot.py: /images/<файл> отдаёт лучший вариант
+по Accept и ?w=, а без манифеста — оригинал.
+"""
+import argparse
+import json
+import logging
+import os
+import os.path as op
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import as_completed
+from typing import Optional
+
+import thumbs
+
+OUT_DIRNAME = "optimized"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+WIDTHS = (320, 640, 960, 1280, 1920)
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+VIDEO_EXTS = (".mp4", ".mov", ".webm")
+
+VIDEO_MAX_HEIGHT = int(os.getenv("VIDEO_MAX_HEIGHT", "720"))
+VIDEO_CRF = int(os.getenv("VIDEO_CRF", "28"))
+POSTER_AT_SEC = 0.5
+
+# порядок предпочтения при выборе по Accept (оригинал — в самом конце)
+FORMAT_PREFERENCE = ("avif", "webp")
+
+
+# ---------- сборка ----------
+def _source_stamp(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+def _image_size(path: str):
+    with thumbs.Image.open(path) as im:
+        im = thumbs.ImageOps.exif_transpose(im)
+        return im.width, im.height
+
+
+def _target_widths(width: int) -> list:
+    out = [w for w in WIDTHS if w < width]
+    out.append(min(width, WIDTHS[-1]))
+    return out
+
+
+def _image_jobs(name: str, src: str, out_dir: str, width: int) -> list:
+    stem = op.splitext(name)[0]
+    jobs = []
+    for fmt in ("avif", "webp"):
+        if fmt not in thumbs.FORMATS:
+            continue
+        for w in _target_widths(width):
+            rel = f"{OUT_DIRNAME}/{stem}.{w}.{fmt}"
+            jobs.append((src, op.join(out_dir, op.basename(rel)), w, fmt, rel))
+    return jobs
+
+
+def _ffmpeg(*args) -> None:
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", *args], check=True)
+
+
+def _optimize_video(name: str, src: str, out_dir: str) -> dict:
+    stem = op.splitext(name)[0]
+    entry = {"kind": "video", "variants": [], "poster": None}
+
+    poster_jpg = op.join(out_dir, f"{stem}.poster.jpg")
+    _ffmpeg("-ss", str(POSTER_AT_SEC), "-i", src, "-frames:v", "1", "-q:v", "3", poster_jpg)
+    entry["poster"] = f"{OUT_DIRNAME}/{stem}.poster.jpg"
+    if thumbs.available():
+        with thumbs.Image.open(poster_jpg) as im:
+            im.save(op.join(out_dir, f"{stem}.poster.webp"), "WEBP", quality=80, method=4)
+        entry["poster_webp"] = f"{OUT_DIRNAME}/{stem}.poster.webp"
+
+    small = op.join(out_dir, f"{stem}.{VIDEO_MAX_HEIGHT}p.mp4")
+    _ffmpeg(
+        "-i", src,
+        "-vf", f"scale=-2:'min({VIDEO_MAX_HEIGHT},ih)'",
+        "-c:v", "libx264", "-preset", "slow", "-crf", str(VIDEO_CRF),
+        "-pix_fmt", "yuv420p", "-movflags", "+faststart", "-an",
+        small,
+    )
+    if os.path.getsize(small) < os.path.getsize(src):
+        entry["variants"].append({
+            "path": f"{OUT_DIRNAME}/{stem}.{VIDEO_MAX_HEIGHT}p.mp4",
+            "type": "video/mp4",
+            "bytes": os.path.getsize(small),
+        })
+    else:
+        os.remove(small)  # исходник уже компактнее — отдаём его
+    return entry
+
+
+def load_manifest(src_dir: str) -> dict:
+    path = op.join(src_dir, OUT_DIRNAME, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == MANIFEST_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def _save_manifest(src_dir: str, manifest: dict) -> None:
+    path = op.join(src_dir, OUT_DIRNAME, MANIFEST_NAME)
+    fd, tmp = tempfile.mkstemp(dir=op.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def optimize(src_dir: str = "images", force: bool = False) -> dict:
+    """Собирает варианты для всех медиа в src_dir. Возвращает {built, skipped, failed}."""
+    out_dir = op.join(src_dir, OUT_DIRNAME)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"version": MANIFEST_VERSION, "files": {}} if force else load_manifest(src_dir)
+    old = manifest["files"]
+    files = {}
+    stats = {"built": 0, "skipped": 0, "failed": 0}
+    have_ffmpeg = shutil.which("ffmpeg") is not None
+
+    names = sorted(
+        fn for fn in os.listdir(src_dir)
+        if op.isfile(op.join(src_dir, fn)) and op.splitext(fn)[1].lower() in IMAGE_EXTS + VIDEO_EXTS
+    )
+    pending = {}  # name → (entry, [jobs])
+    for name in names:
+        src = op.join(src_dir, name)
+        stamp = _source_stamp(src)
+        prev = old.get(name)
+        if prev and prev.get("source") == stamp and all(
+            op.isfile(op.join(src_dir, v["path"])) for v in prev.get("variants", [])
+        ):
+            files[name] = prev
+            stats["skipped"] += 1
+            continue
+
+        ext = op.splitext(name)[1].lower()
+        if ext in VIDEO_EXTS:
+            if not have_ffmpeg:
+                print(f"skip {name}: ffmpeg not found")
+                continue
+            try:
+                entry = _optimize_video(name, src, out_dir)
+            except Exception as e:
+                print(f"FAILED {name}: {e}")
+                stats["failed"] += 1
+                continue
+            entry["source"] = stamp
+            files[name] = entry
+            stats["built"] += 1
+            continue
+
+        if not thumbs.available():
+            print(f"skip {name}: Pillow not installed")
+            continue
+        try:
+            width, height = _image_size(src)
+        except Exception as e:
+            print(f"FAILED {name}: {e}")
+            stats["failed"] += 1
+            continue
+        entry = {"kind": "image", "width": width, "height": height, "source": stamp, "variants": []}
+        pending[name] = (entry, _image_jobs(name, src, out_dir, width))
+
+    # кодирование картинок — параллельно в пуле процессов (как для /img)
+    if pending:
+        with thumbs.make_pool() as pool:
+            futures = {}
+            for name, (entry, jobs) in pending.items():
+                for src, dst, w, fmt, rel in jobs:
+                    fut = pool.submit(thumbs.render_variant, src, dst, w, fmt)
+                    futures[fut] = (name, entry, dst, w, fmt, rel)
+            for fut in as_completed(futures):
+                name, entry, dst, w, fmt, rel = futures[fut]
+                try:
+                    ctype = fut.result()
+                except Exception as e:
+                    print(f"FAILED {rel}: {e}")
+                    entry["failed"] = True
+                    continue
+                if ctype:
+                    entry["variants"].append({
+                        "path": rel, "width": w, "format": fmt, "type": ctype, "bytes": op.getsize(dst),
+                    })
+
+        for name, (entry, _) in pending.items():
+            if entry.pop("failed", False) or not entry["variants"]:
+                stats["failed"] += 1
+                continue
+            entry["variants"].sort(key=lambda v: (v["format"], v["width"]))
+            files[name] = entry
+            stats["built"] += 1
+
+    # варианты исходников, которых больше нет
+    keep = {v["path"] for e in files.values() for v in e.get("variants", [])}
+    keep |= {e[k] for e in files.values() for k in ("poster", "poster_webp") if e.get(k)}
+    for fn in os.listdir(out_dir):
+        rel = f"{OUT_DIRNAME}/{fn}"
+        if fn != MANIFEST_NAME and rel not in keep and not fn.endswith(".tmp"):
+            os.remove(op.join(out_dir, fn))
+
+    manifest = {"version": MANIFEST_VERSION, "generated_at": int(time.time()), "files": files}
+    _save_manifest(src_dir, manifest)
+    return stats
+
+
+# ---------- выбор варианта при отдаче ----------
+class MediaIndex:
+    """Манифест для отдачи /images/: какой файл отдать на запрос name + Accept + ?w=."""
+
+    def __init__(self, src_dir: str = "images"):
+        self.src_dir = src_dir
+        self.files = load_manifest(src_dir)["files"]
+
+    def entry(self, name: str) -> Optional[dict]:
+        return self.files.get(name)
+
+    def pick(self, name: str, accept: str, width: int = 0) -> Optional[dict]:
+        """
+        Лучший вариант картинки: первый из FORMAT_PREFERENCE, заявленный в Accept,
+        самой узкой ширины >= width (без width — самый широкий). None — отдавать оригинал.
+        """
+        entry = self.files.get(name)
+        if not entry or entry.get("kind") != "image":
+            return None
+        accept = accept or ""
+        for fmt in FORMAT_PREFERENCE:
+            if f"image/{fmt}" not in accept:
+                continue
+            variants = [v for v in entry["variants"] if v["format"] == fmt]
+            if not variants:
+                continue
+            if width:
+                fit = [v for v in variants if v["width"] >= width]
+                return min(fit, key=lambda v: v["width"]) if fit else max(variants, key=lambda v: v["width"])
+            return max(variants, key=lambda v: v["width"])
+        return None
+
+    def video(self, name: str) -> Optional[dict]:
+        entry = self.files.get(name)
+        if not entry or entry.get("kind") != "video":
+            return None
+        return entry
+
+    def path(self, rel: str) -> str:
+        return op.join(self.src_dir, rel)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Build WebP/AVIF image variants and video poster/lite versions.")
+    ap.add_argument("--src", default="images", help="Media directory (default: images)")
+    ap.add_argument("--force", action="store_true", help="Rebuild everything, ignoring the manifest")
+    args = ap.parse_args()
+    started = time.time()
+    res = optimize(args.src, force=args.force)
+    print(
+        f"Media optimized in {time.time() - started:.1f}s: "
+        f"{res['built']} built, {res['skipped']} unchanged, {res['failed']} failed"
+    )
@@ -0,0 +1,174 @@
+"""
+Доставка уведомлений из таблицы outbox.
+
+Заказ и уведомления о нём пишутся одной транзакцией (db.create_orders), поэтому
+/api/order отвечает сразу после коммита, а сообщение не теряется ни при медленном
+Telegram, ни при перезапуске. OutboxDispatcher забирает готовые строки с арендой
+(OUTBOX_LEASE_SEC), шлёт до OUTBOX_CONCURRENCY сообщений параллельно, соблюдая
+лимиты Telegram (общий OUTBOX_GLOBAL_RATE в секунду и OUTBOX_CHAT_INTERVAL на чат),
+и повторяет неудачи с экспоненциальной задержкой. Доставка — «хотя бы один раз».
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import db
+import db_async
+import metrics
+
+OUTBOX_CONCURRENCY   = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_GLOBAL_RATE   = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))     # сообщений/с (у Telegram ~30)
+OUTBOX_CHAT_INTERVAL = float(os.getenv("OUTBOX_CHAT_INTERVAL", "1.0"))  # с между сообщениями в один чат
+OUTBOX_MAX_ATTEMPTS  = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12"))
+OUTBOX_POLL_SEC      = float(os.getenv("OUTBOX_POLL_SEC", "5"))
+OUTBOX_LEASE_SEC     = float(os.getenv("OUTBOX_LEASE_SEC", "60"))
+
+BACKOFF_BASE_SEC = 2.0
+BACKOFF_MAX_SEC  = 600.0
+PRUNE_EVERY_SEC  = 3600.0
+KEEP_SENT_SEC    = 7 * 24 * 3600.0
+
+Send = Callable[[int, str], Awaitable[object]]
+
+
+def backoff(attempts: int) -> float:
+    """2, 4, 8 … до 10 минут, ±20% — чтобы повторы не шли строем."""
+    delay = min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class RateLimiter:
+    """
+    Слоты отправки: не чаще global_rate в секунду всего и раз в chat_interval на чат.
+    Слот резервируется сразу (один event loop — без блокировок), ждём уже своего времени.
+    """
+
+    def __init__(self, global_rate: float = OUTBOX_GLOBAL_RATE, chat_interval: float = OUTBOX_CHAT_INTERVAL):
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+        self._next_global = slot + self.global_interval
+        self._next_chat[chat_id] = slot + self.chat_interval
+        if len(self._next_chat) > 10000:
+            self._next_chat = {c: t for c, t in self._next_chat.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def defer(self, chat_id: int, seconds: float) -> None:
+        """Telegram ответил 429 retry_after — притормаживаем и чат, и всю отправку."""
+        until = time.monotonic() + seconds
+        self._next_global = max(self._next_global, until)
+        self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), until)
+
+
+class OutboxDispatcher:
+    def __init__(self, send: Send, renderers: Dict[str, Callable[[dict], str]]):
+        # send(chat_id, text) — отправка; renderers[kind](payload) -> текст сообщения
+        self.send = send
+        self.renderers = renderers
+        self.limiter = RateLimiter()
+        self._wake = asyncio.Event()
+        self._pruned_at = 0.0
+
+    def wake(self) -> None:
+        """Есть новые строки (например, только что закоммиченный заказ) — не ждать опроса."""
+        self._wake.set()
+
+    async def run(self) -> None:
+        """Бесконечный цикл доставки (запускать отдельной задачей, остановка — cancel)."""
+        inflight = set()
+        try:
+            while True:
+                free = OUTBOX_CONCURRENCY - len(inflight)
+                self._wake.clear()
+                try:
+                    rows = await db_async.run(db.claim_outbox, free, OUTBOX_LEASE_SEC)
+                    await self._maybe_prune()
+                except Exception as e:
+                    logging.warning("outbox poll failed: %s", e)
+                    rows = []
+                for row in rows:
+                    inflight.add(asyncio.create_task(self._deliver(row)))
+
+                # ждём: освободился слот, разбудили или пора опросить таблицу
+                waker = asyncio.create_task(self._wake.wait())
+                done, _ = await asyncio.wait(
+                    inflight | {waker}, timeout=OUTBOX_POLL_SEC, return_when=asyncio.FIRST_COMPLETED
+                )
+                waker.cancel()
+                inflight -= done
+        finally:
+            # недоставленное вернётся по истечении аренды
+            for t in inflight:
+                t.cancel()
+
+    async def _deliver(self, row: dict) -> None:
+        msg_id, chat_id, attempts = row["id"], row["chat_id"], row["attempts"]
+        try:
+            render = self.renderers[row["kind"]]
+            text = render(json.loads(row["payload"]))
+        except Exception as e:
+            logging.exception("outbox #%s: can't render %s: %s", msg_id, row["kind"], e)
+            return await self._finish(msg_id, "failed", error=f"render: {e}")
+
+        try:
+            await self.limiter.wait(chat_id)
+            await self._send(chat_id, text)
+        except TelegramRetryAfter as e:
+            self.limiter.defer(chat_id, e.retry_after)
+            return await self._retry(msg_id, attempts, f"retry after {e.retry_after}s", delay=e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # бот заблокирован / чата нет / кривой текст — повтор не поможет
+            logging.error("outbox #%s to %s failed permanently: %s", msg_id, chat_id, e)
+            return await self._finish(msg_id, "failed", error=str(e))
+        except Exception as e:
+            logging.warning("outbox #%s to %s failed (attempt %d): %s", msg_id, chat_id, attempts, e)
+            return await self._retry(msg_id, attempts, str(e))
+
+        await self._finish(msg_id, "sent")
+
+    async def _send(self, chat_id: int, text: str) -> None:
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            await self.send(chat_id, text)
+        except TelegramRetryAfter:
+            outcome = "retry_after"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.TELEGRAM_SEND.observe(time.perf_counter() - started, outcome)
+
+    async def _retry(self, msg_id: int, attempts: int, error: str, delay: float = None) -> None:
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logging.error("outbox #%s: giving up after %d attempts: %s", msg_id, attempts, error)
+            return await self._finish(msg_id, "failed", error=error)
+        await self._finish(msg_id, "pending", retry_in=delay if delay is not None else backoff(attempts), error=error)
+
+    async def _finish(self, msg_id: int, status: str, retry_in: float = None, error: str = "") -> None:
+        try:
+            await db_async.run(db.finish_outbox, msg_id, status, retry_in, error)
+        except Exception as e:
+            # строка останется в аренде и будет отправлена повторно — лучше дубль, чем потеря
+            logging.warning("outbox #%s: can't store status %s: %s", msg_id, status, e)
+
+    async def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now - self._pruned_at >= PRUNE_EVERY_SEC:
+            self._pruned_at = now
+            removed = await db_async.run(db.prune_outbox, KEEP_SENT_SEC)
+            if removed:
+                logging.info("outbox: pruned %d delivered messages", removed)
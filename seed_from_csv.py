@@ -1,29 +1,25 @@
 import csv
+import hashlib
+import json
 import os
-import sqlite3
+import time
 from pathlib import Path
 import argparse
 
+import db  # общий пул соединений (WAL, busy_timeout) — тот же, что у веб-приложения
+import migrations
+
 # --- настройки ---
 DB_PATH  = os.getenv("DB_PATH", "data.sqlite")
 CSV_FILE = os.getenv("CSV_FILE", "products_template.csv")  # дефолт, если не указан флаг
-MODELS_SQL = "models.sql"  # должен содержать таблицы products, orders, order_items, settings
+CATALOG_VERSION_KEY = "catalog_version"  # см. db.get_catalog_version / catalog.py
 
 
 # --- утилиты ---
 def ensure_schema():
-    sql = Path(MODELS_SQL).read_text(encoding="utf-8")
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.executescript(sql)
-        # ✅ миграция на случай, если база уже создана без images_urls
-        try:
-            conn.execute("ALTER TABLE products ADD COLUMN images_urls TEXT")
-            conn.commit()
-            print("DB migrated: products.images_urls added")
-        except Exception:
-            # колонка уже есть или таблицы ещё нет — ок
-            pass
-    print("DB schema ensured")
+    # ✅ models.sql + все миграции (migrations.py); в процессе выполняется один раз
+    version = migrations.migrate()
+    print(f"DB schema ensured (v{version})")
 
 
 def as_int(v, default=0):
@@ -42,14 +38,7 @@ def upsert_setting(cur, key: str, value: str) -> bool:
     value = (value or "").strip()
     if not value:
         return False
-    cur.execute(
-        """
-        INSERT INTO settings(key, value)
-        VALUES(?, ?)
-        ON CONFLICT(key) DO UPDATE SET value = excluded.value
-        """,
-        (key, value),
-    )
+    db.put_setting(cur, key, value)  # + settings_version: settings_store перечитает таблицу
     return True
 
 
@@ -65,6 +54,10 @@ def _clean_gallery(s: str) -> str:
         return ""
     raw = str(s).strip()
 
+    # частый случай — одна ссылка: без split/join
+    if "|" not in raw and "," not in raw:
+        return raw.replace("\n", " ")
+
     # если уже pipe-разделитель — оставляем
     if "|" in raw:
         parts = [p.strip() for p in raw.split("|")]
@@ -76,21 +69,39 @@ def _clean_gallery(s: str) -> str:
     return "|".join(parts)
 
 
-def insert_product(cur, row: dict) -> bool:
+PRODUCT_COLUMNS = (
+    "title", "category", "subcategory", "price",
+    "image_url", "images_urls",
+    "sizes", "is_active", "description",
+)
+
+PRODUCTS_INSERT_SQL = """
+    INSERT INTO products(
+        title, category, subcategory, price,
+        image_url, images_urls,
+        sizes, is_active, description,
+        row_key, row_hash
+    )
+    VALUES(?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+
+def product_values(row: dict):
     """
-    Обычная вставка товара.
+    Строка CSV → кортеж значений в порядке PRODUCT_COLUMNS (или None для спец-строк).
 
     Поддерживаемые поля CSV (регистр не важен):
       title, category, subcategory, price,
       image_url, images_urls,
-      sizes_text|sizes, is_active, description
+      sizes_text|sizes, is_active, description,
+      sku (необязательно — стабильный ключ товара)
 
     images_urls: несколько ссылок через | (pipe)
       пример: url1|url2|url3
     """
     title = (row.get("title") or "").strip()
     if not title or title in ("__LOGO__", "__HERO__"):
-        return False  # спец-строки не пишем в products
+        return None  # спец-строки не пишем в products
 
     image_url = (row.get("image_url") or "").strip()
     images_urls = _clean_gallery(row.get("images_urls") or "")
@@ -99,94 +110,404 @@ def insert_product(cur, row: dict) -> bool:
     if not images_urls and image_url:
         images_urls = image_url
 
-    cur.execute(
-        """
-        INSERT INTO products(
-            title, category, subcategory, price,
-            image_url, images_urls,
-            sizes, is_active, description
-        )
-        VALUES(?,?,?,?,?,?,?,?,?)
-        """,
-        (
-            title,
-            (row.get("category") or "").strip(),
-            (row.get("subcategory") or "").strip(),
-            as_int(row.get("price"), 0),
-            image_url,
-            images_urls,
-            (row.get("sizes_text") or row.get("sizes") or "").replace(" ", ""),
-            as_int(row.get("is_active"), 1),
-            (row.get("description") or "").strip(),
-        ),
+    return (
+        title,
+        (row.get("category") or "").strip(),
+        (row.get("subcategory") or "").strip(),
+        as_int(row.get("price"), 0),
+        image_url,
+        images_urls,
+        (row.get("sizes_text") or row.get("sizes") or "").replace(" ", ""),
+        as_int(row.get("is_active"), 1),
+        (row.get("description") or "").strip(),
     )
+
+
+def _base_key(title: str, category: str, subcategory: str) -> str:
+    raw = "\x1f".join((title, category or "", subcategory or ""))
+    return "h:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def _dedup_key(base: str, seen: dict) -> str:
+    # одинаковые title/category в таблице — различаем по порядку появления
+    n = seen.get(base, 0) + 1
+    seen[base] = n
+    return base if n == 1 else f"{base}#{n}"
+
+
+def row_hash(values: tuple) -> str:
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def insert_product(cur, row: dict, key: str = None) -> bool:
+    """Обычная вставка товара (без сравнения с БД)."""
+    values = product_values(row)
+    if values is None:
+        return False
+    cur.execute(PRODUCTS_INSERT_SQL, values + (key, row_hash(values)))
     return True
 
 
+def _existing_products(cur) -> dict:
+    """
+    {row_key: (id, row_hash)} для всех товаров. Товарам, заведённым до появления
+    row_key, ключ проставляется тут же — по тем же правилам, что и для строк CSV.
+    """
+    existing, seen, backfill = {}, {}, []
+    rows = cur.execute(
+        "SELECT id, row_key, row_hash, title, category, subcategory FROM products ORDER BY id"
+    ).fetchall()
+    for pid, key, h, title, category, subcategory in rows:
+        if key:
+            existing[key] = (pid, h)
+    for pid, key, h, title, category, subcategory in rows:
+        if key:
+            continue
+        key = _dedup_key(_base_key(title, category, subcategory), seen)
+        if key in existing:
+            continue  # дубль уже привязан — этот останется без ключа и будет выключен
+        existing[key] = (pid, h)
+        backfill.append((key, pid))
+    if backfill:
+        cur.executemany("UPDATE products SET row_key = ? WHERE id = ?", backfill)
+    return existing
+
+
 # --- основная логика ---
-def seed_from_csv(csv_path: str, clear: bool):
-    ensure_schema()
+PROGRESS_EVERY = 500  # строк между вызовами progress()
 
-    path = csv_path or CSV_FILE
-    if not Path(path).is_file():
-        raise FileNotFoundError(f"CSV file not found: {path}")
 
-    inserted = 0
-    logo_set = False
-    hero_set = False
+def _special_row(cur, row) -> str:
+    """
+    Спец-строки __LOGO__ / __HERO__ → settings. Возвращает сохранённый ключ,
+    "" для спец-строки без ссылки и None, если это обычный товар.
+    """
+    title = (row.get("title") or "").strip().upper()
+
+    # Спец-строка для ЛОГОТИПА
+    if title == "__LOGO__":
+        url = row.get("logo_url") or row.get("image_url") or ""
+        return "logo_url" if upsert_setting(cur, "logo_url", url) else ""
+
+    # Спец-строка для ВИДЕО/ГЕРОЯ
+    if title == "__HERO__":
+        url = row.get("hero_url") or row.get("image_url") or ""
+        return "hero_video_url" if upsert_setting(cur, "hero_video_url", url) else ""
+
+    return None
+
 
-    with sqlite3.connect(DB_PATH) as conn:
+def _row_key(row, values: tuple, dedup: dict) -> str:
+    sku = (row.get("sku") or "").strip()
+    return _dedup_key("sku:" + sku if sku else _base_key(*values[:3]), dedup)
+
+
+def _incremental_import(path: str, clear: bool, progress) -> tuple:
+    """Сравнение с БД в памяти: {row_key: (id, row_hash)} + executemany одним коммитом."""
+    summary = {"added": 0, "changed": 0, "deactivated": 0, "unchanged": 0}
+    saved = []
+
+    with db.connect() as conn:
         cur = conn.cursor()
 
         if clear:
             cur.execute("DELETE FROM products")
 
+        existing = _existing_products(cur)
+        seen_keys, dedup = set(), {}
+        inserts, updates = [], []
+
         with open(path, newline="", encoding="utf-8") as f:
             reader = csv.DictReader(f)
-            for raw in reader:
+            for n, raw in enumerate(reader, 1):
+                if progress and n % PROGRESS_EVERY == 0:
+                    progress("import", n)
                 row = norm_keys(raw)
 
-                title = (row.get("title") or "").strip().upper()
-
-                # Спец-строка для ЛОГОТИПА
-                if title == "__LOGO__":
-                    url = row.get("logo_url") or row.get("image_url") or ""
-                    if upsert_setting(cur, "logo_url", url):
-                        logo_set = True
+                special = _special_row(cur, row)
+                if special is not None:
+                    if special:
+                        saved.append(special)
                     continue
 
-                # Спец-строка для ВИДЕО/ГЕРОЯ
-                if title == "__HERO__":
-                    url = row.get("hero_url") or row.get("image_url") or ""
-                    if upsert_setting(cur, "hero_video_url", url):
-                        hero_set = True
+                # Обычная товарная строка
+                values = product_values(row)
+                if values is None:
                     continue
+                key = _row_key(row, values, dedup)
+                seen_keys.add(key)
+                h = row_hash(values)
+
+                old = existing.get(key)
+                if old is None:
+                    inserts.append(values + (key, h))
+                    summary["added"] += 1
+                elif old[1] == h:
+                    summary["unchanged"] += 1
+                else:
+                    updates.append(values + (h, old[0]))
+                    summary["changed"] += 1
+
+        if inserts:
+            cur.executemany(PRODUCTS_INSERT_SQL, inserts)
+        if updates:
+            cur.executemany(
+                """
+                UPDATE products SET
+                    title = ?, category = ?, subcategory = ?, price = ?,
+                    image_url = ?, images_urls = ?,
+                    sizes = ?, is_active = ?, description = ?,
+                    row_hash = ?
+                WHERE id = ?
+                """,
+                updates,
+            )
+
+        # пропавшие из таблицы: выключаем; row_hash сбрасываем, чтобы возврат строки считался изменением
+        gone = [pid for key, (pid, _) in existing.items() if key not in seen_keys]
+        gone += [r[0] for r in cur.execute("SELECT id FROM products WHERE row_key IS NULL AND is_active = 1")]
+        for start in range(0, len(gone), 500):
+            chunk = gone[start:start + 500]
+            cur.execute(
+                f"UPDATE products SET is_active = 0, row_hash = NULL "
+                f"WHERE is_active = 1 AND id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            summary["deactivated"] += cur.rowcount
+
+        # ✅ новая версия каталога — снимки в памяти (catalog.py) перечитаются; без изменений кэши не трогаем
+        if clear or inserts or updates or summary["deactivated"]:
+            upsert_setting(cur, CATALOG_VERSION_KEY, str(time.time_ns()))
+        # спец-строки и catalog_version — в settings: settings_store увидит их сразу
+        db.commit_settings(conn)
+
+    return summary, saved
+
+
+# ---------- bulk: большие фиды поставщиков ----------
+BULK_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+BULK_CACHE_MB = int(os.getenv("IMPORT_CACHE_MB", "256"))
+
+# на время импорта: без fsync на коммит (WAL — база не побьётся, при сбое откатится весь импорт)
+_BULK_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    f"PRAGMA cache_size=-{BULK_CACHE_MB * 1024}",
+)
+_RESTORE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{db.DB_CACHE_MB * 1024}",
+)
+
+# вторичные индексы каталога и FTS-триггеры: снимаются до загрузки и строятся один раз после
+# (idx_products_row_key остаётся — по нему идёт сверка с импортом)
+_DEFERRED_INDEXES = ("idx_products_active_cat", "idx_products_active_cat_sub")
+_FTS_TRIGGERS = ("products_fts_ai", "products_fts_ad", "products_fts_au")
+
+# доля новых+изменённых строк, начиная с которой индексы и FTS строятся заново, а не триггерами
+BULK_REBUILD_RATIO = float(os.getenv("IMPORT_REBUILD_RATIO", "0.3"))
+
+_STAGE_COLUMNS = PRODUCT_COLUMNS + ("row_key", "row_hash")
+
+
+class _Record:
+    """Строка csv.reader с доступом по имени колонки — вместо dict на каждую строку (norm_keys)."""
+    __slots__ = ("cells", "index")
+
+    def __init__(self, index: dict):
+        self.index = index
+        self.cells = ()
+
+    def get(self, key, default=None):
+        i = self.index.get(key)
+        return self.cells[i] if i is not None and i < len(self.cells) else default
+
+
+def _schema_sql(cur, names) -> list:
+    marks = ",".join("?" * len(names))
+    return cur.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE name IN ({marks}) AND sql IS NOT NULL", names
+    ).fetchall()
+
+
+def _pending_changes(cur) -> int:
+    """Сколько строк импорта добавятся или изменятся (по row_key из import_rows)."""
+    return cur.execute(
+        "SELECT COUNT(*) FROM import_rows s LEFT JOIN products p ON p.row_key = s.row_key "
+        "WHERE p.id IS NULL OR p.row_hash IS NOT s.row_hash"
+    ).fetchone()[0]
+
+
+def _rebuild_fts(cur) -> None:
+    if not cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone():
+        return
+    cur.execute("INSERT INTO products_fts(products_fts) VALUES ('delete-all')")
+    cur.execute(
+        f"INSERT INTO products_fts(rowid, title, description, category, subcategory) "
+        f"SELECT p.id, {migrations._fts_values('p')} FROM products p WHERE p.is_active = 1"
+    )
 
-                # Обычная товарная строка
-                if insert_product(cur, row):
-                    inserted += 1
 
-        conn.commit()
+def _bulk_import(path: str, clear: bool, progress, batch_size: int) -> tuple:
+    """
+    Потоковый импорт: CSV читается пачками по batch_size в TEMP-таблицу (executemany),
+    затем сверка с products — несколькими set-based запросами по row_key.
+    Память не растёт с размером фида (кроме счётчиков дублей ключей).
+    Если новых/изменённых строк не меньше BULK_REBUILD_RATIO (или clear), вторичные индексы
+    и FTS-индекс строятся заново один раз в конце. Всё — одна транзакция: читатели (витрина)
+    до коммита видят старый каталог.
+    """
+    summary = {"added": 0, "changed": 0, "deactivated": 0, "unchanged": 0}
+    saved = []
+    cols = ", ".join(_STAGE_COLUMNS)
 
-    msg = f"✅ Imported {inserted} products from {path} into {DB_PATH}"
-    extras = []
-    if logo_set:
-        extras.append("logo_url saved")
-    if hero_set:
-        extras.append("hero_video_url saved")
+    with db.connect() as conn:
+        for pragma in _BULK_PRAGMAS:
+            conn.execute(pragma)
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("DROP TABLE IF EXISTS temp.import_rows")
+            cur.execute(f"CREATE TEMP TABLE import_rows (seq INTEGER PRIMARY KEY, {cols})")
+            stage_sql = f"INSERT INTO import_rows ({cols}) VALUES ({','.join('?' * len(_STAGE_COLUMNS))})"
+
+            total = 0
+            dedup, batch = {}, []
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                row = _Record({(h or "").strip().lower(): i for i, h in enumerate(header)})
+                for n, cells in enumerate(reader, 1):
+                    if progress and n % PROGRESS_EVERY == 0:
+                        progress("import", n)
+                    row.cells = cells
+
+                    special = _special_row(cur, row)
+                    if special is not None:
+                        if special:
+                            saved.append(special)
+                        continue
+
+                    values = product_values(row)
+                    if values is None:
+                        continue
+                    batch.append(values + (_row_key(row, values, dedup), row_hash(values)))
+                    if len(batch) >= batch_size:
+                        cur.executemany(stage_sql, batch)
+                        total += len(batch)
+                        batch.clear()
+            if batch:
+                cur.executemany(stage_sql, batch)
+                total += len(batch)
+            cur.execute("CREATE INDEX temp.import_rows_key ON import_rows(row_key)")
+
+            if not clear and cur.execute("SELECT 1 FROM products WHERE row_key IS NULL LIMIT 1").fetchone():
+                _existing_products(cur)  # товары до появления row_key: проставит ключи
+
+            # индексы и FTS снимаем, только если меняется заметная часть каталога:
+            # полная перестройка FTS дороже, чем триггеры на несколько процентов строк
+            heavy = clear or _pending_changes(cur) >= BULK_REBUILD_RATIO * max(1, total)
+            deferred = _schema_sql(cur, _DEFERRED_INDEXES + _FTS_TRIGGERS) if heavy else []
+            for name, _ in deferred:
+                kind = "TRIGGER" if name in _FTS_TRIGGERS else "INDEX"
+                cur.execute(f"DROP {kind} {name}")
+
+            if clear:
+                cur.execute("DELETE FROM products")
+
+            # изменённые (и вернувшиеся после выключения — у них row_hash NULL)
+            assign = ", ".join(f"{c} = s.{c}" for c in PRODUCT_COLUMNS + ("row_hash",))
+            cur.execute(
+                f"UPDATE products SET {assign} FROM import_rows s "
+                f"WHERE products.row_key = s.row_key AND products.row_hash IS NOT s.row_hash"
+            )
+            summary["changed"] = cur.rowcount
+
+            cur.execute(
+                "UPDATE products SET is_active = 0, row_hash = NULL WHERE is_active = 1 AND ("
+                "row_key IS NULL OR NOT EXISTS (SELECT 1 FROM import_rows s WHERE s.row_key = products.row_key))"
+            )
+            summary["deactivated"] = cur.rowcount
+
+            # новые — в порядке строк CSV, как и в обычном режиме
+            cur.execute(
+                f"INSERT INTO products ({cols}) SELECT {cols} FROM import_rows s "
+                f"WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.row_key = s.row_key) ORDER BY s.seq"
+            )
+            summary["added"] = cur.rowcount
+            summary["unchanged"] = total - summary["added"] - summary["changed"]
+
+            for name, sql in deferred:
+                cur.execute(sql)
+            if any(name in _FTS_TRIGGERS for name, _ in deferred):
+                _rebuild_fts(cur)
+
+            if clear or summary["added"] or summary["changed"] or summary["deactivated"]:
+                upsert_setting(cur, CATALOG_VERSION_KEY, str(time.time_ns()))
+            db.commit_settings(conn)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DROP TABLE IF EXISTS temp.import_rows")
+            for pragma in _RESTORE_PRAGMAS:
+                conn.execute(pragma)
+
+    return summary, saved
+
+
+def seed_from_csv(csv_path: str, clear: bool, progress=None, bulk: bool = False,
+                  batch_size: int = BULK_BATCH_SIZE) -> dict:
+    """
+    Синхронизирует products с CSV по стабильному ключу (sku или хэш title/category/subcategory):
+    новые строки добавляются, изменённые обновляются на месте (id не меняются — корзины живы),
+    пропавшие из таблицы выключаются (is_active=0), неизменённые не трогаются.
+    clear=True — как раньше: удалить все товары и залить заново.
+
+    bulk=True — тот же результат для больших фидов (сотни тысяч строк): потоковое чтение
+    пачками по batch_size, PRAGMA для импорта, индексы и поиск строятся после загрузки.
+
+    progress(stage, done) — необязательный колбэк (вызывается из этого же потока)
+    каждые PROGRESS_EVERY строк: ("import", обработано строк).
+
+    Возвращает сводку: added / changed / deactivated / unchanged.
+    """
+    ensure_schema()
+
+    path = csv_path or CSV_FILE
+    if not Path(path).is_file():
+        raise FileNotFoundError(f"CSV file not found: {path}")
+
+    started = time.perf_counter()
+    if bulk:
+        summary, saved = _bulk_import(path, clear, progress, max(1, batch_size))
+    else:
+        summary, saved = _incremental_import(path, clear, progress)
+    elapsed = time.perf_counter() - started
+    rows = summary["added"] + summary["changed"] + summary["unchanged"]
+
+    msg = (
+        f"✅ Synced {path} into {DB_PATH}: "
+        f"+{summary['added']} added, ~{summary['changed']} changed, "
+        f"-{summary['deactivated']} deactivated, {summary['unchanged']} unchanged"
+    )
+    extras = [f"{key} saved" for key in saved]
     if extras:
         msg += " (" + ", ".join(extras) + ")"
+    msg += f" — {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s{', bulk' if bulk else ''})"
     print(msg)
+    return summary
 
 
 def main():
     ap = argparse.ArgumentParser(description="Import products CSV into SQLite.")
     ap.add_argument("--csv", dest="csv", help="Path to CSV file", default=None)
-    ap.add_argument("--clear", action="store_true", help="Delete all products before import")
+    ap.add_argument("--clear", action="store_true", help="Delete all products before import (ids change)")
+    ap.add_argument("--bulk", action="store_true", help="Streaming bulk mode for large feeds")
+    ap.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE,
+                    help=f"Rows per executemany in bulk mode (default: {BULK_BATCH_SIZE})")
     args = ap.parse_args()
 
     csv_path = args.csv or CSV_FILE
-    seed_from_csv(csv_path, clear=args.clear)
+    seed_from_csv(csv_path, clear=args.clear, bulk=args.bulk, batch_size=args.batch_size)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+"""
+Настройки магазина (таблица settings) в памяти процесса.
+
+Вся таблица читается одним запросом и отдаётся как неизменяемый снимок — /api/config
+и хэндлеры бота не ходят в SQLite за каждым ключом. Любая запись (db.put_setting:
+set_setting, upsert_setting в seed_from_csv) в той же транзакции меняет settings_version;
+её проверяем не чаще раза в SETTINGS_CHECK_INTERVAL секунд (как catalog_version в catalog.py),
+а записи из этого же процесса (db.commit_settings после коммита) видны сразу. Правки таблицы в обход db.put_setting
+подхватятся не позже чем через SETTINGS_MAX_AGE.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import db
+import db_async
+
+SETTINGS_CHECK_INTERVAL = float(os.getenv("SETTINGS_CHECK_INTERVAL", "2"))
+SETTINGS_MAX_AGE = float(os.getenv("SETTINGS_MAX_AGE", "300"))
+
+_TRUE = {"1", "true", "yes", "on", "да"}
+_FALSE = {"0", "false", "no", "off", "нет", ""}
+
+
+class Settings:
+    """Неизменяемый срез settings для одной settings_version."""
+
+    def __init__(self, version: str, values: dict, writes: int):
+        self.version = version
+        self.values = values
+        self.writes = writes  # db.settings_writes() на момент чтения
+        self.loaded_at = time.monotonic()
+
+    def get(self, key: str, default: str = "") -> str:
+        return self.values.get(key, default)
+
+    def text(self, key: str, default: str = "") -> str:
+        """Текст для пользователя: пустое значение — default."""
+        return self.values.get(key, "").strip() or default
+
+    def flag(self, key: str, default: bool = False) -> bool:
+        """Фича-флаг: 1/true/yes/on/да — включено, 0/false/no/off/нет — выключено."""
+        raw = self.values.get(key)
+        if raw is None:
+            return default
+        raw = raw.strip().lower()
+        if raw in _TRUE:
+            return True
+        if raw in _FALSE:
+            return False
+        return default
+
+
+_settings: Optional[Settings] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _fresh(snap: Optional[Settings]) -> bool:
+    return (
+        snap is not None
+        and snap.writes == db.settings_writes()
+        and time.monotonic() - _checked_at < SETTINGS_CHECK_INTERVAL
+        and time.monotonic() - snap.loaded_at < SETTINGS_MAX_AGE
+    )
+
+
+def _load() -> Settings:
+    writes = db.settings_writes()
+    version, values = db.load_settings()
+    logging.debug("Settings loaded: version=%s, %d keys", version or "-", len(values))
+    return Settings(version, values, writes)
+
+
+def get() -> Settings:
+    """Текущий снимок; при смене settings_version перечитывает таблицу."""
+    global _settings, _checked_at
+
+    snap = _settings
+    if _fresh(snap):
+        return snap
+
+    with _lock:
+        snap = _settings
+        if _fresh(snap):
+            return snap
+        try:
+            if (
+                snap is None
+                or snap.writes != db.settings_writes()
+                or time.monotonic() - snap.loaded_at >= SETTINGS_MAX_AGE
+                or db.get_settings_version() != snap.version
+            ):
+                snap = _load()
+                _settings = snap
+        except Exception as e:
+            if snap is None:
+                # БД недоступна и снимка нет — пустые настройки, а не 500 на /api/config
+                logging.warning("Settings load failed: %s", e)
+                return Settings("", {}, -1)
+            logging.warning("Settings version check failed: %s", e)
+        _checked_at = time.monotonic()
+        return snap
+
+
+async def aget() -> Settings:
+    """get() для event loop: чтение из БД (если нужно) — в пуле DB-потоков."""
+    snap = _settings
+    if _fresh(snap):
+        return snap
+    return await db_async.run(get)
+
+
+def invalidate() -> None:
+    """Следующее чтение сверит settings_version (например, после записи из другого процесса)."""
+    global _checked_at
+    _checked_at = 0.0
@@ -0,0 +1,113 @@
+"""
+Статика витрины (web/) с отпечатками содержимого.
+
+При старте build() читает web/*.js и web/*.css, даёт каждому файлу имя с хэшем
+(app.js → app.3f2a9c01be.js), переписывает ссылки в index.html и заранее готовит
+gzip/br (http_cache.Payload). Файлы с хэшем в имени не меняются никогда — отдаём их
+с Cache-Control: immutable на год; короткий TTL только у index.html, который
+и приносит новые имена после деплоя.
+"""
+import hashlib
+import logging
+import os
+import os.path as op
+import re
+from typing import Dict, Optional, Tuple
+
+from http_cache import Payload
+
+ASSET_EXTS = (".js", ".css")
+CONTENT_TYPES = {
+    ".js": "application/javascript",
+    ".css": "text/css",
+    ".html": "text/html",
+}
+
+INDEX_MAX_AGE = int(os.getenv("INDEX_MAX_AGE", "60"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+INDEX_CACHE_CONTROL = f"public, max-age={INDEX_MAX_AGE}, must-revalidate"
+# старые ссылки (?v=7, прошлый хэш из закэшированного index.html) — текущая версия, но без immutable
+FALLBACK_CACHE_CONTROL = "no-cache"
+
+HASH_LEN = 10
+_HASHED_RE = re.compile(r"^(?P<stem>.+)\.[0-9a-f]{%d}(?P<ext>\.[A-Za-z0-9]+)$" % HASH_LEN)
+_REF_RE = re.compile(r'(?P<attr>\b(?:src|href)=")(?P<url>[^"]+)"')
+
+
+def hashed_name(name: str, raw: bytes) -> str:
+    stem, ext = op.splitext(name)
+    return f"{stem}.{hashlib.sha256(raw).hexdigest()[:HASH_LEN]}{ext}"
+
+
+class StaticBundle:
+    """Собранная статика одной версии кода."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, Payload] = {}  # app.3f2a9c01be.js → тело
+        self.latest: Dict[str, Payload] = {}  # app.js → то же тело
+        self.urls: Dict[str, str] = {}  # app.js → /web/app.3f2a9c01be.js
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith((".", "__"))]
+            for fn in filenames:
+                ext = op.splitext(fn)[1].lower()
+                if ext not in ASSET_EXTS:
+                    continue
+                full = op.join(dirpath, fn)
+                name = op.relpath(full, root).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    raw = f.read()
+                payload = Payload(raw, content_type=CONTENT_TYPES[ext])
+                payload.precompress()
+                fingerprinted = hashed_name(name, raw)
+                self.files[fingerprinted] = payload
+                self.latest[name] = payload
+                self.urls[name] = "/web/" + fingerprinted
+
+        self.index = self._build_index()
+
+    def _build_index(self) -> Optional[Payload]:
+        path = op.join(self.root, "index.html")
+        if not op.isfile(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        def swap(m):
+            url = m.group("url")
+            name = re.split(r"[?#]", url, 1)[0]
+            for prefix in ("/web/", "./"):
+                if name.startswith(prefix):
+                    name = name[len(prefix):]
+                    break
+            hashed = self.urls.get(name)
+            return f'{m.group("attr")}{hashed}"' if hashed else m.group(0)
+
+        payload = Payload(_REF_RE.sub(swap, html).encode("utf-8"), content_type=CONTENT_TYPES[".html"])
+        payload.precompress()
+        return payload
+
+    def lookup(self, name: str) -> Optional[Tuple[Payload, str]]:
+        """(тело, Cache-Control) для /web/<name> или None, если это не собранный ассет."""
+        payload = self.files.get(name)
+        if payload is not None:
+            return payload, IMMUTABLE_CACHE_CONTROL
+        payload = self.latest.get(name)
+        if payload is None:
+            m = _HASHED_RE.match(name)
+            if m:
+                payload = self.latest.get(m.group("stem") + m.group("ext"))
+        if payload is not None:
+            return payload, FALLBACK_CACHE_CONTROL
+        return None
+
+
+def build(root: str = "web") -> StaticBundle:
+    bundle = StaticBundle(root)
+    logging.info(
+        "Static assets: %s",
+        ", ".join(f"{k} → {v}" for k, v in sorted(bundle.urls.items())) or "none",
+    )
+    return bundle
@@ -1,23 +1,132 @@
+import argparse
+import hashlib
 import os
-import requests
+import tempfile
 from pathlib import Path
+
+import requests
+
+import db
 from seed_from_csv import seed_from_csv
 
 CSV_URL = os.getenv("GOOGLE_SHEET_CSV_URL", "").strip()
+TMP_CSV = Path("/tmp/products_sheet.csv")
+
+# что помним о последнем успешном импорте (таблица settings)
+SHEET_ETAG_KEY          = "sheet_etag"
+SHEET_LAST_MODIFIED_KEY = "sheet_last_modified"
+SHEET_SHA256_KEY        = "sheet_sha256"
+
+CHUNK_SIZE = 64 * 1024
+PROGRESS_BYTES = 1024 * 1024  # как часто сообщать о закачке
+
+
+def _setting(key: str) -> str:
+    try:
+        return db.get_setting(key, "")
+    except Exception:
+        return ""  # база ещё не засеяна
+
+
+def download_csv(url: str, dest: Path, conditional: bool = True, progress=None):
+    """
+    Потоково качает CSV в dest (через временный файл + rename), считая SHA-256 на лету.
+    Шлёт If-None-Match / If-Modified-Since из прошлого импорта.
+    Возвращает None при 304, иначе dict(sha256, bytes, etag, last_modified).
+    """
+    headers = {}
+    if conditional:
+        etag = _setting(SHEET_ETAG_KEY)
+        last_modified = _setting(SHEET_LAST_MODIFIED_KEY)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
 
-def sync(clear_products: bool = False) -> str:
-    if not CSV_URL:
+    with requests.get(url, headers=headers, stream=True, timeout=30) as r:
+        if r.status_code == 304:
+            return None
+        if r.status_code != 200:
+            raise RuntimeError(f"CSV fetch failed: HTTP {r.status_code}: {r.text[:200]}")
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                reported = 0
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                    if progress and size - reported >= PROGRESS_BYTES:
+                        progress("download", size)
+                        reported = size
+            os.replace(tmp, dest)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        return {
+            "sha256": digest.hexdigest(),
+            "bytes": size,
+            "etag": r.headers.get("ETag", ""),
+            "last_modified": r.headers.get("Last-Modified", ""),
+        }
+
+
+def sync(clear_products: bool = False, url: str = None, progress=None) -> dict:
+    """
+    Единый путь синка для бота (/sync) и CLI: скачать, сравнить хэш с прошлым импортом,
+    импортировать только если таблица изменилась (clear_products=True — всегда).
+    progress(stage, done) — см. seed_from_csv; стадии "download" (байты) и "import" (строки).
+
+    Результат: {"skipped": bool, "reason": str, "bytes": int, "summary": dict | None}.
+    """
+    url = url or CSV_URL
+    if not url:
         raise RuntimeError("GOOGLE_SHEET_CSV_URL is not set")
 
-    r = requests.get(CSV_URL, timeout=30)
-    r.raise_for_status()
+    fetched = download_csv(url, TMP_CSV, conditional=not clear_products, progress=progress)
+    if fetched is None:
+        return {"skipped": True, "reason": "not modified (304)", "bytes": 0, "summary": None}
 
-    tmp = Path("/tmp/products_sheet.csv")
-    tmp.write_bytes(r.content)
+    if not clear_products and fetched["sha256"] == _setting(SHEET_SHA256_KEY):
+        return {"skipped": True, "reason": "same sha256", "bytes": fetched["bytes"], "summary": None}
 
     # clear=True удалит ТОЛЬКО products (в твоём seed_from_csv именно так)
-    seed_from_csv(str(tmp), clear=clear_products)
-    return f"✅ Синк выполнен. CSV: {len(r.content)} bytes"
+    if progress:
+        progress("import", 0)
+    summary = seed_from_csv(str(TMP_CSV), clear=clear_products, progress=progress)
+
+    # запоминаем только после успешного импорта — иначе следующий синк его пропустил бы;
+    # одной транзакцией: sha256 и etag/last_modified не должны разойтись
+    with db.connect() as conn:
+        cur = conn.cursor()
+        db.put_setting(cur, SHEET_SHA256_KEY, fetched["sha256"])
+        db.put_setting(cur, SHEET_ETAG_KEY, fetched["etag"])
+        db.put_setting(cur, SHEET_LAST_MODIFIED_KEY, fetched["last_modified"])
+        db.commit_settings(conn)
+    return {"skipped": False, "reason": "", "bytes": fetched["bytes"], "summary": summary}
+
+
+def format_result(res: dict) -> str:
+    if res["skipped"]:
+        return f"✅ Таблица не изменилась ({res['reason']}) — импорт пропущен."
+    s = res["summary"]
+    return (
+        f"✅ Синк выполнен. CSV: {res['bytes']} bytes, "
+        f"+{s['added']} новых, ~{s['changed']} изменено, "
+        f"−{s['deactivated']} скрыто, {s['unchanged']} без изменений."
+    )
+
 
 if __name__ == "__main__":
-    print(sync(clear_products=False))
+    ap = argparse.ArgumentParser(description="Download the Google Sheets CSV and import it if it changed.")
+    ap.add_argument("--clear", action="store_true", help="Delete all products and force a full import")
+    args = ap.parse_args()
+    print(format_result(sync(clear_products=args.clear)))
@@ -0,0 +1,175 @@
+"""
+Фоновый синк каталога из Google Sheets.
+
+Синк (закачка + seed_from_csv) выполняется в рабочем потоке, event loop
+(витрина и polling бота) в это время свободен. Одновременно идёт не больше одного синка.
+Прогресс приходит из потока через call_soon_threadsafe и не чаще раза в PROGRESS_INTERVAL
+секунд передаётся в report() (бот редактирует своё сообщение в чате админа).
+Итог последнего запуска хранится в settings (sync_last_run) — его показывает /sync status.
+
+Расписание: SYNC_INTERVAL_MIN (0 — выключено) ± SYNC_JITTER_SEC случайного сдвига.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+import catalog
+import db_async
+import metrics
+import settings_store
+
+SYNC_INTERVAL_MIN = float(os.getenv("SYNC_INTERVAL_MIN", "0"))
+SYNC_JITTER_SEC   = float(os.getenv("SYNC_JITTER_SEC", "60"))
+
+LAST_RUN_KEY = "sync_last_run"
+PROGRESS_INTERVAL = 2.0
+
+# report(text, final) — куда писать прогресс/итог (None — только лог)
+Report = Callable[[str, bool], Awaitable[None]]
+
+
+def describe_progress(stage: str, done: int) -> str:
+    if stage == "download":
+        return f"⏳ Скачиваю таблицу… {done / 1024 / 1024:.1f} МБ"
+    if stage == "import":
+        return f"⏳ Импортирую товары… {done} строк"
+    return "⏳ Синк…"
+
+
+class SyncRunner:
+    def __init__(self, job):
+        # job(clear, progress) -> (текст итога, dict результата | None); выполняется в потоке
+        self.job = job
+        self.current: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reported_at = 0.0
+        # asyncio хранит на задачи только слабые ссылки — держим отчёты о прогрессе до завершения
+        self._reports: set = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, clear: bool = False, trigger: str = "admin", report: Optional[Report] = None) -> bool:
+        """Запускает синк в фоне. False — если синк уже идёт."""
+        if self.running:
+            return False
+        self.current = {"trigger": trigger, "started_at": time.time(), "stage": "download", "done": 0}
+        self._task = asyncio.create_task(self._run(clear, trigger, report))
+        return True
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def _run(self, clear: bool, trigger: str, report: Optional[Report]) -> None:
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        self._reported_at = time.monotonic()
+
+        def progress(stage: str, done: int) -> None:
+            # вызывается из рабочего потока
+            loop.call_soon_threadsafe(self._on_progress, stage, done, report)
+
+        result, error = None, ""
+        try:
+            text, result = await asyncio.to_thread(self.job, clear, progress)
+        except Exception as e:
+            logging.exception("sync failed: %s", e)
+            error = str(e)
+            text = f"❌ Ошибка синка: {e}"
+        finally:
+            self.current = None
+
+        duration = time.time() - started
+        outcome = "error" if error else ("skipped" if result and result.get("skipped") else "ok")
+        metrics.SYNC_DURATION.observe(duration, outcome)
+        if result and result.get("summary"):
+            for kind, n in result["summary"].items():
+                metrics.SYNC_ROWS.set(kind, value=n)
+        record = {
+            "trigger": trigger,
+            "clear": clear,
+            "started_at": started,
+            "duration_s": round(duration, 2),
+            "ok": not error,
+            "error": error[:500],
+            "text": text,
+            "skipped": bool(result and result.get("skipped")),
+            "bytes": (result or {}).get("bytes", 0),
+            "summary": (result or {}).get("summary"),
+        }
+        try:
+            await db_async.set_setting(LAST_RUN_KEY, json.dumps(record, ensure_ascii=False))
+        except Exception as e:
+            logging.warning("can't store sync status: %s", e)
+        catalog.invalidate()
+        logging.info("sync (%s) finished in %.1fs: %s", trigger, duration, text)
+
+        if report:
+            await _safe_report(report, f"{text}\n⏱ {duration:.1f} с", True)
+
+    def _on_progress(self, stage: str, done: int, report: Optional[Report]) -> None:
+        if self.current is None:
+            return
+        self.current.update(stage=stage, done=done)
+        now = time.monotonic()
+        if report and now - self._reported_at >= PROGRESS_INTERVAL:
+            self._reported_at = now
+            task = asyncio.create_task(_safe_report(report, describe_progress(stage, done), False))
+            self._reports.add(task)
+            task.add_done_callback(self._reports.discard)
+
+    async def last_run(self) -> Optional[dict]:
+        try:
+            raw = (await settings_store.aget()).get(LAST_RUN_KEY)
+            return json.loads(raw) if raw else None
+        except Exception:
+            return None
+
+    async def status_text(self) -> str:
+        lines = []
+        cur = self.current
+        if cur:
+            ago = time.time() - cur["started_at"]
+            lines.append(f"🔄 Синк идёт {ago:.0f} с ({cur['trigger']}): "
+                         + describe_progress(cur["stage"], cur["done"]).lstrip("⏳ "))
+
+        last = await self.last_run()
+        if not last:
+            lines.append("Синк ещё не запускался.")
+        else:
+            when = time.strftime("%d.%m %H:%M:%S", time.localtime(last["started_at"]))
+            lines.append(f"Последний синк: {when} ({last['trigger']}), {last['duration_s']} с")
+            s = last.get("summary")
+            if s:
+                lines.append(
+                    f"+{s['added']} новых, ~{s['changed']} изменено, "
+                    f"−{s['deactivated']} скрыто, {s['unchanged']} без изменений"
+                )
+            else:
+                lines.append(last.get("text") or "")
+
+        if SYNC_INTERVAL_MIN > 0:
+            lines.append(f"Расписание: каждые {SYNC_INTERVAL_MIN:g} мин ± {SYNC_JITTER_SEC:g} с")
+        return "\n".join(lines)
+
+    async def periodic(self, interval_min: float = SYNC_INTERVAL_MIN, jitter_sec: float = SYNC_JITTER_SEC) -> None:
+        """Бесконечный цикл плановых синков (запускать отдельной задачей)."""
+        while True:
+            # джиттер — чтобы несколько инстансов не ходили в Google одновременно
+            delay = interval_min * 60 + random.uniform(-jitter_sec, jitter_sec)
+            await asyncio.sleep(max(30.0, delay))
+            if not self.start(trigger="schedule"):
+                logging.info("scheduled sync skipped: previous one still running")
+
+
+async def _safe_report(report: Report, text: str, final: bool) -> None:
+    try:
+        await report(text, final)
+    except Exception as e:
+        logging.warning("sync report failed: %s", e)
@@ -0,0 +1,28 @@
+import os
+import os.path as op
+import sys
+import tempfile
+
+import pytest
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# модули читают окружение при импорте — БД по умолчанию не должна оказаться рядом с кодом
+os.environ.setdefault("DB_PATH", op.join(tempfile.mkdtemp(prefix="shop-tests-"), "data.sqlite"))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """Отдельная пустая БД на тест (пул соединений db открывается заново)."""
+    import seed_from_csv
+
+    path = str(tmp_path / "shop.sqlite")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    monkeypatch.setattr(seed_from_csv, "DB_PATH", path)
+    monkeypatch.setattr(db, "_pool", None)
+    yield path
+    if db._pool is not None:
+        db._pool.close()
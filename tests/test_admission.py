@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+
+import admission
+import metrics
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = admission.TokenBucket(rate=2, burst=3)
+    assert [bucket.take("a", now=100.0) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take("a", now=100.0) == pytest.approx(0.5)
+    # другой IP — свой бакет
+    assert bucket.take("b", now=100.0) == 0
+    assert bucket.take("a", now=100.5) == 0
+    assert bucket.take("a", now=100.5) == pytest.approx(0.5)
+    # за долгий простой копится не больше burst
+    assert [bucket.take("a", now=200.0) for _ in range(4)][-1] > 0
+
+
+def test_token_bucket_forgets_oldest_keys():
+    bucket = admission.TokenBucket(rate=1, burst=1, max_keys=2)
+    bucket.take("a", now=0.0)
+    bucket.take("b", now=0.0)
+    bucket.take("c", now=0.0)
+    # "a" вытеснен — для него снова полный бакет
+    assert bucket.take("a", now=0.0) == 0
+    assert bucket.take("c", now=0.0) > 0
+
+
+@pytest.mark.parametrize("hops, expected", [(0, "10.0.0.1"), (1, "3.3.3.3"), (2, "2.2.2.2"), (9, "1.1.1.1")])
+def test_client_ip(hops, expected):
+    request = make_mocked_request(
+        "GET", "/img", headers={"X-Forwarded-For": "1.1.1.1, 2.2.2.2,3.3.3.3"}
+    ).clone(remote="10.0.0.1")
+    assert admission.client_ip(request, hops) == expected
+
+
+def test_client_ip_without_header():
+    request = make_mocked_request("GET", "/img").clone(remote="10.0.0.1")
+    assert admission.client_ip(request, 1) == "10.0.0.1"
+
+
+def _coalesce_app(calls):
+    release = asyncio.Event()
+
+    async def search(request):
+        calls.append(request.headers.get("Accept-Encoding", ""))
+        await release.wait()
+        return web.json_response({"q": request.query.get("q")})
+
+    async def missing(request):
+        calls.append("missing")
+        await release.wait()
+        raise web.HTTPNotFound()
+
+    async def order(request):
+        calls.append("order")
+        await release.wait()
+        return web.json_response({"ok": True})
+
+    app = web.Application(middlewares=[admission.Coalescer().middleware])
+    app.router.add_get("/api/search", search)
+    app.router.add_get("/api/product/{id}", missing)
+    app.router.add_get("/api/order", order)
+    return app, release
+
+
+async def _burst(requests):
+    calls = []
+    app, release = _coalesce_app(calls)
+    async with TestClient(TestServer(app)) as client:
+
+        async def one(path, headers):
+            async with client.get(path, headers=headers) as resp:
+                return resp.status, await resp.read()
+
+        tasks = [asyncio.create_task(one(path, headers)) for path, headers in requests]
+        await asyncio.sleep(0.2)  # все запросы дошли до middleware
+        release.set()
+        return calls, await asyncio.gather(*tasks)
+
+
+def test_coalescer_shares_identical_gets():
+    before = metrics.HTTP_COALESCED.state().get(("/api/search",), 0)
+    calls, results = asyncio.run(_burst([("/api/search?q=x", {"Accept-Encoding": "identity"})] * 10))
+    assert len(calls) == 1
+    assert {r for r in results} == {(200, b'{"q": "x"}')}
+    assert metrics.HTTP_COALESCED.state()[("/api/search",)] - before == 9
+
+
+def test_coalescer_key_includes_query_and_encoding():
+    calls, results = asyncio.run(_burst([
+        ("/api/search?q=x", {"Accept-Encoding": "identity"}),
+        ("/api/search?q=y", {"Accept-Encoding": "identity"}),
+        ("/api/search?q=x", {"Accept-Encoding": "gzip"}),
+        ("/api/search?q=x", {"Accept-Encoding": "identity"}),
+    ]))
+    assert sorted(calls) == ["gzip", "identity", "identity"]
+    assert [body for _, body in results] == [b'{"q": "x"}', b'{"q": "y"}', b'{"q": "x"}', b'{"q": "x"}']
+
+
+def test_coalescer_skips_other_routes_and_exceptions():
+    calls, results = asyncio.run(_burst([("/api/order", {})] * 3 + [("/api/product/1", {})] * 3))
+    # маршрут не из COALESCE_ROUTES считается каждый раз; HTTP-исключение ожидающие получают сами
+    assert calls.count("order") == 3
+    assert calls.count("missing") == 3
+    assert [status for status, _ in results] == [200] * 3 + [404] * 3
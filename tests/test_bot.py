@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+
+import bot  # noqa: E402
+import static_assets  # noqa: E402
+from optimize_media import MediaIndex  # noqa: E402
+
+
+async def _get(app, path, headers=None):
+    async with TestClient(TestServer(app)) as client:
+        async with client.get(path, headers=headers or {}) as resp:
+            return resp.status, resp.headers, await resp.read()
+
+
+def _metrics_app():
+    app = web.Application()
+    app.router.add_get("/metrics", bot.metrics_handler)
+    return app
+
+
+def test_metrics_hidden_without_token(monkeypatch):
+    monkeypatch.setattr(bot, "METRICS_TOKEN", "")
+    status, _, _ = asyncio.run(_get(_metrics_app(), "/metrics"))
+    assert status == 404
+
+
+def test_metrics_bearer_only(monkeypatch):
+    monkeypatch.setattr(bot, "METRICS_TOKEN", "s3cret")
+    assert asyncio.run(_get(_metrics_app(), "/metrics"))[0] == 401
+    # токен в query попадал бы в логи доступа — не принимаем
+    assert asyncio.run(_get(_metrics_app(), "/metrics?token=s3cret"))[0] == 401
+    assert asyncio.run(_get(_metrics_app(), "/metrics", {"Authorization": "Bearer wrong"}))[0] == 401
+    assert asyncio.run(_get(_metrics_app(), "/metrics", {"Authorization": "Bearer пароль"}))[0] == 401
+    status, headers, body = asyncio.run(_get(_metrics_app(), "/metrics", {"Authorization": "Bearer s3cret"}))
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert b"# TYPE http_requests_total counter" in body
+
+
+def _static_app(root):
+    app = web.Application()
+    app[bot.STATIC] = static_assets.StaticBundle(str(root))
+    app.router.add_get("/", bot.index_handler)
+    app.router.add_get("/web/{path:.*}", bot.file_handler)
+    return app
+
+
+def test_index_and_hashed_assets(tmp_path):
+    (tmp_path / "app.js").write_text("console.log(1);\n" * 100)
+    (tmp_path / "index.html").write_text('<script src="./app.js?v=3"></script>\n')
+    bundle = static_assets.StaticBundle(str(tmp_path))
+    js = bundle.urls["app.js"]
+
+    status, headers, body = asyncio.run(_get(_static_app(tmp_path), "/"))
+    assert status == 200 and headers["Cache-Control"] == static_assets.INDEX_CACHE_CONTROL
+    assert f'src="{js}"'.encode() in body
+
+    status, headers, body = asyncio.run(_get(_static_app(tmp_path), js, {"Accept-Encoding": "gzip"}))
+    assert status == 200 and headers["Content-Encoding"] == "gzip"  # клиент распаковывает сам
+    assert headers["Cache-Control"] == static_assets.IMMUTABLE_CACHE_CONTROL
+    assert body == (tmp_path / "app.js").read_bytes()
+
+    etag = headers["ETag"]
+    status, _, _ = asyncio.run(_get(_static_app(tmp_path), js, {"Accept-Encoding": "gzip", "If-None-Match": etag}))
+    assert status == 304
+
+    status, headers, _ = asyncio.run(_get(_static_app(tmp_path), "/web/app.js?v=2"))
+    assert status == 200 and headers["Cache-Control"] == static_assets.FALLBACK_CACHE_CONTROL
+    assert asyncio.run(_get(_static_app(tmp_path), "/web/nope.js"))[0] == 404
+
+
+def _images_app():
+    app = web.Application()
+    app[bot.MEDIA] = MediaIndex("images")
+    app.router.add_get("/images/{name:.+}", bot.images_handler)
+    return app
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    """images/ с готовым манифестом optimize_media.py (варианты — просто байты)."""
+    monkeypatch.chdir(tmp_path)
+    opt = tmp_path / "images" / "optimized"
+    opt.mkdir(parents=True)
+    files = {
+        "hero.jpg": {"kind": "image", "width": 1000, "height": 500, "variants": [
+            {"path": f"optimized/hero.{w}.webp", "width": w, "format": "webp", "type": "image/webp"}
+            for w in (320, 640, 1000)
+        ]},
+        "hero.mp4": {"kind": "video", "variants": [
+            {"path": "optimized/hero.720p.mp4", "type": "video/mp4"},
+        ]},
+    }
+    (opt / "manifest.json").write_text(json.dumps({"version": 1, "files": files}))
+    for name in ("hero.320.webp", "hero.640.webp", "hero.1000.webp", "hero.720p.mp4"):
+        (opt / name).write_bytes(name.encode())
+    (tmp_path / "images" / "hero.jpg").write_bytes(b"original jpeg")
+    (tmp_path / "images" / "hero.mp4").write_bytes(b"original mp4")
+    (tmp_path / "secret.txt").write_text("x")
+
+
+def test_images_negotiate_by_accept_and_width(images):
+    status, headers, body = asyncio.run(_get(_images_app(), "/images/hero.jpg?w=500", {"Accept": "image/webp,*/*"}))
+    assert status == 200 and body == b"hero.640.webp"
+    assert headers["Content-Type"] == "image/webp" and headers["Vary"] == "Accept"
+    assert headers["Cache-Control"] == bot.IMAGES_CACHE_CONTROL
+
+    status, headers, body = asyncio.run(_get(_images_app(), "/images/hero.jpg", {"Accept": "image/jpeg"}))
+    assert body == b"original jpeg" and "Vary" not in headers
+
+
+def test_images_video_variant(images):
+    # видео не зависит от Accept — Vary не нужен
+    status, headers, body = asyncio.run(_get(_images_app(), "/images/hero.mp4", {"Accept": "image/webp"}))
+    assert body == b"hero.720p.mp4" and headers["Content-Type"] == "video/mp4" and "Vary" not in headers
+    assert asyncio.run(_get(_images_app(), "/images/hero.mp4?orig=1"))[2] == b"original mp4"
+    assert asyncio.run(_get(_images_app(), "/images/nope.jpg"))[0] == 404
+    assert asyncio.run(_get(_images_app(), "/images/..%2Fsecret.txt"))[0] == 404
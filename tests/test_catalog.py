@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+import catalog
+import db
+from http_cache import Payload
+
+
+def product(pid, category, subcategory="", description=""):
+    return db._row_to_product({
+        "id": pid, "title": f"item {pid}", "category": category, "subcategory": subcategory,
+        "price": 100 * pid, "image_url": f"/images/{pid}.jpg", "sizes": "S, M",
+        "description": description, "is_active": 1,
+    })
+
+
+@pytest.fixture
+def snap():
+    # как db.load_catalog: только активные, id DESC
+    products = [
+        product(9, "Куртки", "Зимние"),
+        product(8, "Брюки", "Зимние", description="тёплые"),
+        product(7, "Куртки", "Лёгкие"),
+        product(6, "Брюки", ""),
+        product(5, "Куртки", "Зимние"),
+        product(4, "", "Зимние"),
+        product(3, "Брюки", "Лёгкие"),
+    ]
+    return catalog.Snapshot("1700000000000000000", products)
+
+
+def ids(payload):
+    body = json.loads(payload.raw)
+    return [p["id"] for p in (body["items"] if isinstance(body, dict) else body)]
+
+
+def test_cursor_roundtrip():
+    assert catalog.decode_cursor(catalog.encode_cursor(12345)) == 12345
+    assert catalog.decode_cursor(catalog.encode_cursor(40, "off"), "off") == 40
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "aWQ6eA", catalog.encode_cursor(5, "off")])
+def test_bad_cursor(cursor):
+    with pytest.raises(ValueError):
+        catalog.decode_cursor(cursor)
+
+
+def test_parse_fields():
+    assert catalog.parse_fields(None) is None
+    assert catalog.parse_fields(" , ") is None
+    assert catalog.parse_fields("id, title,id") == ("id", "title")
+    with pytest.raises(ValueError):
+        catalog.parse_fields("id,password")
+
+
+def test_categories(snap):
+    assert [(c["title"], c["count"]) for c in snap.categories] == [("Брюки", 3), ("Куртки", 3)]
+    assert json.loads(snap.subcategories_json("Куртки").raw) == ["Зимние", "Лёгкие"]
+    assert json.loads(snap.subcategories_json("Нет такой").raw) == []
+
+
+@pytest.mark.parametrize("category, subcategory", [
+    (None, None), ("Куртки", None), ("Куртки", "Зимние"), ("Брюки", ""),
+    (None, "Зимние"), (None, "Лёгкие"), (None, ""), ("Нет такой", None),
+])
+def test_products_json_matches_filter(snap, category, subcategory):
+    expected = [p["id"] for p in snap.filter_products(category, subcategory)]
+    assert ids(snap.products_json(category, subcategory)) == expected
+
+
+def test_subcategory_without_category_spans_categories(snap):
+    # тело (None, s) — из всех категорий, а не из товаров с пустой категорией
+    assert ids(snap.products_json(None, "Зимние")) == [9, 8, 5, 4]
+    assert ids(snap.products_json("", "Зимние")) == [9, 8, 5, 4]
+
+
+def test_pages_walk_every_product_once(snap):
+    seen, after = [], None
+    while True:
+        body = json.loads(snap.products_page_json(None, None, limit=3, after_id=after).raw)
+        seen += [p["id"] for p in body["items"]]
+        if body["next_cursor"] is None:
+            break
+        after = catalog.decode_cursor(body["next_cursor"])
+    assert seen == [9, 8, 7, 6, 5, 4, 3]
+
+
+def test_page_after_missing_id_and_fields(snap):
+    # товара 2 в выборке нет — страница начинается со следующего меньшего id
+    body = json.loads(snap.products_page_json("Куртки", None, limit=5, after_id=8, fields=("id", "has_description")).raw)
+    assert body == {"items": [{"id": 7, "has_description": False}, {"id": 5, "has_description": False}],
+                    "next_cursor": None}
+    assert json.loads(snap.product_json(8).raw)["has_description"] is True
+    assert snap.product_json(1) is None
+
+
+def test_bootstrap_joins_ready_bodies(snap):
+    config = Payload(json.dumps({"shop": "x"}).encode())
+    body = json.loads(snap.bootstrap_json(config, 2).raw)
+    assert body["config"] == {"shop": "x"}
+    assert body["categories"] == snap.categories
+    assert body["products"] == json.loads(snap.products_page_json(None, None, 2).raw)
+    assert snap.bootstrap_json(config, 2) is snap.bootstrap_json(config, 2)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Кроссовки Найк", '"кроссовки"* "найк"*'),
+    ("ЁЛКА", '"елка"*'),
+    ('a "OR" b* NEAR(x)', '"or"* "near"*'),
+    ("я", ""),
+    ("", ""),
+    (" ".join(f"w{i}" for i in range(20)), " ".join(f'"w{i}"*' for i in range(8))),
+])
+def test_fts_query(text, expected):
+    assert db.fts_query(text) == expected
+
+
+def test_load_precompresses_hot_bodies(monkeypatch):
+    products = [product(i, "Куртки" if i % 2 else "Брюки", "Зимние") for i in range(40, 0, -1)]
+    monkeypatch.setattr(db, "load_catalog", lambda: ("1", products))
+    snap = catalog._load()
+    # сжато заранее, в потоке БД — первый запрос на event loop уже не кодирует
+    for body in (snap.products_json(), snap.products_json("Куртки"), snap.products_json("Брюки")):
+        assert set(body._encoded) == {"gzip", "br"}
+    # редкие фильтры — лениво, на запросе
+    assert snap.products_json(None, "Зимние")._encoded == {}
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+import db
+import db_async
+
+
+def test_pool_reuses_connections(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "p.sqlite"), size=2)
+    with pool.connection() as conn:
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        conn.execute("CREATE TABLE t(x)")
+    with pool.connection() as conn:
+        assert conn is first
+    assert pool.stats()["opened"] == 1 and pool.stats()["acquired"] == 2
+    pool.close()
+
+
+def test_pool_rolls_back_on_release(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "p.sqlite"), size=1)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t(x)")
+    conn = pool.acquire()
+    conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction
+    pool.release(conn)  # забытая транзакция не достаётся следующему потоку
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close()
+
+
+def test_pool_waits_for_free_connection(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / "p.sqlite"), size=1)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not got and pool.stats()["in_use"] == 2
+    pool.release(held)
+    waiter.join(5)
+    assert got == [held]
+    st = pool.stats()
+    assert st["opened"] == 1 and st["waits"] == 1 and st["wait_ms"] > 0
+    pool.release(got[0])
+    pool.close()
+
+
+def test_run_uses_db_threads():
+    name = asyncio.run(db_async.run(lambda: threading.current_thread().name))
+    assert name.startswith("db")
@@ -0,0 +1,69 @@
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+import http_cache
+from http_cache import Payload
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("GZIP;q=0.5", "gzip"),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=abc", None),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(header, expected):
+    assert http_cache.choose_encoding(header) == expected
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert http_cache.choose_encoding("br, gzip") == "gzip"
+    assert http_cache.choose_encoding("br") is None
+
+
+@pytest.fixture
+def payload():
+    return Payload(b'{"x": 1}' * 100, last_modified=1_700_000_000.5)
+
+
+def not_modified(payload, **headers):
+    return http_cache._not_modified(make_mocked_request("GET", "/", headers=headers), payload)
+
+
+def test_etag_matches_any_encoding(payload):
+    for coding in (None, "gzip", "br"):
+        assert not_modified(payload, **{"If-None-Match": payload.etag_for(coding)})
+    assert not_modified(payload, **{"If-None-Match": f'"other", {payload.etag_for("br")}'})
+    assert not_modified(payload, **{"If-None-Match": "*"})
+    assert not not_modified(payload, **{"If-None-Match": '"other"'})
+
+
+def test_if_none_match_wins_over_if_modified_since(payload):
+    assert not not_modified(payload, **{
+        "If-None-Match": '"other"', "If-Modified-Since": "Tue, 01 Jan 2030 00:00:00 GMT",
+    })
+
+
+def test_if_modified_since(payload):
+    # Last-Modified с точностью до секунды: 1700000000 = Tue, 14 Nov 2023 22:13:20 GMT
+    assert not_modified(payload, **{"If-Modified-Since": "Tue, 14 Nov 2023 22:13:20 GMT"})
+    assert not not_modified(payload, **{"If-Modified-Since": "Tue, 14 Nov 2023 22:13:19 GMT"})
+    assert not not_modified(Payload(b"{}"), **{"If-Modified-Since": "Tue, 01 Jan 2030 00:00:00 GMT"})
+
+
+def test_body_encodings_roundtrip(payload):
+    import gzip
+
+    import brotli
+
+    assert payload.body(None) is payload.raw
+    assert gzip.decompress(payload.body("gzip")) == payload.raw
+    assert brotli.decompress(payload.body("br")) == payload.raw
+    payload.precompress()
+    assert gzip.decompress(payload.body("gzip")) == payload.raw
@@ -0,0 +1,75 @@
+import itertools
+import os
+import sqlite3
+import time
+
+import pytest
+
+from img_cache import DiskCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Время доступа строго растёт — порядок LRU не зависит от разрешения часов."""
+    ticks = itertools.count(1_700_000_000)
+    monkeypatch.setattr(time, "time", lambda: float(next(ticks)))
+
+
+def index_sum(cache):
+    with sqlite3.connect(f"{cache.root}/index.sqlite") as conn:
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+
+def test_put_get(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    entry = cache.put("http://x/a.jpg", b"a" * 10, "image/jpeg")
+    assert cache.get("http://x/a.jpg") == entry
+    assert open(entry.path, "rb").read() == b"a" * 10
+    assert cache.get("http://x/b.jpg") is None
+    # больше бюджета — не кладём
+    assert cache.put("http://x/big.jpg", b"b" * 1001, "image/jpeg") is None
+    assert not list(tmp_path.rglob("*.tmp"))
+    cache.close()
+
+
+def test_lru_eviction(tmp_path, clock):
+    cache = DiskCache(str(tmp_path), max_bytes=250)
+    for name in "abc":
+        cache.put(f"http://x/{name}", b"x" * 100, "image/png")
+    # c не влез: вытеснена самая давно читанная a
+    assert cache.get("http://x/a") is None
+    assert cache.get("http://x/b") and cache.get("http://x/c")
+
+    cache.get("http://x/b")  # b свежее c
+    cache.put("http://x/d", b"x" * 100, "image/png")
+    assert cache.get("http://x/c") is None
+    assert cache.get("http://x/b") and cache.get("http://x/d")
+    assert index_sum(cache) == (2, 200)
+    assert cache.stats() == {"entries": 2, "bytes": 200, "max_bytes": 250}
+    cache.close()
+
+
+def test_memory_index_matches_sqlite(tmp_path):
+    first = DiskCache(str(tmp_path), max_bytes=10_000)
+    first.put("http://x/a", b"1" * 300, "image/png")
+    first.put("http://x/a", b"1" * 100, "image/png")  # перезапись не удваивает размер
+
+    # второй воркер: запись первого видна через lookup (SQLite), не через get (память)
+    second = DiskCache(str(tmp_path), max_bytes=10_000)
+    first.put("http://x/b", b"2" * 50, "image/webp")
+    assert second.get("http://x/b") is None
+    entry = second.lookup("http://x/b")
+    assert entry.size == 50 and entry.content_type == "image/webp"
+    assert second.get("http://x/b") == entry
+
+    for cache in (first, second):
+        assert cache.stats()["entries"] == index_sum(cache)[0] == 2
+        assert cache.stats()["bytes"] == index_sum(cache)[1] == 150
+
+    # файл удалили руками — get() забывает запись, lookup() чистит индекс
+    os.remove(entry.path)
+    assert second.get("http://x/b") is None
+    assert second.lookup("http://x/b") is None
+    assert index_sum(second) == (1, 100) and second.stats()["bytes"] == 100
+    first.close()
+    second.close()
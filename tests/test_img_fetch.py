@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from img_cache import DiskCache
+from img_fetch import ImageFetcher, make_session
+
+SMALL = b"\xff\xd8small-jpeg" * 100
+BIG = bytes(range(256)) * 1000  # 256 000 байт
+
+
+class Upstream:
+    """Локальный «хост картинок»: считает запросы, отвечает с задержкой."""
+
+    def __init__(self):
+        self.hits = {}
+        self.release = asyncio.Event()
+
+    async def handle(self, request):
+        name = request.match_info["name"]
+        self.hits[name] = self.hits.get(name, 0) + 1
+        await self.release.wait()
+        if name == "missing":
+            return web.Response(status=404)
+        body = BIG if name.startswith("big") else SMALL
+        if name.endswith("chunked"):
+            # без Content-Length — размер узнаём только по ходу чтения
+            resp = web.StreamResponse(headers={"Content-Type": "image/jpeg"})
+            await resp.prepare(request)
+            for i in range(0, len(body), 10000):
+                await resp.write(body[i:i + 10000])
+            await resp.write_eof()
+            return resp
+        return web.Response(body=body, content_type="image/jpeg")
+
+
+async def _with_fetcher(tmp_path, scenario, max_object_bytes=100_000):
+    upstream = Upstream()
+    app = web.Application()
+    app.router.add_get("/{name}", upstream.handle)
+    server = TestServer(app)
+    await server.start_server()
+    session = make_session()
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=10_000_000)
+    fetcher = ImageFetcher(session, cache, max_object_bytes=max_object_bytes)
+    try:
+        return await scenario(fetcher, upstream, lambda name: str(server.make_url(f"/{name}")), cache)
+    finally:
+        await session.close()
+        await server.close()
+        cache.close()
+
+
+async def _read(res):
+    try:
+        return b"".join([chunk async for chunk in res.stream.chunks()])
+    finally:
+        res.stream.close()
+
+
+def test_concurrent_fetches_share_one_download(tmp_path):
+    async def scenario(fetcher, upstream, url, cache):
+        tasks = [asyncio.create_task(fetcher.fetch(url("a.jpg"))) for _ in range(10)]
+        await asyncio.sleep(0.1)
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+        assert upstream.hits == {"a.jpg": 1}
+        assert {r.entry.path for r in results} == {results[0].entry.path}
+        with open(results[0].entry.path, "rb") as f:
+            assert f.read() == SMALL
+        assert cache.get(url("a.jpg")).size == len(SMALL)
+        assert (await fetcher.fetch(url("missing"))).status == 404
+
+    asyncio.run(_with_fetcher(tmp_path, scenario))
+
+
+@pytest.mark.parametrize("name", ["big.jpg", "big-chunked"])
+def test_oversized_object_is_relayed_not_cached(tmp_path, name):
+    async def scenario(fetcher, upstream, url, cache):
+        tasks = [asyncio.create_task(fetcher.fetch(url(name))) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+        assert all(r.entry is None and r.stream is not None for r in results)
+        bodies = await asyncio.gather(*[_read(r) for r in results])
+        # одна закачка на всех, без второго GET
+        assert upstream.hits == {name: 1}
+        assert bodies == [BIG] * 3
+        assert cache.get(url(name)) is None
+        assert not list((tmp_path / "cache").rglob("*.tmp"))
+
+    asyncio.run(_with_fetcher(tmp_path, scenario))
+
+
+def test_relay_stops_when_clients_leave(tmp_path):
+    async def scenario(fetcher, upstream, url, cache):
+        upstream.release.set()
+        res = await fetcher.fetch(url("big-chunked"))
+        res.stream.close()
+        await asyncio.sleep(0.1)
+        assert not fetcher._pumps
+        # следующий запрос — новая закачка, а не хвост прерванной
+        res = await fetcher.fetch(url("big-chunked"))
+        assert await _read(res) == BIG
+        assert upstream.hits == {"big-chunked": 2}
+
+    asyncio.run(_with_fetcher(tmp_path, scenario))
+
+
+def test_object_cap_is_bounded_by_cache_budget(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_bytes=1000)
+    try:
+        assert ImageFetcher(None, cache, max_object_bytes=10**9).max_object_bytes == 1000
+    finally:
+        cache.close()
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+import optimize_media
+import thumbs
+
+FILES = {
+    "hero.jpg": {
+        "kind": "image", "width": 1500, "height": 1000,
+        "variants": [
+            {"path": f"optimized/hero.{w}.{fmt}", "width": w, "format": fmt, "type": f"image/{fmt}", "bytes": w}
+            for fmt in ("avif", "webp") for w in (320, 640, 1280)
+        ],
+    },
+    "hero.mp4": {"kind": "video", "variants": [{"path": "optimized/hero.720p.mp4", "type": "video/mp4"}]},
+}
+
+
+@pytest.fixture
+def media(tmp_path):
+    (tmp_path / "optimized").mkdir()
+    (tmp_path / "optimized" / "manifest.json").write_text(json.dumps({"version": 1, "files": FILES}))
+    return optimize_media.MediaIndex(str(tmp_path))
+
+
+@pytest.mark.parametrize("accept, width, expected", [
+    ("image/avif,image/webp,*/*", 0, "optimized/hero.1280.avif"),
+    ("image/webp,*/*", 0, "optimized/hero.1280.webp"),
+    ("image/webp", 500, "optimized/hero.640.webp"),
+    ("image/avif", 640, "optimized/hero.640.avif"),
+    ("image/avif", 4000, "optimized/hero.1280.avif"),
+])
+def test_pick(media, accept, width, expected):
+    assert media.pick("hero.jpg", accept, width)["path"] == expected
+
+
+def test_pick_falls_back_to_original(media):
+    assert media.pick("hero.jpg", "image/jpeg,*/*") is None
+    assert media.pick("hero.jpg", "") is None
+    assert media.pick("other.jpg", "image/webp") is None
+    assert media.pick("hero.mp4", "image/webp") is None
+    assert media.video("hero.mp4")["variants"][0]["type"] == "video/mp4"
+    assert media.video("hero.jpg") is None
+
+
+def test_stale_manifest_is_ignored(tmp_path):
+    (tmp_path / "optimized").mkdir()
+    (tmp_path / "optimized" / "manifest.json").write_text(json.dumps({"version": 0, "files": FILES}))
+    assert optimize_media.MediaIndex(str(tmp_path)).files == {}
+    assert optimize_media.MediaIndex(str(tmp_path / "missing")).files == {}
+
+
+def test_optimize_builds_variants_once(tmp_path):
+    PIL = pytest.importorskip("PIL.Image")
+    PIL.new("RGB", (700, 350), (10, 120, 200)).save(tmp_path / "banner.jpg")
+    (tmp_path / "notes.txt").write_text("не медиа")
+
+    assert optimize_media.optimize(str(tmp_path)) == {"built": 1, "skipped": 0, "failed": 0}
+    entry = optimize_media.MediaIndex(str(tmp_path)).entry("banner.jpg")
+    assert (entry["width"], entry["height"]) == (700, 350)
+    webp = [v for v in entry["variants"] if v["format"] == "webp"]
+    # не шире исходника: 320, 640 и сам исходный размер
+    assert [v["width"] for v in webp] == [320, 640, 700]
+    for v in entry["variants"]:
+        assert (tmp_path / v["path"]).is_file()
+    assert len(entry["variants"]) == 3 * len([f for f in ("avif", "webp") if f in thumbs.FORMATS])
+
+    # повторный запуск без изменений ничего не кодирует; пропавший исходник чистится
+    assert optimize_media.optimize(str(tmp_path)) == {"built": 0, "skipped": 1, "failed": 0}
+    (tmp_path / "banner.jpg").unlink()
+    optimize_media.optimize(str(tmp_path))
+    assert sorted(p.name for p in (tmp_path / "optimized").iterdir()) == ["manifest.json"]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Пустой реестр: метрики теста не смешиваются с метриками магазина."""
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", {})
+    monkeypatch.setattr(metrics, "_mp_dir", None)
+    monkeypatch.setattr(metrics, "_mp_worker", None)
+
+
+def test_text_format(registry):
+    c = metrics.Counter("t_requests_total", "Requests", ("route", "status"))
+    c.inc("/api/x", "200")
+    c.inc("/api/x", "200", amount=2)
+    c.inc('/a"b\\c', "500")
+    g = metrics.Gauge("t_in_flight", "In flight")
+    with g.track():
+        g.inc()
+    h = metrics.Histogram("t_seconds", "Latency", ("op",), buckets=(0.1, 1.0))
+    h.observe(0.05, "get")
+    h.observe(0.5, "get")
+    h.observe(3, "get")
+    metrics.add_collector("x", lambda: [("t_pool_idle", "Idle", {"db": "main"}, 4)])
+    metrics.add_collector("broken", lambda: 1 / 0)
+
+    assert metrics.render().splitlines() == [
+        "# HELP t_requests_total Requests",
+        "# TYPE t_requests_total counter",
+        't_requests_total{route="/a\\"b\\\\c",status="500"} 1',
+        't_requests_total{route="/api/x",status="200"} 3',
+        "# HELP t_in_flight In flight",
+        "# TYPE t_in_flight gauge",
+        "t_in_flight 1",
+        "# HELP t_seconds Latency",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{op="get",le="0.1"} 1',
+        't_seconds_bucket{op="get",le="1"} 2',
+        't_seconds_bucket{op="get",le="+Inf"} 3',
+        't_seconds_sum{op="get"} 3.55',
+        't_seconds_count{op="get"} 3',
+        "# HELP t_pool_idle Idle",
+        "# TYPE t_pool_idle gauge",
+        't_pool_idle{db="main"} 4',
+    ]
+
+
+def test_workers_are_summed(registry, monkeypatch, tmp_path):
+    c = metrics.Counter("t_total", "Total", ("route",))
+    g = metrics.Gauge("t_busy", "Busy")
+    h = metrics.Histogram("t_seconds", "Latency", buckets=(1.0,))
+    metrics.add_collector("pool", lambda: [("t_idle", "Idle", {}, 2)])
+
+    monkeypatch.setattr(metrics, "_mp_dir", str(tmp_path))
+    for worker, n in (("1", 1), ("2", 5)):
+        monkeypatch.setattr(metrics, "_mp_worker", worker)
+        c._values, g._values, h._values = {}, {}, {}
+        c.inc("/img", amount=n)
+        g.set(value=n)
+        h.observe(0.5)
+        metrics.write_snapshot()
+    # файл прошлого запуска / недописанный файл не ломает скрейп
+    (tmp_path / "worker-9.json").write_text("{broken")
+
+    monkeypatch.setattr(metrics, "_mp_worker", "1")
+    c._values, g._values, h._values = {}, {}, {}
+    c.inc("/img", amount=10)  # свежие значения этого воркера важнее его снимка
+    text = metrics.render()
+
+    assert 't_total{route="/img"} 15' in text
+    assert 't_busy{worker="1"} 0' not in text and 't_busy{worker="2"} 5' in text
+    assert 't_seconds_bucket{le="1"} 1' in text and "t_seconds_count 1" in text
+    assert 't_idle{worker="1"} 2' in text and 't_idle{worker="2"} 2' in text
+    assert text.count("# TYPE t_idle gauge") == 1
+    assert json.loads((tmp_path / "worker-1.json").read_text())["metrics"]["t_total"] == [[["/img"], 10.0]]
+
+    metrics.clear_snapshots(str(tmp_path))
+    assert not list(tmp_path.glob("worker-*.json"))
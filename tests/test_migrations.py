@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+
+
+@pytest.fixture
+def legacy_db(fresh_db, monkeypatch):
+    """БД, созданная до миграций: models.sql как есть, user_version = 0."""
+    monkeypatch.setattr(migrations, "_migrated", set())
+    with sqlite3.connect(fresh_db) as conn:
+        with open(migrations.MODELS_SQL, encoding="utf-8") as f:
+            conn.executescript(f.read())
+        conn.execute(
+            "INSERT INTO products(title, category, price, image_url, is_active) VALUES (?,?,?,?,?)",
+            ("Куртка зимняя", "Куртки", 5000, "/images/1.jpg", 1),
+        )
+        conn.execute("INSERT INTO settings(key, value) VALUES ('logo_url', '/images/logo.png')")
+    conn.close()
+    return fresh_db
+
+
+def objects(kind):
+    with db.connect() as conn:
+        return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def test_legacy_db_migrates_to_latest(legacy_db):
+    assert migrations.migrate() == migrations.LATEST_VERSION
+    with db.connect() as conn:
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+        assert {"images_urls", "row_key", "row_hash"} <= migrations._columns(conn, "products")
+        # данные на месте
+        assert conn.execute("SELECT title, price FROM products").fetchall() == [("Куртка зимняя", 5000)]
+    assert db.get_setting("logo_url") == "/images/logo.png"
+    assert {"idx_products_active_cat", "idx_products_active_cat_sub", "idx_products_row_key"} <= objects("index")
+
+
+def test_migrate_is_idempotent(legacy_db):
+    migrations.migrate()
+    migrations._migrated.clear()  # как новый процесс на той же БД
+    assert migrations.migrate() == migrations.LATEST_VERSION
+    with db.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 1
+
+
+def test_missing_search_index_is_rebuilt(legacy_db):
+    migrations.migrate()
+    if "products_fts" not in objects("table"):
+        pytest.skip("SQLite without FTS5")
+    assert [p["title"] for p in db.search_products("зимн")] == ["Куртка зимняя"]
+
+    # v4 прошла на SQLite без FTS5: версия есть, таблицы и триггеров нет
+    with db.connect() as conn:
+        conn.execute("DROP TABLE products_fts")
+        for name in ("products_fts_ai", "products_fts_ad", "products_fts_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    migrations._migrated.clear()
+    migrations.migrate()
+    assert "products_fts" in objects("table")
+    assert [p["title"] for p in db.search_products("ЗИМН")] == ["Куртка зимняя"]
@@ -0,0 +1,66 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import db
+import db_async
+import seed_from_csv
+
+
+def order(user_id, items=None):
+    return dict(
+        user_id=user_id, username=f"u{user_id}", full_name="Имя", phone="+7", address="адрес",
+        comment="", telegram="", total_price=100,
+        items=items if items is not None else [{"product_id": 1, "size": "M", "qty": 1, "price": 100}],
+    )
+
+
+@pytest.fixture
+def writer_db(fresh_db, monkeypatch):
+    seed_from_csv.ensure_schema()
+    calls = []
+    create_orders = db.create_orders
+
+    def spy(orders):
+        calls.append(len(orders))
+        return create_orders(orders)
+
+    monkeypatch.setattr(db, "create_orders", spy)
+    monkeypatch.setattr(db_async, "_writer", None)
+    return calls
+
+
+def stored_users():
+    with db.connect() as conn:
+        return [r[0] for r in conn.execute("SELECT user_id FROM orders ORDER BY id")]
+
+
+def test_concurrent_orders_share_a_commit(writer_db):
+    async def main():
+        return await asyncio.gather(*(db_async.create_order(**order(i)) for i in range(5)))
+
+    ids = asyncio.run(main())
+    assert writer_db == [5]
+    assert len(set(ids)) == 5 and stored_users() == [0, 1, 2, 3, 4]
+    with db.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM order_items").fetchone()[0] == 5
+
+
+def test_bad_order_does_not_sink_the_batch(writer_db):
+    async def main():
+        return await asyncio.gather(
+            db_async.create_order(**order(1)),
+            db_async.create_order(**order(2, items=[{"product_id": None}])),  # NOT NULL
+            db_async.create_order(**order(3)),
+            return_exceptions=True,
+        )
+
+    first, bad, third = asyncio.run(main())
+    assert isinstance(bad, sqlite3.IntegrityError)
+    assert isinstance(first, int) and isinstance(third, int)
+    # пачка откатилась целиком, затем каждый заказ — своей транзакцией
+    assert writer_db == [3, 1, 1, 1]
+    assert stored_users() == [1, 3]
+    with db.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM order_items").fetchone()[0] == 2
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+import outbox
+
+
+@pytest.mark.parametrize("attempts, base", [(0, 2), (1, 2), (2, 4), (5, 32), (10, 600), (100, 600)])
+def test_backoff_grows_with_jitter(attempts, base):
+    delays = [outbox.backoff(attempts) for _ in range(200)]
+    assert all(base * 0.8 <= d <= base * 1.2 for d in delays)
+    assert len(set(delays)) > 1
+
+
+async def _elapsed(limiter, chat_ids):
+    started = time.monotonic()
+    marks = []
+    for chat_id in chat_ids:
+        await limiter.wait(chat_id)
+        marks.append(time.monotonic() - started)
+    return marks
+
+
+def test_rate_limiter_spaces_same_chat():
+    limiter = outbox.RateLimiter(global_rate=1000, chat_interval=0.1)
+    marks = asyncio.run(_elapsed(limiter, [1, 1, 1]))
+    assert marks[0] < 0.05
+    assert marks[1] >= 0.09 and marks[2] >= 0.19
+
+
+def test_rate_limiter_global_rate():
+    limiter = outbox.RateLimiter(global_rate=20, chat_interval=0)
+    marks = asyncio.run(_elapsed(limiter, [1, 2, 3, 4]))
+    assert marks[-1] >= 0.14  # 3 интервала по 50 мс
+
+
+def test_rate_limiter_defer():
+    async def go():
+        limiter = outbox.RateLimiter(global_rate=0, chat_interval=0)
+        limiter.defer(7, 0.1)
+        return await _elapsed(limiter, [8])
+
+    # 429 от Telegram тормозит всю отправку, не только этот чат
+    assert asyncio.run(go())[0] >= 0.09
@@ -0,0 +1,82 @@
+import csv
+
+import pytest
+
+import db
+import seed_from_csv
+
+HEADER = ["title", "category", "subcategory", "price", "image_url", "sizes", "is_active", "description", "sku"]
+
+ROWS = [
+    ["__HERO__", "", "", "0", "/images/intro.mp4", "", "0", "", ""],
+    ["Куртка зимняя", "Куртки", "Зимние", "5000", "/images/1.jpg", "M,L", "1", "Тёплая пуховая куртка", "J-1"],
+    ["Куртка лёгкая", "Куртки", "Лёгкие", "3000", "/images/2.jpg", "S", "1", "", "J-2"],
+    ["Брюки карго", "Брюки", "", "2500", "/images/3.jpg", "30,32", "1", "Ёмкие карманы", ""],
+    ["Брюки классика", "Брюки", "", "2700", "/images/4.jpg", "", "1", "", ""],
+]
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        w.writerows(rows)
+    return str(path)
+
+
+def table():
+    with db.connect() as conn:
+        cur = conn.execute(
+            "SELECT id, row_key, row_hash, title, category, subcategory, price, image_url, images_urls,"
+            " sizes, is_active, description FROM products ORDER BY id"
+        )
+        return [tuple(r) for r in cur.fetchall()]
+
+
+def search(text):
+    return [p["id"] for p in db.search_products(text, limit=50)]
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_diff_summary(fresh_db, tmp_path, bulk):
+    first = write_csv(tmp_path / "a.csv", ROWS)
+    assert seed_from_csv.seed_from_csv(first, clear=False, bulk=bulk) == {
+        "added": 4, "changed": 0, "deactivated": 0, "unchanged": 0,
+    }
+    assert db.get_setting("hero_video_url") == "/images/intro.mp4"  # спецстрока — в settings, не в товары
+    ids_before = {r[1]: r[0] for r in table()}
+
+    rows = [r[:] for r in ROWS]
+    rows[1][3] = "5500"           # изменилась цена
+    del rows[2]                   # пропала из таблицы
+    rows.append(["Шапка", "Аксессуары", "", "900", "/images/5.jpg", "", "1", "", "H-1"])
+    second = write_csv(tmp_path / "b.csv", rows)
+    assert seed_from_csv.seed_from_csv(second, clear=False, bulk=bulk) == {
+        "added": 1, "changed": 1, "deactivated": 1, "unchanged": 2,
+    }
+
+    after = {r[1]: r for r in table()}
+    # id не меняются — корзины в WebApp остаются валидными
+    assert all(after[k][0] == pid for k, pid in ids_before.items())
+    assert after["sku:J-1"][6] == 5500
+    assert after["sku:J-2"][10] == 0
+    assert search("куртка") == [after["sku:J-1"][0]]
+
+    assert seed_from_csv.seed_from_csv(second, clear=False, bulk=bulk) == {
+        "added": 0, "changed": 0, "deactivated": 0, "unchanged": 4,
+    }
+
+
+def test_bulk_and_incremental_agree(tmp_path, monkeypatch):
+    csv_path = write_csv(tmp_path / "a.csv", ROWS)
+    results = {}
+    for bulk in (False, True):
+        path = str(tmp_path / f"bulk-{bulk}.sqlite")
+        monkeypatch.setattr(db, "DB_PATH", path)
+        monkeypatch.setattr(seed_from_csv, "DB_PATH", path)
+        monkeypatch.setattr(db, "_pool", None)
+        seed_from_csv.seed_from_csv(csv_path, clear=False, bulk=bulk)
+        results[bulk] = (table(), search("брюки"), search("емкие"), search("пуховая"), db.get_setting("hero_video_url"))
+        db._pool.close()
+    assert results[False] == results[True]
+    assert len(results[False][1]) == 2 and len(results[False][2]) == 1
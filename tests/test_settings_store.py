@@ -0,0 +1,30 @@
+import pytest
+
+from settings_store import Settings
+
+
+@pytest.mark.parametrize("raw", ["1", "true", "Yes", " ON ", "да", "Да"])
+def test_flag_true(raw):
+    assert Settings("v", {"f": raw}, 0).flag("f") is True
+
+
+@pytest.mark.parametrize("raw", ["0", "false", "No", "off", "нет", "", "  "])
+def test_flag_false(raw):
+    assert Settings("v", {"f": raw}, 0).flag("f", default=True) is False
+
+
+def test_flag_default():
+    s = Settings("v", {"typo": "maybe"}, 0)
+    assert s.flag("missing") is False
+    assert s.flag("missing", default=True) is True
+    # непонятное значение не включает и не выключает фичу
+    assert s.flag("typo", default=True) is True
+    assert s.flag("typo") is False
+
+
+def test_text():
+    s = Settings("v", {"hello": "  Привет  ", "blank": "   "}, 0)
+    assert s.text("hello") == "Привет"
+    assert s.text("blank", "по умолчанию") == "по умолчанию"
+    assert s.text("missing", "x") == "x"
+    assert s.get("blank") == "   "
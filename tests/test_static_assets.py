@@ -0,0 +1,52 @@
+import pytest
+
+import static_assets
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('v1');\n" * 50)
+    (tmp_path / "style.css").write_text("body { color: red }\n")
+    (tmp_path / "fix_csv_links.py").write_text("# не ассет\n")
+    (tmp_path / "index.html").write_text(
+        '<link rel="stylesheet" href="./style.css?v=7">\n'
+        '<script src="/web/app.js?v=7"></script>\n'
+        '<script src="https://telegram.org/js/telegram-web-app.js"></script>\n'
+        '<a href="#top">up</a>\n',
+        encoding="utf-8",
+    )
+    return static_assets.StaticBundle(str(tmp_path))
+
+
+def test_files_get_content_hashes(bundle, tmp_path):
+    js = bundle.urls["app.js"]
+    assert js == "/web/" + static_assets.hashed_name("app.js", (tmp_path / "app.js").read_bytes())
+    assert set(bundle.urls) == {"app.js", "style.css"}
+    assert set(bundle.files[js[len("/web/"):]]._encoded) == {"gzip", "br"}
+
+
+def test_index_points_at_hashed_names(bundle):
+    html = bundle.index.raw.decode("utf-8")
+    assert f'href="{bundle.urls["style.css"]}"' in html
+    assert f'src="{bundle.urls["app.js"]}"' in html
+    # чужие и якорные ссылки не трогаем
+    assert 'src="https://telegram.org/js/telegram-web-app.js"' in html
+    assert 'href="#top"' in html
+    assert "?v=7" not in html
+
+
+def test_lookup_cache_control(bundle):
+    hashed = bundle.urls["app.js"][len("/web/"):]
+    assert bundle.lookup(hashed)[1] == static_assets.IMMUTABLE_CACHE_CONTROL
+    # старое имя и прошлый хэш — текущее тело, но без immutable
+    payload, cache_control = bundle.lookup("app.js")
+    assert payload is bundle.files[hashed] and cache_control == static_assets.FALLBACK_CACHE_CONTROL
+    payload, cache_control = bundle.lookup("app.0123456789.js")
+    assert payload is bundle.files[hashed] and cache_control == static_assets.FALLBACK_CACHE_CONTROL
+    assert bundle.lookup("index.html") is None
+    assert bundle.lookup("fix_csv_links.py") is None
+
+
+def test_no_index(tmp_path):
+    (tmp_path / "app.js").write_text("1")
+    assert static_assets.StaticBundle(str(tmp_path)).index is None
@@ -0,0 +1,81 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import db
+import sync_from_google
+
+CSV = (
+    "title,category,subcategory,price,image_url,sizes,is_active,description\n"
+    "Куртка,Куртки,,5000,/images/1.jpg,M,1,\n"
+    "Брюки,Брюки,,2500,/images/2.jpg,,1,\n"
+).encode("utf-8")
+
+
+class Sheet(BaseHTTPRequestHandler):
+    """Google Sheets в миниатюре: ETag/Last-Modified и 304 на совпадение."""
+
+    body = CSV
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", "Tue, 14 Nov 2023 22:13:20 GMT")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sheet(fresh_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(sync_from_google, "TMP_CSV", tmp_path / "sheet.csv")
+    Sheet.body, Sheet.etag, Sheet.requests = CSV, '"v1"', []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Sheet)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/export.csv"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_imports_and_remembers_sheet(sheet):
+    res = sync_from_google.sync(url=sheet)
+    assert res["skipped"] is False and res["summary"]["added"] == 2
+    assert db.get_setting(sync_from_google.SHEET_ETAG_KEY) == '"v1"'
+    assert db.get_setting(sync_from_google.SHEET_LAST_MODIFIED_KEY) == "Tue, 14 Nov 2023 22:13:20 GMT"
+    assert len(db.get_setting(sync_from_google.SHEET_SHA256_KEY)) == 64
+
+    # вторая попытка — условный запрос и 304, без импорта
+    res = sync_from_google.sync(url=sheet)
+    assert res == {"skipped": True, "reason": "not modified (304)", "bytes": 0, "summary": None}
+    assert Sheet.requests[-1]["If-None-Match"] == '"v1"'
+
+
+def test_sync_skips_same_content_with_new_etag(sheet):
+    sync_from_google.sync(url=sheet)
+    Sheet.etag = '"v2"'
+    res = sync_from_google.sync(url=sheet)
+    assert res["skipped"] is True and res["reason"] == "same sha256"
+
+    Sheet.body = CSV + "Шапка,Аксессуары,,900,/images/3.jpg,,1,\n".encode("utf-8")
+    res = sync_from_google.sync(url=sheet)
+    assert res["summary"]["added"] == 1 and res["summary"]["unchanged"] == 2
+    assert db.get_setting(sync_from_google.SHEET_ETAG_KEY) == '"v2"'
+
+
+def test_sync_settings_are_one_write(sheet):
+    before = db.settings_writes()
+    sync_from_google.sync(url=sheet)
+    # seed_from_csv коммитит catalog_version, синк — sha256/etag/last_modified одной транзакцией
+    assert db.settings_writes() - before == 2
@@ -0,0 +1,56 @@
+import pytest
+
+import thumbs
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+@pytest.mark.parametrize("w, expected", [
+    (1, 160), (160, 160), (161, 320), (480, 480), (700, 960), (1280, 1280), (5000, 1280),
+])
+def test_bucket_width(w, expected):
+    assert thumbs.bucket_width(w) == expected
+
+
+@pytest.mark.parametrize("fmt, accept, expected", [
+    ("auto", "image/avif,image/webp,*/*", "webp"),
+    ("auto", "image/jpeg,*/*", "jpeg"),
+    (None, None, "jpeg"),
+    ("jpg", "image/webp", "jpeg"),
+    ("WEBP", "", "webp"),
+    # AVIF на лету не кодируем — как auto
+    ("avif", "image/avif,image/webp", "webp"),
+    ("gif", "", "jpeg"),
+])
+def test_pick_format(fmt, accept, expected):
+    assert thumbs.pick_format(fmt, accept) == expected
+
+
+def test_variant_key_differs_from_original():
+    url = "https://cdn.example/a.jpg"
+    keys = {url} | {thumbs.variant_key(url, w, f) for w in (160, 320) for f in ("webp", "jpeg")}
+    assert len(keys) == 5
+
+
+@pytest.mark.parametrize("fmt, mime", [("webp", "image/webp"), ("jpeg", "image/jpeg")])
+def test_render_variant(tmp_path, fmt, mime):
+    src, dst = tmp_path / "src.png", tmp_path / "dst"
+    PIL.new("RGBA", (1000, 500), (200, 10, 10, 128)).save(src)
+    assert thumbs.render_variant(str(src), str(dst), 320, fmt) == mime
+    with PIL.open(dst) as im:
+        assert im.format == thumbs.FORMATS[fmt][0]
+        assert im.size == (320, 160)
+
+
+def test_render_variant_never_upscales(tmp_path):
+    src, dst = tmp_path / "src.jpg", tmp_path / "dst"
+    PIL.new("RGB", (100, 80)).save(src)
+    assert thumbs.render_variant(str(src), str(dst), 640, "webp") == "image/webp"
+    with PIL.open(dst) as im:
+        assert im.size == (100, 80)
+
+
+def test_render_variant_rejects_non_image(tmp_path):
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"<html>not found</html>")
+    assert thumbs.render_variant(str(src), str(tmp_path / "dst"), 320, "webp") is None
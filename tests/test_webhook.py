@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+import metrics
+import webhook
+
+
+@pytest.mark.parametrize("secret", ["a", "Abc_123-xyz", "x" * 256])
+def test_valid_secret(secret):
+    assert webhook.valid_secret(secret)
+
+
+@pytest.mark.parametrize("secret", ["", None, "x" * 257, "with space", "секрет", "a:b", "abc\n"])
+def test_invalid_secret(secret):
+    assert not webhook.valid_secret(secret)
+
+
+def test_bad_secret_rejected():
+    with pytest.raises(ValueError):
+        webhook.UpdateQueue(None, None, "not valid!")
+
+
+@pytest.mark.parametrize("headers", [{}, {webhook.SECRET_HEADER: "wrong"}, {webhook.SECRET_HEADER: "секрет"}])
+def test_wrong_secret_is_401(headers):
+    async def go():
+        q = webhook.UpdateQueue(None, None, "right_secret")
+        return await q.handle(make_mocked_request("POST", "/telegram/webhook", headers=headers))
+
+    before = metrics.WEBHOOK_UPDATES.state().get(("unauthorized",), 0)
+    resp = asyncio.run(go())
+    assert resp.status == 401
+    assert metrics.WEBHOOK_UPDATES.state()[("unauthorized",)] == before + 1
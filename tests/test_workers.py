@@ -0,0 +1,78 @@
+import os
+import os.path as op
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+ROOT = op.dirname(op.dirname(op.abspath(__file__)))
+
+SERVICE = textwrap.dedent("""
+    import os
+    import pathlib
+    import sys
+
+    import workers
+
+    OUT = pathlib.Path(os.environ["TEST_OUT"])
+
+
+    async def main():
+        index = os.environ["WEB_WORKER_INDEX"]
+        first = not list(OUT.glob(f"run-{index}-*"))
+        (OUT / f"run-{index}-{os.getpid()}").touch()
+        if index == "0" and first:
+            (OUT / f"crashed-{index}-{os.getpid()}").touch()
+            os._exit(3)  # падение воркера — супервизор должен поднять новый
+        await workers.wait_for_signal()
+        (OUT / f"stopped-{index}-{os.getpid()}").touch()
+
+
+    if __name__ == "__main__":
+        workers.RESTART_DELAY = 0.1
+        sys.exit(workers.supervise(main, 2))
+""")
+
+
+def wait_for(predicate, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="POSIX signals")
+def test_supervisor_restarts_crashed_worker_and_stops_on_sigterm(tmp_path):
+    out, metrics_dir = tmp_path / "out", tmp_path / "metrics"
+    out.mkdir()
+    metrics_dir.mkdir()
+    (metrics_dir / "worker-7.json").write_text("{}")  # снимок прошлого запуска
+    (tmp_path / "service.py").write_text(SERVICE)
+    env = dict(
+        os.environ, TEST_OUT=str(out), METRICS_DIR=str(metrics_dir),
+        PYTHONPATH=os.pathsep.join([ROOT, str(tmp_path)]),
+    )
+    proc = subprocess.Popen([sys.executable, op.join(tmp_path, "service.py")], env=env)
+    try:
+        runs = lambda i: sorted(p.name for p in out.glob(f"run-{i}-*"))  # noqa: E731
+        assert wait_for(lambda: len(runs(0)) == 2 and len(runs(1)) == 1), (runs(0), runs(1))
+        assert not (metrics_dir / "worker-7.json").exists()
+        time.sleep(0.3)  # воркеры дошли до wait_for_signal
+
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(30) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    # упавший воркер заменён, оба живых остановлены мягко (SIGTERM → wait_for_signal)
+    crashed = {p.name.replace("crashed", "run") for p in out.glob("crashed-*")}
+    assert len(crashed) == 1
+    alive = set(runs(0) + runs(1)) - crashed
+    assert {p.name for p in out.glob("stopped-*")} == {name.replace("run", "stopped") for name in alive}
@@ -0,0 +1,107 @@
+"""
+Уменьшенные копии картинок для карточек (/img?u=...&w=480&fmt=webp).
+
+Ширины округляются вверх до корзин WIDTH_BUCKETS, чтобы вариантов было немного
+и они хорошо кэшировались. Кодирование идёт в ProcessPoolExecutor (Pillow держит GIL
+и на мегабайтных фото занимает сотни миллисекунд), результат кладётся в DiskCache.
+Без Pillow /img просто отдаёт оригинал.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps  # опционально
+except Exception:
+    Image = ImageOps = None
+
+try:
+    import pillow_avif  # noqa: F401  опционально: регистрирует AVIF в Pillow
+except Exception:
+    pillow_avif = None
+
+WIDTH_BUCKETS = (160, 320, 480, 640, 960, 1280)
+IMG_WORKERS = int(os.getenv("IMG_WORKERS", "2"))
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+# AVIF кодируется на порядок медленнее — только для офлайн-оптимизации (optimize_media.py)
+if pillow_avif is not None:
+    FORMATS["avif"] = ("AVIF", "image/avif")
+# что /img кодирует на лету (pick_format): без AVIF
+ONLINE_FORMATS = ("webp", "jpeg")
+
+_SAVE_OPTIONS = {
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "webp": {"quality": 80, "method": 4},
+    "avif": {"quality": 55, "speed": 6},
+}
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def bucket_width(w: int) -> int:
+    for b in WIDTH_BUCKETS:
+        if w <= b:
+            return b
+    return WIDTH_BUCKETS[-1]
+
+
+def pick_format(fmt: str, accept: str) -> str:
+    """fmt=webp|jpeg|auto; auto (и неизвестный/офлайновый, например avif) — webp, если он есть в Accept."""
+    fmt = (fmt or "auto").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt in ONLINE_FORMATS:
+        return fmt
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+
+def variant_key(url: str, width: int, fmt: str) -> str:
+    """Ключ варианта в DiskCache (рядом с ключом оригинала)."""
+    return f"{url}#w={width}&fmt={fmt}"
+
+
+def make_pool() -> ProcessPoolExecutor:
+    # spawn: пул создаётся из процесса с потоками (executor, aiohttp), fork там небезопасен
+    return ProcessPoolExecutor(
+        max_workers=IMG_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def render_variant(src: str, dst: str, width: int, fmt: str) -> Optional[str]:
+    """
+    Выполняется в процессе пула: читает src, ужимает до width по ширине
+    (не увеличивая) и пишет в dst. Возвращает Content-Type или None, если src не картинка.
+    """
+    pil_format, content_type = FORMATS[fmt]
+    try:
+        im = Image.open(src)
+    except Exception:
+        return None
+
+    with im:
+        im.draft("RGB", (width, width * 4))  # JPEG: декодируем сразу в меньшем масштабе
+        im = ImageOps.exif_transpose(im)
+        if im.width > width:
+            height = max(1, round(im.height * width / im.width))
+            im = im.resize((width, height), Image.LANCZOS)
+
+        if fmt == "jpeg":
+            if im.mode in ("RGBA", "LA", "P"):
+                im = im.convert("RGBA")
+                bg = Image.new("RGB", im.size, (255, 255, 255))
+                bg.paste(im, mask=im.getchannel("A"))
+                im = bg
+            elif im.mode != "RGB":
+                im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() or im.mode == "P" else "RGB")
+        im.save(dst, pil_format, **_SAVE_OPTIONS[fmt])
+    return content_type
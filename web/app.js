@@ -87,6 +87,27 @@ function initApp() {
     return u;
   }
 
+  // ✅ превью для карточек: сервер ужимает до корзины ширины и кодирует в webp (/img?w=..)
+  const THUMB_WIDTHS = [320, 480, 640, 960, 1280];
+
+  // /img принимает только http(s) и /images/ — остальное (относительные пути, data:) как есть
+  const proxyable = (src) => /^https?:\/\//i.test(src) || src.startsWith("/images/");
+
+  function thumbUrl(src, w){
+    if (!src) return "";
+    if (!proxyable(src)) return src;
+    const u = new URL(`${API}/img`, location.origin);
+    u.searchParams.set("u", src);
+    u.searchParams.set("w", String(w));
+    u.searchParams.set("fmt", "auto");
+    return u.pathname + u.search;
+  }
+
+  function thumbSrcset(src){
+    if (!src || !proxyable(src)) return "";
+    return THUMB_WIDTHS.map(w => `${thumbUrl(src, w)} ${w}w`).join(", ");
+  }
+
   function normalizeVideoUrl(u){
     if(!u) return "";
     u = String(u).trim();
@@ -117,9 +138,26 @@ function initApp() {
 
   const loadCategories = () => getJSON(`${API}/api/categories`);
 
-  const loadProducts = (c) => {
+  // список — страницами и только поля карточки; описание — по /api/product/{id}
+  const PAGE_SIZE = 24;
+  const CARD_FIELDS = "id,title,category,price,image_url,images_urls,sizes_text,has_description";
+
+  const loadProducts = (c, cursor) => {
     const u = new URL(`${API}/api/products`, location.origin);
     if (c) u.searchParams.set("category", c);
+    u.searchParams.set("limit", PAGE_SIZE);
+    u.searchParams.set("fields", CARD_FIELDS);
+    if (cursor) u.searchParams.set("cursor", cursor);
+    return getJSON(u.toString());
+  };
+
+  const loadProduct = (id) => getJSON(`${API}/api/product/${encodeURIComponent(id)}`);
+
+  // ✅ первый экран одним запросом: config + категории + первая страница товаров
+  const loadBootstrap = () => {
+    const u = new URL(`${API}/api/bootstrap`, location.origin);
+    u.searchParams.set("limit", PAGE_SIZE);
+    u.searchParams.set("fields", CARD_FIELDS);
     return getJSON(u.toString());
   };
 
@@ -198,6 +236,7 @@ function initApp() {
       <div class="row"><label>Комментарий</label><textarea id="comment" rows="2" placeholder="Например: размер L, цвет черный"></textarea></div>
       <div class="row"><label>Telegram (для связи)</label><input id="tguser" placeholder="@username"/></div>
       <div class="row"><b>Сумма:</b><b>${money(total)}</b></div>
+      <div id="orderError" class="row form-error" hidden></div>
       <button id="submitOrder" class="btn primary">Отправить</button>
     `);
 
@@ -226,18 +265,59 @@ function initApp() {
         items: state.cart.map(it=>({ product_id: it.id, size: it.size, qty: it.qty }))
       };
 
+      const errEl = $("#orderError");
+      if (errEl) errEl.hidden = true;
+      submit.disabled = true;
+      submit.textContent = "Отправляем…";
+
       try { tg?.sendData?.(JSON.stringify(payload)); } catch {}
+      const res = await postOrder(payload);
+
+      if (!res.ok) {
+        // заказ не принят (лимит / перегрузка / сеть) — не делаем вид, что всё хорошо
+        submit.disabled = false;
+        submit.textContent = "Отправить ещё раз";
+        if (errEl) {
+          errEl.textContent = res.retryAfter
+            ? `Сервер перегружен, заказ не отправлен. Попробуйте через ${res.retryAfter} с.`
+            : "Не удалось отправить заказ. Проверьте связь и попробуйте ещё раз.";
+          errEl.hidden = false;
+        }
+        tg?.HapticFeedback?.notificationOccurred?.("error");
+        return;
+      }
+
+      tg?.HapticFeedback?.notificationOccurred?.("success");
+      closeSheet();
+    };
+  }
+
+  // ✅ 429/503 с Retry-After (admission.py) — ждём и повторяем сами, пока ожидание короткое
+  const ORDER_RETRIES = 2;
+  const ORDER_MAX_WAIT_SEC = 10;
+
+  async function postOrder(payload){
+    for (let attempt = 0; ; attempt++) {
+      let r;
       try {
-        await fetch(`${API}/api/order`, {
+        r = await fetch(`${API}/api/order`, {
           method: "POST",
           headers: {"Content-Type":"application/json"},
           body: JSON.stringify(payload)
         });
-      } catch {}
+      } catch {
+        return { ok: false };
+      }
+      if (r.ok) return { ok: true };
 
-      tg?.HapticFeedback?.notificationOccurred?.("success");
-      closeSheet();
-    };
+      const retryAfter = Number(r.headers.get("Retry-After")) || 0;
+      const busy = r.status === 429 || r.status === 503;
+      if (!busy) return { ok: false };
+      if (attempt >= ORDER_RETRIES || retryAfter > ORDER_MAX_WAIT_SEC) {
+        return { ok: false, retryAfter: Math.max(1, retryAfter) };
+      }
+      await new Promise(done => setTimeout(done, Math.max(1, retryAfter) * 1000));
+    }
   }
 
   // ✅ ВСПОМОГАТЕЛЬНОЕ: попытки автозапуска видео (Telegram iOS)
@@ -282,7 +362,7 @@ function initApp() {
   }
 
   // ===== render home (видео/лого) =====
-  function renderHome(logoUrl, videoUrl) {
+  function renderHome(logoUrl, videoUrl, posterUrl) {
     if (!heroEl) return;
 
     const hasVideo = !!(videoUrl && String(videoUrl).trim());
@@ -300,7 +380,7 @@ function initApp() {
 
     if (hasVideo) {
       const src = normalizeVideoUrl(videoUrl);
-      const poster = hasLogo ? normalizeImageUrl(logoUrl) : "";
+      const poster = posterUrl || (hasLogo ? normalizeImageUrl(logoUrl) : "");
 
       // ✅ КЛЮЧЕВОЕ: autoplay + muted + playsinline + preload="auto"
       box.innerHTML = `
@@ -373,138 +453,208 @@ function initApp() {
     return album;
   }
 
+  let drawToken = 0;
+  let moreObserver = null;
+
   async function drawProducts(){
     if (!productsEl) return;
+    const token = ++drawToken;   // смена категории отменяет догрузку старой
+    moreObserver?.disconnect();
     productsEl.innerHTML = "";
-    const items = await loadProducts(state.category || "");
-
-    items.forEach(p=>{
-      let sizes=[];
-      if(p.sizes_text) sizes = String(p.sizes_text).split(",").map(s=>s.trim()).filter(Boolean);
-      else if((p.category||"").toLowerCase().includes("обув")) sizes = SHOES_SIZES;
-      else sizes = CLOTHES_SIZES;
-
-      const desc = (p.description || "").trim();
-
-      const album = buildAlbum(p);
-      const hasGallery = album.length > 0;
-
-      const galleryHtml = hasGallery ? `
-        <div class="thumb">
-          <div class="gallery" data-images-count="${album.length}">
-            <div class="gallery-track" style="transform: translateX(0);">
-              ${album.map((src)=>`
-                <div class="gallery-slide">
-                  <img
-                    src="${src}"
-                    alt="${esc(p.title)}"
-                    loading="lazy"
-                    referrerpolicy="no-referrer"
-                    data-album="${esc(album.join("|"))}"
-                  />
-                </div>
-              `).join("")}
-            </div>
+    await drawPage(token, null);
+  }
 
-            ${album.length > 1 ? `
-              <div class="gallery-dots">
-                ${album.map((_,i)=>`<span class="gallery-dot ${i===0?'active':''}"></span>`).join("")}
-              </div>
-            ` : ``}
-          </div>
-        </div>
-      ` : ``;
+  async function drawPage(token, cursor){
+    const page = await loadProducts(state.category || "", cursor);
+    if (token !== drawToken) return;
+    showPage(token, page);
+  }
+
+  function showPage(token, page){
+    page.items.forEach(appendProduct);
+    if (page.next_cursor) watchMore(token, page.next_cursor);
+  }
 
-      const card = document.createElement("div");
-      card.className = "card";
-      card.innerHTML = `
-        ${galleryHtml}
+  // первая страница уже пришла в /api/bootstrap — рисуем без запроса
+  function drawFirstPage(page){
+    if (!productsEl || !page) return;
+    const token = ++drawToken;
+    moreObserver?.disconnect();
+    productsEl.innerHTML = "";
+    showPage(token, page);
+  }
 
-        <div class="title">${esc(p.title)}</div>
-        <div class="price">${money(p.price)}</div>
-        ${desc ? `<div class="desc">${esc(desc)}</div>` : ``}
+  // следующая страница — когда «Показать ещё» подъезжает к экрану (или по нажатию)
+  function watchMore(token, cursor){
+    const more = document.createElement("button");
+    more.className = "btn ghost";
+    more.textContent = "Показать ещё";
+    productsEl.appendChild(more);
+
+    let started = false;
+    const next = () => {
+      if (started) return;
+      started = true;
+      moreObserver?.disconnect();
+      more.remove();
+      drawPage(token, cursor).catch(()=>{});
+    };
+    more.onclick = next;
+    if ("IntersectionObserver" in window) {
+      moreObserver = new IntersectionObserver(es => {
+        if (es.some(e => e.isIntersecting)) next();
+      }, { rootMargin: "600px" });
+      moreObserver.observe(more);
+    }
+  }
 
-        <select id="size-${p.id}">
-          ${sizes.map(s=>`<option value="${esc(s)}">${esc(s)}</option>`).join("")}
-        </select>
+  function appendProduct(p){
+    let sizes=[];
+    if(p.sizes_text) sizes = String(p.sizes_text).split(",").map(s=>s.trim()).filter(Boolean);
+    else if((p.category||"").toLowerCase().includes("обув")) sizes = SHOES_SIZES;
+    else sizes = CLOTHES_SIZES;
+
+    const album = buildAlbum(p);
+    const hasGallery = album.length > 0;
+
+    const galleryHtml = hasGallery ? `
+      <div class="thumb">
+        <div class="gallery" data-images-count="${album.length}">
+          <div class="gallery-track" style="transform: translateX(0);">
+            ${album.map((src)=>`
+              <div class="gallery-slide">
+                <img
+                  src="${esc(thumbUrl(src, 640))}"
+                  srcset="${esc(thumbSrcset(src))}"
+                  sizes="(min-width: 700px) 640px, calc(100vw - 60px)"
+                  alt="${esc(p.title)}"
+                  loading="lazy"
+                  referrerpolicy="no-referrer"
+                  data-album="${esc(album.join("|"))}"
+                />
+              </div>
+            `).join("")}
+          </div>
 
-        <button class="btn primary" id="btn-${p.id}">В корзину</button>
-      `;
-      productsEl.appendChild(card);
-
-      const gallery = card.querySelector(".gallery");
-      if (gallery) {
-        const track = gallery.querySelector(".gallery-track");
-        const dotsWrap = gallery.querySelector(".gallery-dots");
-        const dots = dotsWrap ? Array.from(dotsWrap.querySelectorAll(".gallery-dot")) : [];
-        const count = Number(gallery.dataset.imagesCount || 0);
-
-        let gIdx = 0;
-        const setIdx = (n, animate=true) => {
-          if (!track || count <= 0) return;
-          gIdx = Math.max(0, Math.min(n, count - 1));
-          track.style.transition = animate ? "transform .22s ease" : "none";
-          track.style.transform = `translateX(${-gIdx * 100}%)`;
-          if (dots.length) dots.forEach((d,i)=>d.classList.toggle("active", i===gIdx));
-        };
+          ${album.length > 1 ? `
+            <div class="gallery-dots">
+              ${album.map((_,i)=>`<span class="gallery-dot ${i===0?'active':''}"></span>`).join("")}
+            </div>
+          ` : ``}
+        </div>
+      </div>
+    ` : ``;
+
+    const card = document.createElement("div");
+    card.className = "card";
+    card.innerHTML = `
+      ${galleryHtml}
+
+      <div class="title">${esc(p.title)}</div>
+      <div class="price">${money(p.price)}</div>
+      ${p.has_description ? `
+        <button class="btn ghost" id="more-${p.id}">Описание</button>
+        <div class="desc" id="desc-${p.id}" hidden></div>
+      ` : ``}
+
+      <select id="size-${p.id}">
+        ${sizes.map(s=>`<option value="${esc(s)}">${esc(s)}</option>`).join("")}
+      </select>
+
+      <button class="btn primary" id="btn-${p.id}">В корзину</button>
+    `;
+    productsEl.appendChild(card);
+
+    const gallery = card.querySelector(".gallery");
+    if (gallery) {
+      const track = gallery.querySelector(".gallery-track");
+      const dotsWrap = gallery.querySelector(".gallery-dots");
+      const dots = dotsWrap ? Array.from(dotsWrap.querySelectorAll(".gallery-dot")) : [];
+      const count = Number(gallery.dataset.imagesCount || 0);
+
+      let gIdx = 0;
+      const setIdx = (n, animate=true) => {
+        if (!track || count <= 0) return;
+        gIdx = Math.max(0, Math.min(n, count - 1));
+        track.style.transition = animate ? "transform .22s ease" : "none";
+        track.style.transform = `translateX(${-gIdx * 100}%)`;
+        if (dots.length) dots.forEach((d,i)=>d.classList.toggle("active", i===gIdx));
+      };
 
-        let startX = 0, startY = 0, dx = 0, dragging = false;
-
-        gallery.addEventListener("touchstart", (e) => {
-          if (count <= 1) return;
-          const t = e.touches[0];
-          startX = t.clientX;
-          startY = t.clientY;
-          dx = 0;
-          dragging = true;
-          if (track) track.style.transition = "none";
-        }, {passive:true});
-
-        gallery.addEventListener("touchmove", (e) => {
-          if (!dragging || count <= 1 || !track) return;
-          const t = e.touches[0];
-          const moveX = t.clientX - startX;
-          const moveY = t.clientY - startY;
-          if (Math.abs(moveY) > Math.abs(moveX)) return;
-
-          dx = moveX;
-          track.style.transform = `translateX(calc(${-gIdx * 100}% + ${dx}px))`;
-        }, {passive:true});
-
-        gallery.addEventListener("touchend", () => {
-          if (!dragging || count <= 1) return;
-          dragging = false;
-
-          const threshold = 40;
-          if (dx > threshold && gIdx > 0) setIdx(gIdx - 1);
-          else if (dx < -threshold && gIdx < count - 1) setIdx(gIdx + 1);
-          else setIdx(gIdx);
-        });
+      let startX = 0, startY = 0, dx = 0, dragging = false;
+
+      gallery.addEventListener("touchstart", (e) => {
+        if (count <= 1) return;
+        const t = e.touches[0];
+        startX = t.clientX;
+        startY = t.clientY;
+        dx = 0;
+        dragging = true;
+        if (track) track.style.transition = "none";
+      }, {passive:true});
+
+      gallery.addEventListener("touchmove", (e) => {
+        if (!dragging || count <= 1 || !track) return;
+        const t = e.touches[0];
+        const moveX = t.clientX - startX;
+        const moveY = t.clientY - startY;
+        if (Math.abs(moveY) > Math.abs(moveX)) return;
+
+        dx = moveX;
+        track.style.transform = `translateX(calc(${-gIdx * 100}% + ${dx}px))`;
+      }, {passive:true});
+
+      gallery.addEventListener("touchend", () => {
+        if (!dragging || count <= 1) return;
+        dragging = false;
+
+        const threshold = 40;
+        if (dx > threshold && gIdx > 0) setIdx(gIdx - 1);
+        else if (dx < -threshold && gIdx < count - 1) setIdx(gIdx + 1);
+        else setIdx(gIdx);
+      });
+
+      gallery.querySelectorAll("img").forEach(img=>{
+        img.onerror = () => {
+          const th = img.closest(".thumb");
+          if (th) th.style.display = "none";
+        };
+      });
+    }
 
-        gallery.querySelectorAll("img").forEach(img=>{
-          img.onerror = () => {
-            const th = img.closest(".thumb");
-            if (th) th.style.display = "none";
-          };
-        });
-      }
+    const btn = $("#btn-" + p.id);
+    if (btn) {
+      btn.onclick = () => {
+        const sel = $("#size-" + p.id);
+        const size = sel ? sel.value : "";
 
-      const btn = $("#btn-" + p.id);
-      if (btn) {
-        btn.onclick = () => {
-          const sel = $("#size-" + p.id);
-          const size = sel ? sel.value : "";
+        const key = `${p.id}:${size || ""}`;
+        const f = state.cart.find(it => it.key === key);
+        if (f) f.qty += 1;
+        else state.cart.push({ key, id:p.id, title:p.title, price:p.price, size, qty:1 });
 
-          const key = `${p.id}:${size || ""}`;
-          const f = state.cart.find(it => it.key === key);
-          if (f) f.qty += 1;
-          else state.cart.push({ key, id:p.id, title:p.title, price:p.price, size, qty:1 });
+        updateCartBadge();
+        tg?.HapticFeedback?.impactOccurred?.("medium");
+      };
+    }
 
-          updateCartBadge();
-          tg?.HapticFeedback?.impactOccurred?.("medium");
-        };
-      }
-    });
+    // описание в списке не приходит — карточку товара дочитываем по нажатию
+    const moreBtn = $("#more-" + p.id);
+    if (moreBtn) {
+      moreBtn.onclick = async () => {
+        const el = $("#desc-" + p.id);
+        if (!el) return;
+        if (!el.hidden) { el.hidden = true; return; }
+        if (!el.dataset.loaded) {
+          try {
+            const full = await loadProduct(p.id);
+            el.textContent = (full.description || "").trim() || "Описания пока нет.";
+            el.dataset.loaded = "1";
+          } catch { return; }
+        }
+        el.hidden = false;
+      };
+    }
   }
 
   // ====== FIX: Telegram iOS кнопки не нажимаются ======
@@ -521,22 +671,33 @@ function initApp() {
   bindTap(cartBtn, () => openCart());
   bindTap(checkoutBtn, () => openCheckout());
 
+  function renderConfig(cfg){
+    if (cfg?.title) {
+      if (titleEl) titleEl.textContent = cfg.title;
+      document.title = cfg.title;
+      if (subtitleEl) subtitleEl.textContent = "";
+    }
+    renderHome(cfg?.logo_url || "", cfg?.video_url || "", cfg?.video_poster || "");
+  }
+
   // ===== init =====
   (async()=>{
-    try {
-      const cfg = await loadConfig();
-      if (cfg?.title) {
-        if (titleEl) titleEl.textContent = cfg.title;
-        document.title = cfg.title;
-        if (subtitleEl) subtitleEl.textContent = "";
-      }
-      renderHome(cfg?.logo_url || "", cfg?.video_url || "");
-    } catch {}
+    let boot = null;
+    try { boot = await loadBootstrap(); } catch {}
+
+    if (boot) {
+      try { renderConfig(boot.config); } catch {}
+      try { renderCategories(boot.categories || []); } catch {}
+      try { drawFirstPage(boot.products); } catch {}
+    } else {
+      // старый сервер / ошибка — по отдельности, как раньше
+      try { renderConfig(await loadConfig()); } catch {}
 
-    try {
-      const cats = await loadCategories();
-      renderCategories(cats);
-    } catch {}
+      try {
+        const cats = await loadCategories();
+        renderCategories(cats);
+      } catch {}
+    }
 
     updateCartBadge();
   })();
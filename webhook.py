@@ -0,0 +1,111 @@
+"""
+Webhook-режим бота: апдейты Telegram приходят POST'ом в то же aiohttp-приложение (build_app).
+
+Подлинность — заголовок X-Telegram-Bot-Api-Secret-Token (тот же secret_token, что
+передан в setWebhook). Принятый апдейт кладётся в ограниченную очередь
+(WEBHOOK_QUEUE_SIZE) и сразу получает 200 — Telegram не ждёт наших запросов к БД.
+Обрабатывают очередь WEBHOOK_CONCURRENCY задач через dp.feed_update. Очередь полна —
+503 + Retry-After: Telegram повторит доставку сам, память процесса не растёт.
+
+Проверить локально без Telegram — POST записанного апдейта:
+    curl -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -H "Content-Type: application/json" \
+         -d @update.json http://localhost:8080/telegram/webhook
+"""
+import asyncio
+import hmac
+import logging
+import os
+import re
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from aiohttp import web
+
+import metrics
+
+WEBHOOK_PATH        = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_QUEUE_SIZE  = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "16"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+RETRY_AFTER_SEC = 5
+DRAIN_TIMEOUT_SEC = 10.0
+
+# требования Telegram к secret_token
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def valid_secret(secret: str) -> bool:
+    return bool(_SECRET_RE.fullmatch(secret or ""))
+
+
+class UpdateQueue:
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str,
+                 maxsize: int = WEBHOOK_QUEUE_SIZE, concurrency: int = WEBHOOK_CONCURRENCY):
+        if not valid_secret(secret):
+            raise ValueError("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self._secret_bytes = secret.encode()
+        self.concurrency = max(1, concurrency)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+        self._workers = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # байты, а не str: compare_digest падает с TypeError на не-ASCII заголовке
+        got = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if not hmac.compare_digest(got, self._secret_bytes):
+            metrics.WEBHOOK_UPDATES.inc("unauthorized")
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception:
+            metrics.WEBHOOK_UPDATES.inc("bad_request")
+            return web.Response(status=400, text="bad update")
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            metrics.WEBHOOK_UPDATES.inc("rejected")
+            logging.warning("webhook queue full (%d), update %s rejected", self.queue.maxsize, update.update_id)
+            return web.Response(status=503, text="busy", headers={"Retry-After": str(RETRY_AFTER_SEC)})
+        metrics.WEBHOOK_UPDATES.inc("queued")
+        return web.json_response({})
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self.queue.get()
+            try:
+                with metrics.WEBHOOK_HANDLE.time():
+                    result = await self.dp.feed_update(self.bot, update)
+                # хэндлер может вернуть метод API вместо вызова — выполняем, как это делает polling
+                if isinstance(result, TelegramMethod):
+                    await self.bot(result)
+            except Exception as e:
+                logging.exception("webhook update %s failed: %s", update.update_id, e)
+            finally:
+                self.queue.task_done()
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT_SEC) -> None:
+        """Дообрабатывает принятые апдейты (им уже ответили 200) и останавливает задачи."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("webhook: %d updates left unprocessed on shutdown", self.queue.qsize())
+        for t in self._workers:
+            t.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def ctx(self, app: web.Application):
+        """Для app.cleanup_ctx: задачи живут вместе с приложением."""
+        self.start()
+        yield
+        await self.stop()
+
+    def samples(self):
+        return [("telegram_webhook_queue_depth", "Updates waiting in the webhook queue", {}, self.queue.qsize())]
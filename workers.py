@@ -0,0 +1,137 @@
+"""
+Запуск витрины: один процесс или N воркеров на одном порту.
+
+serve() поднимает aiohttp-приложение и живёт до SIGTERM/SIGINT; по сигналу перестаёт
+принимать соединения и даёт запросам в работе до SHUTDOWN_TIMEOUT секунд закончиться
+(деплой на Railway не обрывает оформление заказа на середине).
+
+supervise() запускает WEB_WORKERS процессов (spawn), каждый слушает тот же порт
+с SO_REUSEPORT — ядро само раскидывает входящие соединения. Общего состояния
+в памяти у воркеров нет: каталог, настройки, заказы и outbox — в SQLite (снимки
+перечитываются по catalog_version / settings_version), кэш /img — на диске.
+Упавший воркер перезапускается; SIGTERM родителю — мягкая остановка всех.
+Метрики воркеров складываются через файлы в METRICS_DIR (см. metrics.py) — любой
+воркер отдаёт на /metrics сумму по всем.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+from multiprocessing.connection import wait as wait_sentinels
+from typing import Callable
+
+from aiohttp import web
+
+import metrics
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "15"))
+
+RESTART_DELAY = 1.0
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+async def wait_for_signal() -> None:
+    """Ждёт SIGTERM/SIGINT (на Windows и не в главном потоке — только отмену задачи)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stop.wait()
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
+
+
+async def serve(app: web.Application, host: str, port: int, reuse_port: bool = False) -> None:
+    """Отдаёт app до сигнала, затем мягко останавливается."""
+    runner = web.AppRunner(app, shutdown_timeout=SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port, reuse_port=reuse_port or None).start()
+        logging.info("Web server started on port %s (pid %d)", port, os.getpid())
+        await wait_for_signal()
+        logging.info("Web server %d: draining in-flight requests (up to %.0fs)", os.getpid(), SHUTDOWN_TIMEOUT)
+    finally:
+        await runner.cleanup()
+
+
+def _worker_main(target: Callable, index: int) -> None:
+    os.environ["WEB_WORKER_INDEX"] = str(index)
+    metrics.enable_multiprocess(os.environ["METRICS_DIR"], str(index))
+    try:
+        asyncio.run(target())
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise(target: Callable, workers: int = WEB_WORKERS) -> int:
+    """
+    Держит workers процессов с target() (async-функция верхнего уровня модуля).
+    Возвращает код выхода: 0 — остановлены сигналом.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    stopping = False
+
+    # общий каталог снимков метрик; воркеры (spawn) получают его через окружение
+    metrics_dir = os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="shop-metrics-"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    metrics.clear_snapshots(metrics_dir)
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        if not stopping:
+            logging.info("Supervisor: got signal %d, stopping %d workers", signum, len(procs))
+        stopping = True
+        for p in procs.values():
+            if p.is_alive():
+                p.terminate()  # SIGTERM → serve() дорабатывает текущие запросы
+
+    def start(index: int):
+        p = ctx.Process(target=_worker_main, args=(target, index), name=f"web-{index}", daemon=False)
+        p.start()
+        logging.info("Supervisor: worker %d started (pid %d)", index, p.pid)
+        return p
+
+    procs = {}
+    old_handlers = {sig: signal.signal(sig, on_signal) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        for i in range(workers):
+            procs[i] = start(i)
+
+        while not stopping:
+            by_sentinel = {p.sentinel: i for i, p in procs.items()}
+            for sentinel in wait_sentinels(list(by_sentinel), timeout=1.0):
+                i = by_sentinel[sentinel]
+                p = procs[i]
+                p.join()
+                if stopping:
+                    break
+                logging.warning("Supervisor: worker %d (pid %d) exited with %s, restarting", i, p.pid, p.exitcode)
+                time.sleep(RESTART_DELAY)
+                procs[i] = start(i)
+
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+        for p in procs.values():
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                logging.warning("Supervisor: worker pid %d did not stop in time, killing", p.pid)
+                p.kill()
+                p.join()
+        return 0
+    finally:
+        for sig, handler in old_handlers.items():
+            signal.signal(sig, handler)